@@ -1,3 +1,96 @@
+from datetime import date
+
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.papers.models import Bookmark, Category, Citation, Paper, PaperCategory, Rating
+
+
+class ListQueryCountTests(TestCase):
+    """Each list page costs the same number of queries however many rows it holds."""
+
+    # ETag aggregate, count, page (with the rating and citation annotations)
+    # and categories; bookmarks and ratings fetch their papers in one more
+    PAPER_QUERIES = 4
+    NESTED_PAPER_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com', password='x')
+        cls.category = Category.objects.create(name='Machine Learning')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_papers(self, count):
+        start = Paper.objects.count()
+        papers = []
+        for i in range(start, start + count):
+            paper = Paper.objects.create(
+                title=f'Paper {i}', abstract='Abstract', authors='A. Author',
+                publication_date=date(2024, 1, 1), uploaded_by=self.user, is_approved=True,
+            )
+            PaperCategory.objects.create(paper=paper, category=self.category)
+            Bookmark.objects.create(user=self.user, paper=paper)
+            Rating.objects.create(user=self.user, paper=paper, rating=4)
+            if papers:
+                Citation.objects.create(citing_paper=paper, cited_paper=papers[-1])
+            papers.append(paper)
+
+    def assertConstantQueries(self, url_name, queries):
+        for rows in (5, 20):
+            self.add_papers(rows - Paper.objects.count())
+            with self.assertNumQueries(queries):
+                response = self.client.get(reverse(url_name), {'page_size': 50})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), rows)
+
+    def test_paper_list(self):
+        self.assertConstantQueries('api-paper-list', self.PAPER_QUERIES)
+
+    def test_bookmark_list(self):
+        self.assertConstantQueries('api-bookmark-list', self.NESTED_PAPER_QUERIES)
+
+    def test_rating_list(self):
+        self.assertConstantQueries('api-rating-list', self.NESTED_PAPER_QUERIES)
+
+    def test_if_none_match_returns_304(self):
+        self.add_papers(3)
+        url = reverse('api-paper-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag)
+
+        with self.assertNumQueries(1):  # the ETag aggregate; nothing is loaded or serialized
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.add_papers(1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_rating_change_changes_the_etag(self):
+        self.add_papers(2)
+        url = reverse('api-paper-list')
+        etag = self.client.get(url)['ETag']
+        Rating.objects.filter(user=self.user).update(rating=2)  # update() sends no signal
+        Rating.objects.get(paper__title='Paper 0').save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['average_rating'] for row in response.data['results']}, {2.0})
 
-# Create your tests here.
+    def test_annotated_counts_match_the_model(self):
+        self.add_papers(3)
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        paper = Paper.objects.get(title='Paper 1')
+        Rating.objects.create(user=other, paper=paper, rating=1)
+        Citation.objects.create(citing_paper=Paper.objects.get(title='Paper 0'), cited_paper=paper)
+        results = self.client.get(reverse('api-paper-list'))
+        row = next(row for row in results.data['results'] if row['id'] == paper.pk)
+        self.assertEqual(row['average_rating'], paper.average_rating)
+        self.assertEqual(row['citation_count'], paper.citation_count)
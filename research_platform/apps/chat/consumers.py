@@ -1,13 +1,28 @@
 import json
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.utils import timezone
-from .models import ChatRoom, ChatMessage
+from .models import ChatMessage, ChatRoom
+from .fanout import RoomBroadcaster, member_group
+from .persistence import writer
+from .retrieval import answer, bot_reply, indexes
+from .rooms import can_join
+from .utils import ais_offensive
+
+# One per process: batches are cut across every consumer of a room in this worker
+broadcaster = RoomBroadcaster()
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
+        self.room_id = int(self.scope['url_route']['kwargs']['room_id'])
+        # Auth and membership are settled once here; receive() never touches the DB
+        user = self.scope['user']
+        if not await can_join(self.room_id, user):
+            await self.close()
+            return
+        self.user_id = user.pk
+        self.username = user.username
+        self.room_group_name = member_group(self.room_id, self.channel_name)
         
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -16,60 +31,82 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
     
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        await writer.flush()
     
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
         message = text_data_json['message']
-        user = self.scope['user']
-        
-        # Save message to database
-        await self.save_message(self.room_id, user, message)
+        if await ais_offensive(message):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Message flagged as offensive'
+            }))
+            return
+        timestamp = timezone.now()
         
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        # Broadcast first; the message is saved by the write-behind buffer
+        self.save_message(self.user_id, message, timestamp)
+        await broadcaster.send(
+            self.channel_layer,
+            self.room_id,
             {
                 'type': 'chat_message',
                 'message': message,
-                'user': user.username,
-                'timestamp': timezone.now().isoformat()
+                'user': self.username,
+                'timestamp': timestamp.isoformat()
             }
         )
         
         # Generate bot response if needed
         if message.startswith('@bot'):
-            bot_response = await self.generate_bot_response(message, self.room_id)
-            await self.save_message(self.room_id, None, bot_response, is_bot=True)
+            bot_response = await self.generate_bot_response(message)
+            timestamp = timezone.now()
+            self.save_message(None, bot_response, timestamp, is_bot=True)
             
-            await self.channel_layer.group_send(
-                self.room_group_name,
+            await broadcaster.send(
+                self.channel_layer,
+                self.room_id,
                 {
                     'type': 'chat_message',
                     'message': bot_response,
                     'user': 'Research Bot',
-                    'timestamp': timezone.now().isoformat(),
+                    'timestamp': timestamp.isoformat(),
                     'is_bot': True
                 }
             )
     
     async def chat_message(self, event):
         await self.send(text_data=json.dumps(event))
+
+    async def chat_batch(self, event):
+        # Clients still get one frame per message
+        for message in event['events']:
+            await self.chat_message(message)
     
-    @database_sync_to_async
-    def save_message(self, room_id, user, message, is_bot=False):
-        room = ChatRoom.objects.get(id=room_id)
-        return ChatMessage.objects.create(
-            room=room,
-            user=user,
+    def save_message(self, user_id, message, timestamp, is_bot=False):
+        writer.add(ChatMessage(
+            room_id=self.room_id,
+            user_id=user_id,
             message=message,
+            timestamp=timestamp,
             is_bot_message=is_bot
-        )
+        ))
     
-    @database_sync_to_async
-    def generate_bot_response(self, message, room_id):
-        # Simple bot response - can be enhanced with AI
-        return f"I received your message: {message[4:]}. This is a simple bot response."
+    async def generate_bot_response(self, message):
+        if not hasattr(self, 'paper_id'):
+            # Looked up on the room's first question only; group rooms have no paper
+            self.paper_id = await ChatRoom.objects.filter(pk=self.room_id).values_list(
+                'paper_id', flat=True
+            ).afirst()
+        question = message[len('@bot'):]
+        index = indexes.get(self.paper_id) if self.paper_id else None
+        if self.paper_id is None or (index is not None and index.encoder.inline):
+            # A loaded TF-IDF index answers in well under a millisecond
+            return answer(question, index)
+        return await sync_to_async(bot_reply)(self.paper_id, question)
@@ -0,0 +1,75 @@
+# apps/chat/fanout.py
+import asyncio
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+
+
+def room_groups(room_id, shards=None):
+    """Channel-layer groups that together make up a room.
+
+    With CHAT_GROUP_SHARDS > 1 a room is split across several groups, which
+    the Redis layers hash to different hosts, so one busy room doesn't pin a
+    single Redis instance.
+    """
+    shards = shards or settings.CHAT_GROUP_SHARDS
+    if shards <= 1:
+        return [f'chat_{room_id}']
+    return [f'chat_{room_id}_{shard}' for shard in range(shards)]
+
+
+def member_group(room_id, channel_name, shards=None):
+    """The single shard group a connection joins."""
+    groups = room_groups(room_id, shards)
+    return groups[zlib.crc32(channel_name.encode()) % len(groups)]
+
+
+class RoomBroadcaster:
+    """Sends room events to every shard, optionally coalescing them into batches.
+
+    With a batch window, events for a room are buffered for up to ``window_ms``
+    (or ``max_messages``) and delivered as one ``chat.batch`` event, cutting
+    channel-layer traffic for busy rooms. Order is preserved per room.
+    """
+
+    def __init__(self, window_ms=None, max_messages=None, shards=None):
+        self.window = (settings.CHAT_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000.0
+        self.max_messages = max_messages or settings.CHAT_BATCH_MAX_MESSAGES
+        self.shards = shards
+        self._pending = defaultdict(list)
+        self._timers = {}
+        self._locks = defaultdict(asyncio.Lock)
+
+    async def send(self, layer, room_id, event):
+        if not self.window:
+            return await self._send_now(layer, room_id, event)
+        pending = self._pending[room_id]
+        pending.append(event)
+        if len(pending) >= self.max_messages:
+            await self.flush(layer, room_id)
+        elif room_id not in self._timers:
+            self._timers[room_id] = asyncio.create_task(self._flush_later(layer, room_id))
+
+    async def _flush_later(self, layer, room_id):
+        await asyncio.sleep(self.window)
+        self._timers.pop(room_id, None)
+        await self.flush(layer, room_id)
+
+    async def flush(self, layer, room_id):
+        timer = self._timers.pop(room_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        # The lock is FIFO, so batches leave in the order they were cut
+        async with self._locks[room_id]:
+            events = self._pending.pop(room_id, [])
+            if events:
+                batch = events[0] if len(events) == 1 else {'type': 'chat.batch', 'events': events}
+                await self._send_now(layer, room_id, batch)
+
+    async def flush_all(self, layer):
+        for room_id in list(self._pending):
+            await self.flush(layer, room_id)
+
+    async def _send_now(self, layer, room_id, event):
+        await asyncio.gather(*(layer.group_send(group, event) for group in room_groups(room_id, self.shards)))
@@ -0,0 +1,50 @@
+# apps/chat/history.py
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ChatMessage
+
+
+def encode_cursor(message):
+    """Cursor pointing just before ``message``: ``<UTC ISO timestamp>,<id>`` (URL-safe)."""
+    timestamp = message.timestamp.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return f"{timestamp},{message.pk}"
+
+
+def parse_cursor(cursor):
+    """Parse a ``before`` cursor into ``(timestamp, id)``; raises ValueError if malformed."""
+    timestamp, _, pk = cursor.rpartition(',')
+    timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp, int(pk)
+
+
+def history_page(room, before=None, limit=None):
+    """One page of a room's history, oldest first, ending just before ``before``.
+
+    Seeks on the (room, timestamp, id) index and reads at most ``limit + 1``
+    rows, so the cost doesn't grow with the age of the room. Returns
+    ``(messages, next_cursor)``; ``next_cursor`` is None once there is nothing older.
+    """
+    limit = max(1, min(limit or settings.CHAT_HISTORY_PAGE_SIZE, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+    messages = ChatMessage.objects.filter(room=room).select_related('user')
+    if before is not None:
+        timestamp, pk = before
+        messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+    page = list(messages.order_by('-timestamp', '-pk')[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return list(reversed(page[:limit])), next_cursor
+
+
+def serialize_message(message):
+    return {
+        'id': message.pk,
+        'username': 'Research Bot' if message.is_bot_message else message.user.username if message.user else '',
+        'message': message.message,
+        'is_bot': message.is_bot_message,
+        'timestamp': message.timestamp.isoformat(),
+        'display_time': message.timestamp.strftime('%b %d, %H:%M'),
+    }
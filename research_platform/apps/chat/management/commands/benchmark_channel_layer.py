@@ -0,0 +1,138 @@
+import asyncio
+import multiprocessing
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from apps.chat.fanout import RoomBroadcaster, member_group
+from apps.chat.testing import CHANNEL_LAYER_BACKENDS, fake_redis_server
+
+
+def make_layer(backend, url):
+    return import_string(CHANNEL_LAYER_BACKENDS[backend])(hosts=[url])
+
+
+def room_of(worker, client, clients, rooms):
+    return (worker * clients + client) % rooms
+
+
+def receiver_process(url, backend, worker, clients, rooms, shards, expected, timeout, ready, results):
+    """One ASGI-worker stand-in: ``clients`` sockets spread over the rooms."""
+    async def run():
+        layer = make_layer(backend, url)
+        channels = []
+        for client in range(clients):
+            channel = await layer.new_channel()
+            room = room_of(worker, client, clients, rooms)
+            await layer.group_add(member_group(room, channel, shards), channel)
+            channels.append((channel, expected[room]))
+
+        received = [0] * len(channels)
+
+        async def drain(index, channel, want):
+            while received[index] < want:
+                event = await layer.receive(channel)
+                received[index] += len(event['events']) if event['type'] == 'chat.batch' else 1
+
+        await asyncio.get_running_loop().run_in_executor(None, ready.wait)
+        complete = True
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(drain(i, channel, want) for i, (channel, want) in enumerate(channels))),
+                timeout=timeout,
+            )
+        except Exception:
+            # Timed out: the layer dropped messages (e.g. RedisChannelLayer over capacity)
+            complete = False
+        results.put((worker, sum(received), complete, time.time()))
+        if hasattr(layer, 'flush'):
+            await layer.flush()
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Measure chat fan-out through a Redis channel layer across N worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Receiving processes')
+        parser.add_argument('--clients', type=int, default=50, help='Sockets per worker')
+        parser.add_argument('--rooms', type=int, default=4)
+        parser.add_argument('--messages', type=int, default=1000, help='Messages sent in total')
+        parser.add_argument('--senders', type=int, default=8, help='Concurrent sending tasks')
+        parser.add_argument('--backend', choices=sorted(CHANNEL_LAYER_BACKENDS), default='pubsub')
+        parser.add_argument('--shards', type=int, default=1, help='Groups per room')
+        parser.add_argument('--batch-window-ms', type=float, default=0)
+        parser.add_argument('--batch-max', type=int, default=50)
+        parser.add_argument('--redis-url', help='Use this Redis instead of the in-process stand-in')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for deliveries')
+
+    def handle(self, *args, **options):
+        if options['redis_url']:
+            self.benchmark(options['redis_url'], options)
+        else:
+            with fake_redis_server() as url:
+                self.benchmark(url, options)
+
+    def benchmark(self, url, options):
+        workers, clients, rooms = options['workers'], options['clients'], options['rooms']
+        per_room = Counter(i % rooms for i in range(options['messages']))
+        expected = [per_room[room] for room in range(rooms)]
+        context = multiprocessing.get_context('spawn')
+        ready, results = context.Barrier(workers + 1), context.Queue()
+        processes = [
+            context.Process(target=receiver_process, args=(
+                url, options['backend'], worker, clients, rooms, options['shards'], expected, options['timeout'],
+                ready, results,
+            ))
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        ready.wait()
+        started = time.time()
+        sent_at = asyncio.run(self.send(url, options))
+        outcomes = [results.get(timeout=options['timeout'] + 60) for _ in processes]
+        for process in processes:
+            process.join()
+
+        delivered = sum(count for _, count, _, _ in outcomes)
+        wanted = sum(expected[room_of(w, c, clients, rooms)] for w in range(workers) for c in range(clients))
+        elapsed = max(finished for _, _, _, finished in outcomes) - started
+        self.stdout.write(
+            f"{options['backend']}: {workers} workers x {clients} sockets, {rooms} rooms, "
+            f"{options['shards']} shard(s), batch window {options['batch_window_ms']}ms"
+        )
+        self.stdout.write(f"  sent {options['messages']} messages in {sent_at - started:.2f}s")
+        if not all(complete for _, _, complete, _ in outcomes):
+            self.stdout.write(self.style.ERROR(
+                f'  only {delivered} of {wanted} messages delivered within {options["timeout"]:.0f}s '
+                f'({wanted - delivered} dropped or late)'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'  delivered {delivered} messages in {elapsed:.2f}s: {delivered / elapsed:,.0f} messages/s'
+        ))
+
+    async def send(self, url, options):
+        layer = make_layer(options['backend'], url)
+        broadcaster = RoomBroadcaster(
+            window_ms=options['batch_window_ms'], max_messages=options['batch_max'], shards=options['shards']
+        )
+        senders = max(1, options['senders'])
+
+        async def sender(offset):
+            for i in range(offset, options['messages'], senders):
+                await broadcaster.send(layer, i % options['rooms'], {
+                    'type': 'chat_message', 'message': f'message {i}', 'user': 'bench', 'timestamp': time.time(),
+                })
+
+        await asyncio.gather(*(sender(offset) for offset in range(senders)))
+        await broadcaster.flush_all(layer)
+        finished = time.time()
+        if hasattr(layer, 'flush'):
+            await layer.flush()
+        return finished
@@ -0,0 +1,75 @@
+import multiprocessing
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+SAMPLE_MESSAGES = [
+    "I think section 3 is unclear", "can someone explain eq 4?", "nice work on the ablation",
+    "the model uses attention over citation graphs", "what a stupid idea", "get lost loser",
+    "the results table looks off", "does the baseline use the same tokenizer",
+]
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(name, batch_sizes, rounds, results):
+    """Runs in a fresh interpreter, so startup and RSS cover only this runtime."""
+    import django
+    django.setup()
+    from apps.chat import utils
+
+    try:
+        baseline = rss_mb()
+        started = time.perf_counter()
+        runtime = utils.load_runtime(name)
+        utils.predict_probabilities(SAMPLE_MESSAGES[:1], runtime=runtime)  # includes nltk warm-up
+        row = {'startup': time.perf_counter() - started, 'rss': rss_mb() - baseline}
+        for size in batch_sizes:
+            batch = (SAMPLE_MESSAGES * (size // len(SAMPLE_MESSAGES) + 1))[:size]
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                utils.predict_probabilities(batch, runtime=runtime)
+                timings.append(time.perf_counter() - started)
+            row[size] = statistics.median(timings)
+        results.put((name, row))
+    except Exception as e:
+        results.put((name, f'{type(e).__name__}: {e}'))
+
+
+class Command(BaseCommand):
+    help = 'Compare startup time, RSS and batch latency of the Keras and ONNX moderation runtimes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runtimes', nargs='+', default=['keras', 'onnx'], choices=['keras', 'onnx'])
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32])
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        rows = {}
+        for name in options['runtimes']:
+            process = context.Process(target=measure, args=(name, options['batch_sizes'], options['rounds'], results))
+            process.start()
+            key, row = results.get()
+            process.join()
+            rows[key] = row
+        if all(isinstance(row, str) for row in rows.values()):
+            raise CommandError('; '.join(f'{name}: {row}' for name, row in rows.items()))
+
+        self.stdout.write(f"{'runtime':<8} {'startup':>8} {'RSS':>8}"
+                          + ''.join(f"{f'batch {size}':>12}" for size in options['batch_sizes']))
+        for name, row in rows.items():
+            if isinstance(row, str):
+                self.stdout.write(f'{name:<8} unavailable ({row})')
+                continue
+            self.stdout.write(f"{name:<8} {row['startup']:>7.2f}s {row['rss']:>6.0f}MB"
+                              + ''.join(f'{row[size] * 1000:>10.2f}ms' for size in options['batch_sizes']))
@@ -0,0 +1,67 @@
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chat.retrieval import PaperIndex, indexes
+from apps.papers.models import Paper
+from apps.papers.utils import get_pdf_text_record
+
+SAMPLE_QUESTIONS = [
+    "what dataset did they use", "how does the model compare to the baseline",
+    "what are the limitations", "how was the evaluation done", "what is the main contribution",
+]
+
+
+class Command(BaseCommand):
+    help = ('Build the @bot passage index of approved papers ahead of their first question, '
+            'and report index size and search latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paper_ids', nargs='*', type=int, help='Default: every approved paper')
+        parser.add_argument('--extract', action='store_true',
+                            help='Extract PDFs whose text is not stored yet (otherwise they are skipped)')
+        parser.add_argument('--rebuild', action='store_true', help='Replace existing indexes')
+
+    def handle(self, *args, **options):
+        papers = Paper.objects.filter(is_approved=True).order_by('pk')
+        if options['paper_ids']:
+            papers = papers.filter(pk__in=options['paper_ids'])
+        if not papers.exists():
+            raise CommandError('No approved papers to index')
+
+        built = skipped = 0
+        build_times, search_times, sizes = [], [], []
+        for paper in papers.iterator():
+            path = indexes.path(paper.pk)
+            if os.path.exists(path) and not options['rebuild']:
+                skipped += 1
+                continue
+            record = get_pdf_text_record(paper, extract=options['extract'])
+            if record is None and paper.pdf_path:
+                self.stdout.write(f'Paper {paper.pk}: PDF text not extracted yet, skipped')
+                skipped += 1
+                continue
+
+            started = time.perf_counter()
+            index = PaperIndex.build(paper, record)
+            index.save(path)
+            build_times.append(time.perf_counter() - started)
+            sizes.append(os.path.getsize(path))
+            for question in SAMPLE_QUESTIONS:
+                started = time.perf_counter()
+                index.search(question)
+                search_times.append(time.perf_counter() - started)
+            built += 1
+            self.stdout.write(f'Paper {paper.pk}: {len(index.passages)} passages, '
+                              f'{sizes[-1] / 1024:.0f}KB, {build_times[-1] * 1000:.0f}ms')
+
+        if not built:
+            self.stdout.write(self.style.SUCCESS(f'Nothing to build ({skipped} skipped)'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {built} indexes ({skipped} skipped): median build {statistics.median(build_times) * 1000:.0f}ms, '
+            f'median size {statistics.median(sizes) / 1024:.0f}KB, '
+            f'median search {statistics.median(search_times) * 1000:.2f}ms'
+        ))
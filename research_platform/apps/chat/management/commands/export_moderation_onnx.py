@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chat import utils
+from apps.chat.models import ChatMessage
+
+PARITY_SAMPLES = [
+    "thanks for sharing", "I love this paper", "you are amazing", "please help me",
+    "random unknown words", "what a stupid idea", "I hate you", "nobody cares about your opinion",
+    "can someone explain equation 4?", "the results table looks off", "get lost loser",
+]
+
+
+class Command(BaseCommand):
+    help = ('Export the hate-speech model to ONNX with dynamic int8 quantization, plus the tokenizer '
+            'vocabulary, and check the export against the Keras model (needs tensorflow, tf2onnx '
+            'and onnxruntime)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--opset', type=int, default=17)
+        parser.add_argument('--sample', help='Text file of messages for the parity check '
+                                             '(default: stored chat messages plus a few canned ones)')
+        parser.add_argument('--limit', type=int, default=2000, help='Messages in the parity check')
+        parser.add_argument('--min-agreement', type=float, default=0.99,
+                            help='Fail when fewer predictions than this agree with Keras')
+
+    def handle(self, *args, **options):
+        try:
+            import tensorflow as tf
+            import tf2onnx
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:
+            raise CommandError(f'Exporting needs tensorflow, tf2onnx and onnxruntime: {e}')
+
+        keras = utils.KerasRuntime()
+        # Written next to the live files and swapped in only once parity passes,
+        # so a bad export never replaces a working one
+        model_path, vocab_path = str(settings.MODERATION_ONNX_PATH), str(settings.MODERATION_VOCAB_PATH)
+        staged_model, staged_vocab = model_path + '.new', vocab_path + '.new'
+        try:
+            self.export_vocab(keras.tokenizer, staged_vocab)
+            with tempfile.TemporaryDirectory() as tmp:
+                fp32_path = os.path.join(tmp, 'model.onnx')
+                spec = (tf.TensorSpec((None, utils.MAX_LEN), tf.int32, name='input_ids'),)
+                tf2onnx.convert.from_keras(keras.model, input_signature=spec, opset=options['opset'],
+                                           output_path=fp32_path)
+                # Weights to int8 ahead of time, activations quantized per batch at run time
+                quantize_dynamic(fp32_path, staged_model, weight_type=QuantType.QInt8)
+                fp32_size = os.path.getsize(fp32_path)
+            self.stdout.write(f'Exported {fp32_size / 1e6:.1f}MB float32 -> '
+                              f'{os.path.getsize(staged_model) / 1e6:.1f}MB int8')
+
+            self.check_parity(keras, utils.OnnxRuntime(staged_model, staged_vocab),
+                              self.parity_messages(options), options['min_agreement'])
+            os.replace(staged_vocab, vocab_path)
+            os.replace(staged_model, model_path)
+        finally:
+            for path in (staged_model, staged_vocab):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {model_path} and {vocab_path}'))
+
+    def export_vocab(self, tokenizer, path):
+        """The keras Tokenizer as JSON; only ids it would actually emit are kept."""
+        word_index = {word: index for word, index in tokenizer.word_index.items()
+                      if not tokenizer.num_words or index < tokenizer.num_words}
+        if tokenizer.oov_token is not None or tokenizer.char_level:
+            raise CommandError('Only word-level tokenizers without an OOV token can be exported')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'filters': tokenizer.filters, 'split': tokenizer.split, 'lower': tokenizer.lower,
+                       'word_index': word_index}, f)
+        self.stdout.write(f'Vocabulary: {len(word_index)} words')
+
+    def parity_messages(self, options):
+        if options['sample']:
+            with open(options['sample'], encoding='utf-8') as f:
+                messages = [line.strip() for line in f if line.strip()]
+        else:
+            messages = PARITY_SAMPLES + list(
+                ChatMessage.objects.filter(is_bot_message=False)
+                .order_by('-timestamp').values_list('message', flat=True)[:options['limit']]
+            )
+        return messages[:options['limit']]
+
+    def check_parity(self, keras, onnx, messages, min_agreement):
+        import numpy as np
+
+        expected, actual = [], []
+        for start in range(0, len(messages), 256):
+            batch = messages[start:start + 256]
+            expected.append(utils.predict_probabilities(batch, runtime=keras))
+            actual.append(utils.predict_probabilities(batch, runtime=onnx))
+        expected, actual = np.concatenate(expected), np.concatenate(actual)
+        agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+        self.stdout.write(
+            f'Parity on {len(messages)} messages: {agreement:.2%} same class, '
+            f'max probability difference {float(np.abs(expected - actual).max()):.4f}'
+        )
+        if agreement < min_agreement:
+            raise CommandError(f'int8 model agrees with Keras on {agreement:.2%} of messages '
+                               f'(< {min_agreement:.2%}); nothing was replaced')
+        return agreement
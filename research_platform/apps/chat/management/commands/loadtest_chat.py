@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import resource
+import tempfile
+import time
+from collections import deque
+from contextlib import ExitStack
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from apps.chat.testing import fake_redis_server, redis_channel_layers
+
+MARKER = re.compile(r'lt (\d+) (\d+) (\d+\.\d+)')
+BOT_QUESTION = 'what dataset did they use'
+PAPER_ABSTRACT = ('We evaluate a transformer model on three benchmark datasets and compare it with '
+                  'a recurrent baseline. The model improves accuracy while using fewer parameters, '
+                  'and an ablation shows which components matter most.')
+
+
+def memory_mb():
+    """Current and peak resident set size of this process, in MB."""
+    rss = peak = 0.0
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) / 1024
+            elif line.startswith('VmHWM:'):
+                peak = int(line.split()[1]) / 1024
+    return rss, peak
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else float('nan')
+
+
+class Command(BaseCommand):
+    help = ('Load-test ChatConsumer in-process: many simulated websocket clients over many rooms, '
+            'reporting delivery latency, throughput and CPU/RSS. Runs on a throwaway test database. '
+            'The in-memory channel layer scans every channel on each send, so use --fake-redis '
+            'for runs past a few hundred clients.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--rate', type=float, default=0.2, help='Messages per second per client')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of sending')
+        parser.add_argument('--bot-fraction', type=float, default=0.05, help='Share of messages starting with @bot')
+        parser.add_argument('--connect-concurrency', type=int, default=200)
+        parser.add_argument('--drain-timeout', type=float, default=30,
+                            help='Seconds to wait for outstanding deliveries after sending stops')
+        parser.add_argument('--fake-redis', action='store_true',
+                            help='Use the Redis pub/sub layer against an in-process fake Redis '
+                                 'instead of the in-memory layer')
+        parser.add_argument('--batch-window-ms', type=float, help='Override CHAT_BATCH_WINDOW_MS')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with ExitStack() as stack:
+                # Bot indexes of the throwaway papers must not touch the real ones
+                overrides = {'CHAT_BOT_INDEX_DIR': stack.enter_context(tempfile.TemporaryDirectory())}
+                if options['fake_redis']:
+                    overrides['CHANNEL_LAYERS'] = redis_channel_layers(stack.enter_context(fake_redis_server()))
+                if options['batch_window_ms'] is not None:
+                    overrides['CHAT_BATCH_WINDOW_MS'] = options['batch_window_ms']
+                stack.enter_context(override_settings(**overrides))
+                self.run_load(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_load(self, options):
+        from channels.layers import channel_layers
+
+        from apps.accounts.models import User
+        from apps.chat import consumers
+        from apps.chat.fanout import RoomBroadcaster
+        from apps.chat.models import ChatMessage, ChatRoom
+        from apps.chat.retrieval import bot_reply
+        from apps.chat.utils import warmup
+        from apps.papers.models import Paper
+
+        channel_layers.backends.clear()  # pick up the overridden CHANNEL_LAYERS
+        consumers.broadcaster = RoomBroadcaster()
+        warmup()  # the moderation model's one-off load shouldn't count as latency
+
+        users = User.objects.bulk_create([
+            User(username=f'loadtest{i}', email=f'loadtest{i}@example.com', password='!')
+            for i in range(options['clients'])
+        ])
+        # Paper rooms, so @bot questions go through retrieval as they do in production
+        papers = Paper.objects.bulk_create([
+            Paper(title=f'Load test paper {i}', abstract=PAPER_ABSTRACT, authors='Load Test',
+                  publication_date=date(2024, 1, 1), uploaded_by=users[0], is_approved=True)
+            for i in range(options['rooms'])
+        ])
+        rooms = ChatRoom.objects.bulk_create([ChatRoom(paper=paper, created_by=users[0]) for paper in papers])
+        for paper in papers:
+            bot_reply(paper.pk, BOT_QUESTION, paper)  # index built ahead, like build_bot_indexes
+        self.stdout.write(f"{options['clients']} clients in {len(rooms)} rooms, "
+                          f"{options['rate']} msg/s each for {options['duration']:.0f}s "
+                          f"({options['bot_fraction']:.0%} @bot), layer "
+                          f"{settings.CHANNEL_LAYERS['default']['BACKEND'].rsplit('.', 1)[-1]}")
+
+        stats = asyncio.run(self.simulate(users, rooms, options))
+        stats['saved'] = ChatMessage.objects.count()
+        self.report(stats)
+
+    async def simulate(self, users, rooms, options):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+
+        from apps.chat.persistence import writer
+        from apps.chat.routing import websocket_urlpatterns
+
+        application = URLRouter(websocket_urlpatterns)
+        rng = random.Random(options['seed'])
+        room_of = [rooms[i % len(rooms)].pk for i in range(len(users))]
+        room_size = {room.pk: room_of.count(room.pk) for room in rooms}
+        stats = {'user_latency': [], 'bot_latency': [], 'sent': 0, 'bot_sent': 0, 'expected': 0,
+                 'delivered': 0, 'rejected': 0, 'clients': len(users)}
+        all_delivered = asyncio.Event()
+
+        async def connect(i, gate):
+            async with gate:
+                communicator = WebsocketCommunicator(application, f'/ws/chat/{room_of[i]}/')
+                communicator.scope['user'] = users[i]
+                connected, _ = await communicator.connect()
+                return communicator if connected else None
+
+        async def drain(communicator):
+            # Bot replies carry no marker: each is paired with the oldest @bot question this
+            # client has seen and not yet had answered. A room's frames reach every member in
+            # the same order, so this only blurs latency when two questions overlap.
+            questions = deque()
+            # Read the queue directly: receive_output() cancels the app on timeout
+            while True:
+                event = await communicator.output_queue.get()
+                if event['type'] != 'websocket.send':
+                    continue
+                frame = json.loads(event['text'])
+                if frame.get('is_bot'):
+                    if not questions:
+                        continue
+                    stats['bot_latency'].append(time.perf_counter() - questions.popleft())
+                else:
+                    match = MARKER.search(frame.get('message', ''))
+                    if not match:
+                        continue
+                    sent_at = float(match.group(3))
+                    stats['user_latency'].append(time.perf_counter() - sent_at)
+                    if frame['message'].startswith('@bot'):
+                        questions.append(sent_at)
+                stats['delivered'] += 1
+                if not sending and stats['delivered'] >= stats['expected']:
+                    all_delivered.set()
+
+        async def send(i, communicator, stop_at):
+            seq = 0
+            while True:
+                delay = rng.expovariate(options['rate'])
+                if time.perf_counter() + delay >= stop_at:
+                    return
+                await asyncio.sleep(delay)
+                bot = rng.random() < options['bot_fraction']
+                text = f"{f'@bot {BOT_QUESTION} ' if bot else ''}lt {i} {seq} {time.perf_counter():.6f}"
+                stats['sent'] += 1
+                stats['bot_sent'] += bot
+                stats['expected'] += room_size[room_of[i]] * (2 if bot else 1)
+                await communicator.send_json_to({'message': text})
+                seq += 1
+
+        sending = True
+        started = time.perf_counter()
+        gate = asyncio.Semaphore(options['connect_concurrency'])
+        communicators = await asyncio.gather(*(connect(i, gate) for i in range(len(users))))
+        stats['connect_seconds'] = time.perf_counter() - started
+        stats['rejected'] = sum(c is None for c in communicators)
+        live = [(i, c) for i, c in enumerate(communicators) if c is not None]
+        stats['memory_connected'] = memory_mb()
+
+        drains = [asyncio.create_task(drain(c)) for _, c in live]
+        cpu_before, wall_before = cpu_seconds(), time.perf_counter()
+        stop_at = wall_before + options['duration']
+        await asyncio.gather(*(send(i, c, stop_at) for i, c in live))
+        sending = False
+        if stats['delivered'] < stats['expected']:
+            try:
+                await asyncio.wait_for(all_delivered.wait(), options['drain_timeout'])
+            except asyncio.TimeoutError:
+                pass
+        stats['seconds'] = time.perf_counter() - wall_before
+        stats['cpu'] = cpu_seconds() - cpu_before
+        stats['memory'] = memory_mb()
+
+        for task in drains:
+            task.cancel()
+        # channels_redis logs every receive it cancels at disconnect; that's teardown, not load
+        pubsub_logger = logging.getLogger('channels_redis.pubsub')
+        level = pubsub_logger.level
+        pubsub_logger.setLevel(logging.CRITICAL)
+        try:
+            await asyncio.gather(*(c.disconnect() for _, c in live), return_exceptions=True)
+        finally:
+            pubsub_logger.setLevel(level)
+        await writer.flush()  # before the test database goes away
+        return stats
+
+    def report(self, stats):
+        seconds = stats['seconds']
+        rss, peak = stats['memory']
+        self.stdout.write(
+            f"  connected {stats['clients'] - stats['rejected']} sockets in {stats['connect_seconds']:.2f}s"
+            + (f" ({stats['rejected']} rejected)" if stats['rejected'] else '')
+            + f", RSS {stats['memory_connected'][0]:.0f}MB once connected"
+        )
+        self.stdout.write(
+            f"  sent {stats['sent']} messages ({stats['bot_sent']} @bot), "
+            f"delivered {stats['delivered']} of {stats['expected']} frames in {seconds:.2f}s: "
+            f"{stats['delivered'] / seconds:,.0f} frames/s, {stats['sent'] / seconds:,.0f} messages/s"
+        )
+        for name in ('user', 'bot'):
+            latencies = stats[f'{name}_latency']
+            if latencies:
+                self.stdout.write(
+                    f"  {name} delivery latency p50 {percentile(latencies, 0.5) * 1000:.1f}ms  "
+                    f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms  max {max(latencies) * 1000:.1f}ms"
+                )
+        self.stdout.write(
+            f"  CPU {stats['cpu']:.1f}s ({stats['cpu'] / seconds:.0%} of one core, clients included), "
+            f"RSS {rss:.0f}MB (peak {peak:.0f}MB)"
+        )
+        self.stdout.write(f"  {stats['saved']} messages saved (user + bot)")
+        missing = stats['expected'] - stats['delivered']
+        if missing > 0:
+            self.stdout.write(self.style.ERROR(f'  {missing} frames dropped or late'))
+        else:
+            self.stdout.write(self.style.SUCCESS('  every frame delivered'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chat.models import ChatMessage
+from apps.chat.prefilter import Prefilter
+
+
+class Command(BaseCommand):
+    help = ('Replay chat messages through the moderation prefilter and report the fraction '
+            'settled without running the model')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10000, help='Most recent messages to replay')
+        parser.add_argument('--file', help='Replay the lines of a text file instead of stored messages')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                messages = [line.rstrip('\n') for line in f][:options['limit']]
+        else:
+            messages = list(
+                ChatMessage.objects.filter(is_bot_message=False)
+                .order_by('-timestamp').values_list('message', flat=True)[:options['limit']]
+            )
+        if not messages:
+            raise CommandError('No messages to replay')
+
+        prefilter = Prefilter()
+        started = time.perf_counter()
+        for message in reversed(messages):  # oldest first, as they arrived
+            if prefilter.check(message) is None:
+                # Stand-in verdict: only whether the message was cached matters here
+                prefilter.remember(message, 0.0, 'neutral')
+        elapsed = time.perf_counter() - started
+
+        total = len(messages)
+        self.stdout.write(f'{total} messages, {elapsed / total * 1e6:.1f}us each in the prefilter')
+        for reason in ('empty', 'safe_words', 'lexicon', 'cache', 'model'):
+            count = prefilter.stats[reason]
+            self.stdout.write(f'  {reason:<11} {count:>8}  {count / total:6.1%}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Settled without inference: {prefilter.fast_path_ratio():.1%}'
+        ))
@@ -31,6 +31,10 @@ class ChatMessage(models.Model):
     class Meta:
         db_table = 'chat_messages'
         ordering = ['timestamp']
+        indexes = [
+            # History pages seek on this (apps.chat.history)
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_msg_room_ts_id_idx'),
+        ]
     
     def __str__(self):
         username = self.user.username if self.user else "Bot"
@@ -0,0 +1,82 @@
+# apps/chat/persistence.py
+import asyncio
+import atexit
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """Write-behind buffer for chat messages.
+
+    Consumers broadcast first and hand the message to the writer, which inserts
+    buffered messages with one ``bulk_create`` once ``batch_size`` accumulate or
+    ``interval_ms`` passes. Batches are written one at a time in arrival order,
+    so ids and timestamps stay ordered within each room. Whatever is still
+    buffered is written when a socket disconnects and at interpreter exit.
+    """
+
+    def __init__(self, batch_size=None, interval_ms=None):
+        self.batch_size = batch_size or settings.CHAT_WRITE_BATCH_SIZE
+        self.interval = (interval_ms or settings.CHAT_WRITE_INTERVAL_MS) / 1000.0
+        self._buffer = []
+        self._timer = None
+        self._lock = None
+
+    def add(self, message):
+        self._buffer.append(message)
+        if len(self._buffer) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush_soon)
+
+    def _flush_soon(self):
+        self._timer = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                await database_sync_to_async(self.write)(batch)
+            except Exception:
+                logger.exception("Saving %s chat messages failed; retrying with the next flush", len(batch))
+                self._buffer[:0] = batch
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush_soon)
+
+    def write(self, batch):
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(batch)
+        except IntegrityError:
+            # A room was deleted while its messages were buffered; keep the others
+            for message in batch:
+                try:
+                    with transaction.atomic():
+                        message.save()
+                except IntegrityError:
+                    logger.warning("Dropped message for missing room %s", message.room_id)
+
+    def flush_sync(self):
+        """Write the remaining buffer from a synchronous context (process exit)."""
+        batch, self._buffer = self._buffer, []
+        if batch:
+            self.write(batch)
+
+
+writer = MessageWriter()
+atexit.register(writer.flush_sync)
@@ -0,0 +1,146 @@
+# apps/chat/prefilter.py
+import re
+import threading
+from collections import Counter, OrderedDict, deque
+
+from django.conf import settings
+
+# Messages made only of these words are let through without inference
+SAFE_WORDS = {
+    "@bot", "hi", "hello", "hey", "thanks", "thank", "you", "thx", "ty", "ok", "okay",
+    "yes", "no", "yeah", "sure", "great", "nice", "cool", "good", "morning", "bye",
+    "please", "agreed", "interesting", "abstract", "author", "authors", "date", "year",
+    "category", "categories", "topic", "summary", "what", "is", "the", "are", "who",
+    "when", "of", "this", "paper", "a", "and", "lol",
+}
+# Undo the usual character swaps before matching the lexicon
+LEET = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s", "!": "i"})
+_non_word = re.compile(r"[^a-z0-9@$!+]+")
+_repeats = re.compile(r"(.)\1{2,}")  # "soooo" -> "soo"
+
+
+def normalize(text):
+    """Lowercased words with punctuation and runs of repeated letters squeezed out."""
+    words = _non_word.sub(" ", _repeats.sub(r"\1\1", str(text).lower())).split()
+    return " ".join(word for word in (w.rstrip("!") for w in words) if word)
+
+
+class Automaton:
+    """Aho-Corasick matcher: one pass over the text, however many terms.
+
+    Terms match whole words; a trailing ``*`` makes a term match any word
+    starting with it (``idiot*`` also catches "idiots", "idiotic").
+    """
+
+    def __init__(self, terms=()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [False]
+        for term in terms:
+            self.add(term)
+        self.build()
+
+    def add(self, term):
+        term = term.strip().lower()
+        if not term:
+            return
+        # Text is scanned as " word word ", so spaces mark the word boundaries
+        pattern = " " + term[:-1] if term.endswith("*") else " " + term + " "
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(False)
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state] = True
+
+    def build(self):
+        pending = deque(self.goto[0].values())  # depth-1 states keep fail = root
+        while pending:
+            state = pending.popleft()
+            for char, child in self.goto[state].items():
+                pending.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] or self.output[self.fail[child]]
+
+    def search(self, text):
+        """Whether any term occurs in ``text`` (already normalized)."""
+        state = 0
+        for char in " " + text + " ":
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                return True
+        return False
+
+
+def load_lexicon(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    except FileNotFoundError:
+        return []
+
+
+class Prefilter:
+    """Settles the easy messages before they reach the moderation model.
+
+    In order: blank or word-free messages and messages made only of
+    ``SAFE_WORDS`` pass, a lexicon hit is offensive, and a message seen
+    before gets its cached verdict (LRU on the normalized text). ``check``
+    returns None for the rest, which go to the model; ``remember`` caches
+    its answer. ``stats`` counts how each message was settled.
+    """
+
+    def __init__(self, terms=None, cache_size=None):
+        terms = load_lexicon(settings.MODERATION_LEXICON_PATH) if terms is None else terms
+        self.automaton = Automaton(terms)
+        self.cache_size = cache_size or settings.MODERATION_VERDICT_CACHE_SIZE
+        self.stats = Counter()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, message, confidence_threshold=0.0):
+        text = normalize(message)
+        words = text.split()
+        if not any(char.isalpha() for char in text):
+            return self._settled("empty", "neutral")
+        if all(word in SAFE_WORDS for word in words):
+            return self._settled("safe_words", "neutral")
+        if self.automaton.search(text.translate(LEET)):
+            return self._settled("lexicon", "offensive")
+        with self._lock:
+            verdict = self._cache.get((text, confidence_threshold))
+            if verdict is not None:
+                self._cache.move_to_end((text, confidence_threshold))
+                self.stats["cache"] += 1
+                return verdict
+        return None
+
+    def remember(self, message, confidence_threshold, verdict):
+        key = (normalize(message), confidence_threshold)
+        with self._lock:
+            self.stats["model"] += 1
+            self._cache[key] = verdict
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def count(self, reason):
+        with self._lock:
+            self.stats[reason] += 1
+
+    def _settled(self, reason, verdict):
+        self.count(reason)
+        return verdict
+
+    def fast_path_ratio(self):
+        """Fraction of messages settled without inference."""
+        total = sum(self.stats.values())
+        return (total - self.stats["model"] - self.stats["unscreened"]) / total if total else 0.0
@@ -0,0 +1,384 @@
+# apps/chat/retrieval.py
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+from django.conf import settings
+
+from ml_models.lambda_function import chunk_sentences_by_wordcount, split_into_sentences
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1  # bump when the file layout changes; older files are rebuilt
+
+AUTHOR_QUESTION = re.compile(r'\bauthors?\b|\bwho wrote\b', re.I)
+DATE_QUESTION = re.compile(r'\bpublished\b|\bpublication date\b|\bwhat year\b', re.I)
+ABSTRACT_QUESTION = re.compile(r'\babstract\b|\bsummar(?:y|ize|ise)\b|\bwhat is (?:this|the) paper about\b', re.I)
+CATEGORY_QUESTION = re.compile(r'\bcategor(?:y|ies)\b|\btopics?\b', re.I)
+
+HELP = ("Ask me anything about this paper and I'll quote the passages that answer it. "
+        "I also know its abstract, authors, publication date and categories.")
+
+
+class TfidfEncoder:
+    """TF-IDF vectors over the paper's own vocabulary.
+
+    Needs no model, and encoding a question takes well under a millisecond,
+    so searches run inline on the consumer's event loop.
+    """
+
+    name = 'tfidf'
+    inline = True
+
+    def __init__(self, vocabulary=None, idf=None):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True, dtype=np.float32,
+                                          vocabulary=vocabulary)
+        if idf is not None:
+            self.vectorizer.idf_ = idf
+
+    def fit(self, passages):
+        return self.vectorizer.fit_transform(passages)
+
+    def encode(self, texts):
+        return self.vectorizer.transform(texts)
+
+    def arrays(self):
+        terms = '\n'.join(self.vectorizer.get_feature_names_out())
+        return {'terms': np.frombuffer(terms.encode('utf-8'), dtype=np.uint8),
+                'idf': self.vectorizer.idf_.astype(np.float32)}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        terms = arrays['terms'].tobytes().decode('utf-8').split('\n')
+        return cls({term: i for i, term in enumerate(terms)}, arrays['idf'])
+
+
+class SentenceEncoder:
+    """Dense sentence-transformers embeddings, shared by every index in the process."""
+
+    name = 'sentence'
+    inline = False  # a forward pass per question; kept off the event loop
+
+    _models = {}
+    _load_lock = threading.Lock()
+
+    def model(self):
+        name = settings.CHAT_BOT_SENTENCE_MODEL
+        with self._load_lock:
+            if name not in self._models:
+                from sentence_transformers import SentenceTransformer
+
+                self._models[name] = SentenceTransformer(name, cache_folder=str(settings.TRANSFORMERS_CACHE))
+            return self._models[name]
+
+    def fit(self, passages):
+        return self.encode(passages)
+
+    def encode(self, texts):
+        return self.model().encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+
+    def arrays(self):
+        return {}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls()
+
+
+ENCODERS = {
+    'tfidf': TfidfEncoder,
+    'sentence': SentenceEncoder,
+}
+
+
+def get_encoder(name=None):
+    name = name or settings.CHAT_BOT_ENCODER
+    try:
+        return ENCODERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown bot encoder: {name}") from None
+
+
+def paper_passages(paper, record=None):
+    """``(passages, pages)``: title and abstract as page 0, then each page of the PDF text."""
+    passages, pages = [], []
+
+    def add(text, page):
+        sentences = [" ".join(s.replace('\0', '').split()) for s in split_into_sentences(text)]
+        for passage in chunk_sentences_by_wordcount([s for s in sentences if s], settings.CHAT_BOT_CHUNK_WORDS):
+            passages.append(passage)
+            pages.append(page)
+
+    add(f"{paper.title}. {paper.abstract or ''}", 0)
+    if record is not None:
+        text, offsets = record.text, record.page_offsets  # decompressed once, not per page
+        for i, start in enumerate(offsets):
+            end = offsets[i + 1] if i + 1 < len(offsets) else len(text)
+            add(text[start:end], i + 1)
+    return passages, pages
+
+
+class PaperIndex:
+    """One paper's passages, their vectors, and the metadata @bot answers from."""
+
+    def __init__(self, passages, pages, vectors, encoder, metadata):
+        self.passages = passages
+        self.pages = pages
+        self.vectors = vectors
+        self.encoder = encoder
+        self.metadata = metadata
+
+    @classmethod
+    def build(cls, paper, record=None, encoder=None):
+        encoder = encoder or get_encoder()
+        passages, pages = paper_passages(paper, record)
+        metadata = {
+            'title': paper.title,
+            'abstract': paper.abstract or '',
+            'authors': paper.authors,
+            'publication_date': str(paper.publication_date),
+            'categories': [category.name for category in paper.categories.all()],
+        }
+        return cls(passages, np.array(pages, dtype=np.int32), encoder.fit(passages), encoder, metadata)
+
+    @cached_property
+    def nbytes(self):
+        """Approximate memory held, for the cache's budget."""
+        size = sum(len(passage) for passage in self.passages) + self.pages.nbytes
+        if isinstance(self.vectors, np.ndarray):
+            size += self.vectors.nbytes
+        else:
+            size += self.vectors.data.nbytes + self.vectors.indices.nbytes + self.vectors.indptr.nbytes
+        for array in self.encoder.arrays().values():
+            size += array.nbytes * 4  # the vocabulary dict costs several times its raw bytes
+        return size
+
+    def search(self, question, k=None):
+        """Top ``k`` ``(score, page, passage)`` by cosine similarity; vectors are L2-normalised."""
+        k = k or settings.CHAT_BOT_TOP_K
+        query = self.encoder.encode([question])
+        scores = self.vectors @ query.T
+        scores = np.asarray(scores.toarray() if hasattr(scores, 'toarray') else scores).ravel()
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(self.pages[i]), self.passages[i]) for i in top if scores[i] > 0]
+
+    def save(self, path):
+        text = '\0'.join(self.passages).encode('utf-8')
+        arrays = {
+            'version': np.array(INDEX_VERSION),
+            'encoder': np.frombuffer(self.encoder.name.encode('utf-8'), dtype=np.uint8),
+            'metadata': np.frombuffer(json.dumps(self.metadata).encode('utf-8'), dtype=np.uint8),
+            'passages': np.frombuffer(text, dtype=np.uint8),
+            'pages': self.pages,
+            **{f'encoder_{name}': array for name, array in self.encoder.arrays().items()},
+        }
+        if isinstance(self.vectors, np.ndarray):
+            arrays['vectors'] = self.vectors
+        else:
+            vectors = self.vectors.tocsr()
+            arrays.update(vectors_data=vectors.data, vectors_indices=vectors.indices,
+                          vectors_indptr=vectors.indptr, vectors_shape=np.array(vectors.shape))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so readers in other processes never see half a file
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """The index saved at ``path``; None when it was built by another version or encoder."""
+        from scipy.sparse import csr_matrix
+
+        with np.load(path, allow_pickle=False) as arrays:
+            encoder_name = arrays['encoder'].tobytes().decode('utf-8')
+            if int(arrays['version']) != INDEX_VERSION or encoder_name != settings.CHAT_BOT_ENCODER:
+                return None
+            prefix = 'encoder_'
+            encoder = ENCODERS[encoder_name].from_arrays(
+                {name[len(prefix):]: arrays[name] for name in arrays.files if name.startswith(prefix)}
+            )
+            if 'vectors' in arrays.files:
+                vectors = arrays['vectors']
+            else:
+                vectors = csr_matrix((arrays['vectors_data'], arrays['vectors_indices'], arrays['vectors_indptr']),
+                                     shape=tuple(arrays['vectors_shape']))
+            passages = arrays['passages'].tobytes().decode('utf-8').split('\0')
+            metadata = json.loads(arrays['metadata'].tobytes().decode('utf-8'))
+            return cls(passages, arrays['pages'], vectors, encoder, metadata)
+
+
+class IndexCache:
+    """Paper indexes kept in memory, least recently used evicted past a byte budget.
+
+    A miss loads the paper's file from CHAT_BOT_INDEX_DIR, or builds the index
+    from the already-extracted PDF text and saves it, so a paper is embedded
+    once. Hits are checked against the file's mtime: when another process
+    drops a paper's index (apps.chat.signals), this one notices on the next
+    question. Abstract-only indexes of papers whose text isn't extracted yet
+    are never saved; they are kept for CHAT_BOT_PROVISIONAL_INDEX_TTL seconds.
+    """
+
+    provisional_max_entries = 1024
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # paper id -> (index, file mtime)
+        self._provisional = {}  # paper id -> (expires at, abstract-only index)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def path(self, paper_id):
+        return os.path.join(self.directory or settings.CHAT_BOT_INDEX_DIR, f'{int(paper_id)}.npz')
+
+    def get(self, paper_id):
+        """The loaded index of the paper, or None; never touches the database."""
+        with self._lock:
+            entry = self._entries.get(paper_id)
+        if entry is None:
+            return self._provisional_index(paper_id)
+        try:
+            current = os.stat(self.path(paper_id)).st_mtime_ns
+        except FileNotFoundError:
+            current = None
+        if current != entry[1]:
+            self._forget(paper_id)
+            return None
+        with self._lock:
+            if paper_id in self._entries:
+                self._entries.move_to_end(paper_id)
+        return entry[0]
+
+    def load(self, paper_id, paper=None):
+        """The paper's index from disk, else built from its stored text (never extracts a PDF)."""
+        from apps.papers.models import Paper
+        from apps.papers.utils import get_pdf_text_record
+
+        path = self.path(paper_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            index = PaperIndex.load(path)
+        except FileNotFoundError:
+            index = None
+        except (OSError, ValueError, KeyError):
+            logger.warning("Rebuilding unreadable bot index %s", path, exc_info=True)
+            index = None
+        if index is not None:
+            self._remember(paper_id, index, mtime)
+            return index
+
+        provisional = self._provisional_index(paper_id)
+        if provisional is not None:
+            return provisional
+        paper = paper or Paper.objects.get(pk=paper_id)
+        record = get_pdf_text_record(paper, extract=False)
+        index = PaperIndex.build(paper, record)
+        if record is None and paper.pdf_path:
+            # Text not extracted yet: answer from the abstract for a while, then look for the text again
+            with self._lock:
+                if len(self._provisional) >= self.provisional_max_entries:
+                    self._provisional.clear()
+                self._provisional[paper_id] = (time.monotonic() + settings.CHAT_BOT_PROVISIONAL_INDEX_TTL, index)
+            return index
+        index.save(path)
+        self._remember(paper_id, index, os.stat(path).st_mtime_ns)
+        return index
+
+    def discard(self, paper_id):
+        """Drop the paper's index here and on disk; the next question rebuilds it."""
+        self._forget(paper_id)
+        try:
+            os.remove(self.path(paper_id))
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, paper_id, index, mtime):
+        max_bytes = self.max_bytes or settings.CHAT_BOT_INDEX_CACHE_MB * 1024 * 1024
+        with self._lock:
+            previous = self._entries.pop(paper_id, None)
+            if previous is not None:
+                self._bytes -= previous[0].nbytes
+            self._entries[paper_id] = (index, mtime)
+            self._bytes += index.nbytes
+            # The newest index stays even when it alone is over budget
+            while self._bytes > max_bytes and len(self._entries) > 1:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def _provisional_index(self, paper_id):
+        with self._lock:
+            entry = self._provisional.get(paper_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._provisional[paper_id]
+                return None
+            return entry[1]
+
+    def _forget(self, paper_id):
+        with self._lock:
+            self._provisional.pop(paper_id, None)
+            entry = self._entries.pop(paper_id, None)
+            if entry is not None:
+                self._bytes -= entry[0].nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+
+indexes = IndexCache()
+
+
+def answer(question, index):
+    """The @bot reply to ``question`` from the paper's index (None outside a paper's room)."""
+    question = question.strip()
+    if index is None:
+        return "I answer questions about papers; ask me in a paper's discussion room."
+    if not question:
+        return HELP
+
+    metadata = index.metadata
+    if AUTHOR_QUESTION.search(question):
+        return f"The authors of this paper are: {metadata['authors']}"
+    if DATE_QUESTION.search(question):
+        return f"This paper was published on: {metadata['publication_date']}"
+    if CATEGORY_QUESTION.search(question) and metadata['categories']:
+        return f"This paper belongs to the following categories: {', '.join(metadata['categories'])}"
+    if ABSTRACT_QUESTION.search(question):
+        return f"The abstract of this paper is: {metadata['abstract']}"
+
+    hits = [hit for hit in index.search(question) if hit[0] >= settings.CHAT_BOT_MIN_SCORE]
+    if not hits:
+        return f"I couldn't find that in this paper. {HELP}"
+    return "\n".join(
+        f"({'abstract' if page == 0 else f'p. {page}'}) {passage}" for _, page, passage in hits
+    )
+
+
+def bot_reply(paper_id, question, paper=None):
+    """``answer`` for a room's paper, loading or building its index as needed."""
+    index = None
+    if paper_id is not None:
+        try:
+            index = indexes.get(paper_id) or indexes.load(paper_id, paper)
+        except Exception:
+            logger.exception("Bot index unavailable for Paper %s", paper_id)
+            return "I can't read this paper right now, please try again later."
+    return answer(question, index)
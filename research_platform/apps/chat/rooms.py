@@ -0,0 +1,174 @@
+# apps/chat/rooms.py
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from apps.groups.models import Group, GroupMember
+from apps.papers.models import Paper
+
+from .models import ChatRoom
+
+
+class RoomResolver:
+    """Maps a paper, group or room id to ``(room_id, is_active)``.
+
+    Lookups go through a small per-process dict, then the shared cache, then
+    the database. Signals (apps.chat.signals) drop the shared entries when a
+    room or its paper/group changes; other processes' dict entries expire
+    after CHAT_ROOM_LOCAL_TTL seconds. Room-id lookups also record the group
+    of a private group's room, so joining can check membership directly.
+    """
+
+    def __init__(self, local_ttl=None, timeout=None):
+        self.local_ttl = settings.CHAT_ROOM_LOCAL_TTL if local_ttl is None else local_ttl
+        self.timeout = timeout or settings.CHAT_ROOM_CACHE_TIMEOUT
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        return None
+
+    def _get(self, key):
+        value = self.local(key)
+        if value is not None:
+            return value
+        value = cache.get(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def _remember(self, key, value):
+        with self._lock:
+            if len(self._local) >= settings.CHAT_ROOM_LOCAL_MAX_ENTRIES:
+                self._local.clear()
+            self._local[key] = (time.monotonic() + self.local_ttl, value)
+
+    def _set(self, key, value):
+        cache.set(key, value, self.timeout)
+        self._remember(key, value)
+
+    def invalidate(self, *keys):
+        cache.delete_many(keys)
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def for_paper(self, paper_id, user):
+        """The discussion room of an approved paper, created on first use; 404 otherwise."""
+        key = paper_key(paper_id)
+        state = self._get(key)
+        if state is None:
+            if not Paper.objects.filter(pk=paper_id, is_approved=True).exists():
+                raise Http404("No approved paper matches the given query.")
+            room, _ = ChatRoom.objects.get_or_create(paper_id=paper_id, defaults={'created_by': user})
+            state = (room.pk, room.is_active)
+            self._set(key, state)
+        return state
+
+    def for_group(self, group_id, user):
+        key = group_key(group_id)
+        state = self._get(key)
+        if state is None:
+            if not Group.objects.filter(pk=group_id).exists():
+                raise Http404("No group matches the given query.")
+            room, _ = ChatRoom.objects.get_or_create(group_id=group_id, defaults={'created_by': user})
+            state = (room.pk, room.is_active)
+            self._set(key, state)
+        return state
+
+    def for_room(self, room_id):
+        """``(room_id, is_active, private_group_id)`` of an existing room, or None."""
+        key = room_key(room_id)
+        state = self._get(key)
+        if state is None:
+            row = self._room_row(room_id).first()
+            if row is None:
+                return None
+            state = self._room_state(room_id, row)
+            self._set(key, state)
+        return state
+
+    async def afor_room(self, room_id):
+        """for_room on the async ORM, for consumers."""
+        key = room_key(room_id)
+        state = self._get(key)
+        if state is None:
+            row = await self._room_row(room_id).afirst()
+            if row is None:
+                return None
+            state = self._room_state(room_id, row)
+            self._set(key, state)
+        return state
+
+    def _room_row(self, room_id):
+        return ChatRoom.objects.filter(pk=room_id).values_list('is_active', 'group_id', 'group__is_private')
+
+    def _room_state(self, room_id, row):
+        is_active, group_id, is_private = row
+        # Only private groups restrict who may join
+        return (int(room_id), is_active, group_id if is_private else None)
+
+
+def paper_key(paper_id):
+    return f'chat:room:paper:{paper_id}'
+
+
+def group_key(group_id):
+    return f'chat:room:group:{group_id}'
+
+
+def room_key(room_id):
+    return f'chat:room:{room_id}'
+
+
+resolver = RoomResolver()
+
+
+async def can_join(room_id, user):
+    """Whether ``user`` may open a socket on ``room_id``.
+
+    The room must exist and be active, and rooms of private groups are for
+    members only. Checked once per connection, on the async ORM.
+    """
+    if not user.is_authenticated:
+        return False
+    state = await resolver.afor_room(room_id)
+    if state is None or not state[1]:
+        return False
+    private_group_id = state[2]
+    return private_group_id is None or await GroupMember.objects.filter(
+        group_id=private_group_id, user_id=user.pk
+    ).aexists()
+
+
+def can_read(room_id, user):
+    """Whether ``user`` may read the history of ``room_id``; 404 if there is no such room.
+
+    Private groups' rooms are for members only, as in can_join. Closed rooms
+    stay readable, like their pages.
+    """
+    state = resolver.for_room(room_id)
+    if state is None:
+        raise Http404("No chat room matches the given query.")
+    private_group_id = state[2]
+    return private_group_id is None or GroupMember.objects.filter(
+        group_id=private_group_id, user_id=user.pk
+    ).exists()
+
+
+def can_use_group(group_id, user):
+    """Whether ``user`` may read and post in the room of ``group_id``; 404 if there is no such group.
+
+    Checked on the group itself, so non-members never cause the room to be created.
+    """
+    is_private = Group.objects.filter(pk=group_id).values_list('is_private', flat=True).first()
+    if is_private is None:
+        raise Http404("No group matches the given query.")
+    return not is_private or GroupMember.objects.filter(group_id=group_id, user_id=user.pk).exists()
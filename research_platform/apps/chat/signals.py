@@ -0,0 +1,61 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.groups.models import Group
+from apps.papers.models import Paper, PaperCategory
+
+from .models import ChatRoom
+from .retrieval import indexes
+from .rooms import group_key, paper_key, resolver, room_key
+
+
+# Invalidated after commit, so a concurrent miss can't re-cache the old state
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def invalidate_room(sender, instance, **kwargs):
+    keys = [room_key(instance.pk)]
+    if instance.paper_id:
+        keys.append(paper_key(instance.paper_id))
+    if instance.group_id:
+        keys.append(group_key(instance.group_id))
+    transaction.on_commit(partial(resolver.invalidate, *keys))
+
+
+def invalidate_paper_rooms(paper_ids):
+    """Drop the papers' cached room states; also for bulk updates, which send no signals."""
+    keys = [paper_key(pk) for pk in paper_ids]
+    if keys:
+        transaction.on_commit(partial(resolver.invalidate, *keys))
+
+
+@receiver(post_save, sender=Paper)
+@receiver(post_delete, sender=Paper)
+def invalidate_paper_room(sender, instance, **kwargs):
+    # Approval decides whether the paper's room can be posted to
+    invalidate_paper_rooms([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_room(sender, instance, **kwargs):
+    # Room states record whether the group is private
+    room_ids = ChatRoom.objects.filter(group_id=instance.pk).values_list('pk', flat=True)
+    keys = [group_key(instance.pk), *(room_key(pk) for pk in room_ids)]
+    transaction.on_commit(partial(resolver.invalidate, *keys))
+
+
+@receiver(post_save, sender=Paper)
+@receiver(post_delete, sender=Paper)
+def discard_bot_index(sender, instance, **kwargs):
+    # The index holds the abstract and metadata too; rebuilt on the next question
+    transaction.on_commit(partial(indexes.discard, instance.pk))
+
+
+@receiver(post_save, sender=PaperCategory)
+@receiver(post_delete, sender=PaperCategory)
+def discard_bot_index_categories(sender, instance, **kwargs):
+    transaction.on_commit(partial(indexes.discard, instance.paper_id))
@@ -0,0 +1,37 @@
+# apps/chat/testing.py
+"""Local Redis stand-in for channel-layer tests and benchmarks.
+
+Needs ``fakeredis`` (plus ``lupa`` for RedisChannelLayer's Lua scripts); neither
+is required in production, where CHANNEL_REDIS_HOSTS points at real Redis.
+"""
+import threading
+from contextlib import contextmanager
+
+CHANNEL_LAYER_BACKENDS = {
+    'pubsub': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+    'core': 'channels_redis.core.RedisChannelLayer',
+}
+
+
+@contextmanager
+def fake_redis_server(host='127.0.0.1', port=0):
+    """Run an in-process Redis-protocol server; yields its ``redis://`` URL."""
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield 'redis://%s:%s' % server.server_address[:2]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def redis_channel_layers(*hosts, backend='pubsub'):
+    """A CHANNEL_LAYERS value for ``override_settings`` pointing at ``hosts``."""
+    return {
+        'default': {
+            'BACKEND': CHANNEL_LAYER_BACKENDS[backend],
+            'CONFIG': {'hosts': list(hosts)},
+        },
+    }
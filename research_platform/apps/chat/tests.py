@@ -1,3 +1,321 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.http import Http404
+from django.urls import reverse
+
+from apps.accounts.models import User
+from apps.groups.models import Group, GroupMember
+from apps.papers.models import Paper
+from apps.papers.tests import make_paper
+
+from .management.commands.export_moderation_onnx import PARITY_SAMPLES, Command as ExportOnnx
+from .history import encode_cursor, history_page, parse_cursor
+from .models import ChatMessage, ChatRoom
+from .persistence import MessageWriter
+from .prefilter import Prefilter
+from .retrieval import IndexCache, PaperIndex
+from .rooms import resolver
+from .utils import ModerationService, is_offensive
+
+
+class ChatHistoryAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='member', email='member@example.com', password='x')
+        cls.outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password='x')
+        group = Group.objects.create(name='Reading group', created_by=cls.member, is_private=True)
+        GroupMember.objects.create(group=group, user=cls.member)
+        cls.room = ChatRoom.objects.create(group=group, created_by=cls.member)
+        ChatMessage.objects.create(room=cls.room, user=cls.member, message='Members only')
+
+    def setUp(self):
+        cache.clear()
+
+    def history(self, user, room_id):
+        self.client.force_login(user)
+        return self.client.get(reverse('chat:history', args=[room_id]))
+
+    def test_members_read_a_private_groups_history(self):
+        response = self.history(self.member, self.room.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['message'] for m in response.json()['messages']], ['Members only'])
+
+    def test_outsiders_are_refused(self):
+        self.assertEqual(self.history(self.outsider, self.room.pk).status_code, 403)
+
+    def test_missing_room_is_not_found(self):
+        self.assertEqual(self.history(self.member, self.room.pk + 100).status_code, 404)
+
+    def test_outsiders_cannot_open_the_room_pages(self):
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(reverse('chat:room_detail', args=[self.room.pk])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('chat:group_chat', args=[self.room.group_id])).status_code, 403)
+
+    def test_outsiders_cannot_post(self):
+        self.client.force_login(self.outsider)
+        with mock.patch('apps.chat.views.is_offensive') as is_offensive:
+            ajax = self.client.post(reverse('chat:send_message_ajax', args=[self.room.pk]), {'message': 'Hello'})
+            page = self.client.post(reverse('chat:group_chat', args=[self.room.group_id]), {'message': 'Hello'})
+        self.assertEqual((ajax.status_code, page.status_code), (403, 403))
+        is_offensive.assert_not_called()
+        self.assertFalse(ChatMessage.objects.filter(user=self.outsider).exists())
+
+    def test_outsiders_do_not_create_a_private_groups_room(self):
+        group = Group.objects.create(name='Closed', created_by=self.member, is_private=True)
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(reverse('chat:group_chat', args=[group.pk])).status_code, 403)
+        self.assertFalse(ChatRoom.objects.filter(group=group).exists())
+
+
+class ProvisionalIndexTests(TestCase):
+    def test_abstract_only_index_is_reused_until_it_expires(self):
+        user = User.objects.create_user(username='author', email='author@example.com', password='x')
+        paper = make_paper(user, abstract='Graphene conducts heat well.', pdf_path='papers/pdfs/missing.pdf')
+        with tempfile.TemporaryDirectory() as directory:
+            index_cache = IndexCache(directory=directory)
+            with mock.patch('apps.chat.retrieval.PaperIndex.build', wraps=PaperIndex.build) as build:
+                first = index_cache.load(paper.pk)
+                self.assertIs(index_cache.get(paper.pk), first)
+                self.assertIs(index_cache.load(paper.pk), first)
+                self.assertEqual(build.call_count, 1)
+                self.assertFalse(os.listdir(directory))
+                with self.settings(CHAT_BOT_PROVISIONAL_INDEX_TTL=0):
+                    index_cache.discard(paper.pk)
+                    index_cache.load(paper.pk)
+                    self.assertIsNone(index_cache.get(paper.pk))
+                self.assertEqual(build.call_count, 2)
+
+
+class MessageWriterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='writer', email='writer@example.com', password='x')
+        cls.room = ChatRoom.objects.create(group=Group.objects.create(name='Writers', created_by=cls.user),
+                                           created_by=cls.user)
+
+    def message(self, text, room_id=None):
+        return ChatMessage(room_id=room_id or self.room.pk, user=self.user, message=text)
+
+    async def test_full_batch_is_saved_with_one_insert_in_order(self):
+        writer = MessageWriter(batch_size=3, interval_ms=60000)
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', wraps=ChatMessage.objects.bulk_create) as bulk:
+            for i in range(3):
+                writer.add(self.message(f'm{i}'))
+            await writer.flush()
+        self.assertEqual(bulk.call_count, 1)
+        saved = [m async for m in ChatMessage.objects.filter(room=self.room).order_by('pk').values_list('message', flat=True)]
+        self.assertEqual(saved, ['m0', 'm1', 'm2'])
+
+    async def test_partial_batch_is_saved_after_the_interval(self):
+        writer = MessageWriter(batch_size=100, interval_ms=10)
+        writer.add(self.message('alone'))
+        self.assertEqual(await ChatMessage.objects.filter(room=self.room).acount(), 0)
+        await asyncio.sleep(0.1)
+        self.assertEqual(await ChatMessage.objects.filter(room=self.room).acount(), 1)
+
+    async def test_failed_write_keeps_the_batch_for_the_next_flush(self):
+        writer = MessageWriter(batch_size=100, interval_ms=60000)
+        writer.add(self.message('kept'))
+        with mock.patch.object(writer, 'write', side_effect=OSError('database away')), \
+                self.assertLogs('apps.chat.persistence', 'ERROR'):
+            await writer.flush()
+        self.assertEqual([m.message for m in writer._buffer], ['kept'])
+        await writer.flush()
+        self.assertTrue(await ChatMessage.objects.filter(message='kept').aexists())
+
+
+class MessageWriterRoomDeletedTests(TransactionTestCase):
+    # Foreign keys are only checked on commit, which TestCase never reaches
+    def test_messages_for_a_deleted_room_are_dropped_alone(self):
+        user = User.objects.create_user(username='writer', email='writer@example.com', password='x')
+        room = ChatRoom.objects.create(group=Group.objects.create(name='Writers', created_by=user), created_by=user)
+        with self.assertLogs('apps.chat.persistence', 'WARNING'):
+            MessageWriter().write([ChatMessage(room=room, user=user, message='saved'),
+                                   ChatMessage(room_id=room.pk + 100, user=user, message='lost')])
+        self.assertEqual(list(ChatMessage.objects.values_list('message', flat=True)), ['saved'])
+
+
+class HistoryPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='pager', email='pager@example.com', password='x')
+        cls.room = ChatRoom.objects.create(group=Group.objects.create(name='Pagers', created_by=user), created_by=user)
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        # Pairs of messages share a timestamp, so the id has to break ties
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=cls.room, user=user, message=f'm{i}', timestamp=start + timedelta(seconds=i // 2))
+            for i in range(7)
+        ])
+
+    def test_pages_walk_back_through_every_message_once(self):
+        seen, before = [], None
+        while True:
+            page, cursor = history_page(self.room, before=before, limit=3)
+            seen[:0] = [m.message for m in page]
+            if cursor is None:
+                break
+            before = parse_cursor(cursor)
+        self.assertEqual(seen, [f'm{i}' for i in range(7)])
+
+    def test_cursor_round_trips(self):
+        message = ChatMessage.objects.get(message='m3')
+        self.assertEqual(parse_cursor(encode_cursor(message)), (message.timestamp, message.pk))
+
+    def test_last_page_has_no_cursor(self):
+        self.assertIsNone(history_page(self.room, limit=7)[1])
+        self.assertIsNotNone(history_page(self.room, limit=6)[1])
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('', 'yesterday,1', '2024-01-01T00:00:00Z,x'):
+            with self.assertRaises(ValueError):
+                parse_cursor(cursor)
+
+
+class ModerationBatchingTests(SimpleTestCase):
+    PROBABILITIES = {'hateful': [0.9, 0.05, 0.05], 'rude': [0.1, 0.8, 0.1], 'hello': [0.05, 0.05, 0.9],
+                     'unsure': [0.3, 0.3, 0.4]}
+
+    def service(self, **kwargs):
+        self.batches = []
+
+        def predict(messages):
+            self.batches.append(list(messages))
+            return [self.PROBABILITIES[m] for m in messages]
+
+        return ModerationService(predict=predict, **kwargs)
+
+    def test_concurrent_messages_share_one_forward_pass(self):
+        service = self.service(max_batch_size=8, max_wait_ms=200)
+        futures = [service.submit(m) for m in ('hateful', 'hello', 'rude')]
+        self.assertEqual([f.result(timeout=5) for f in futures], ['hate', 'neutral', 'offensive'])
+        self.assertEqual(self.batches, [['hateful', 'hello', 'rude']])
+
+    def test_batches_are_capped_at_max_batch_size(self):
+        service = self.service(max_batch_size=2, max_wait_ms=200)
+        futures = [service.submit('hello') for _ in range(5)]
+        self.assertEqual([f.result(timeout=5) for f in futures], ['neutral'] * 5)
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2, 1])
+        self.assertEqual((service.batches, service.messages), (3, 5))
+
+    def test_each_message_keeps_its_own_threshold(self):
+        service = self.service(max_batch_size=8, max_wait_ms=200)
+        loose, strict = service.submit('unsure'), service.submit('unsure', confidence_threshold=0.5)
+        self.assertEqual((loose.result(timeout=5), strict.result(timeout=5)), ('neutral', 'uncertain'))
+
+    def test_a_failed_batch_fails_every_message_in_it(self):
+        service = ModerationService(predict=mock.Mock(side_effect=RuntimeError('model gone')),
+                                    max_batch_size=8, max_wait_ms=200)
+        futures = [service.submit('hello'), service.submit('rude')]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+    async def test_async_callers_await_the_shared_batch(self):
+        service = self.service(max_batch_size=8, max_wait_ms=200)
+        labels = await asyncio.gather(service.aclassify('rude'), service.aclassify('hello'))
+        self.assertEqual(labels, ['offensive', 'neutral'])
+        self.assertEqual(len(self.batches), 1)
+
+
+class AdminApprovalTests(TestCase):
+    def test_bulk_approval_changes_reach_the_room_resolver(self):
+        user = User.objects.create_user(username='author', email='author@example.com', password='x')
+        paper = make_paper(user)
+        paper_admin = site._registry[Paper]
+        resolver.for_paper(paper.pk, user)  # cached while approved
+
+        with self.captureOnCommitCallbacks(execute=True):
+            paper_admin.reject_papers(None, Paper.objects.filter(pk=paper.pk))
+        with self.assertRaises(Http404):
+            resolver.for_paper(paper.pk, user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            paper_admin.approve_papers(None, Paper.objects.filter(pk=paper.pk))
+        self.assertTrue(resolver.for_paper(paper.pk, user)[1])
+
+
+class LexiconTests(SimpleTestCase):
+    def setUp(self):
+        self.prefilter = Prefilter()
+
+    def test_technical_terms_are_left_to_the_model(self):
+        for message in ('The retarded potential follows from the Lienard-Wiechert fields',
+                        'Samples were taken by needle prick', 'Anti-idiotype antibodies were measured',
+                        'Growth is retarded at low temperature'):
+            with self.subTest(message=message):
+                self.assertIsNone(self.prefilter.check(message))
+
+    def test_insults_are_still_blocked(self):
+        for message in ("you're retarded", 'what an idiot', 'you prick'):
+            with self.subTest(message=message):
+                self.assertEqual(self.prefilter.check(message), 'offensive')
+
+
+class PrefilterTests(SimpleTestCase):
+    def setUp(self):
+        self.prefilter = Prefilter(terms=['idiot*', 'moron'], cache_size=2)
+
+    def test_greetings_and_empty_messages_pass_without_the_model(self):
+        for message in ('Hello!!', 'thanks, great paper', '@bot what is the summary', '  ', '?!'):
+            with self.subTest(message=message):
+                self.assertEqual(self.prefilter.check(message), 'neutral')
+        self.assertEqual(self.prefilter.stats['safe_words'] + self.prefilter.stats['empty'], 5)
+
+    def test_lexicon_sees_through_spelling_tricks(self):
+        for message in ('You are an 1d10t', 'M0R0N!!', 'such idiotic remarks'):
+            with self.subTest(message=message):
+                self.assertEqual(self.prefilter.check(message), 'offensive')
+
+    def test_other_messages_are_left_to_the_model(self):
+        self.assertIsNone(self.prefilter.check('The method section is unclear'))
+
+    def test_model_verdicts_are_cached_per_threshold(self):
+        self.prefilter.remember('Strange results here', 0.5, 'neutral')
+        self.assertEqual(self.prefilter.check('strange results here!', 0.5), 'neutral')
+        self.assertIsNone(self.prefilter.check('Strange results here', 0.9))
+
+    def test_verdict_cache_evicts_least_recently_used(self):
+        for text in ('first message here', 'second message here', 'third message here'):
+            self.prefilter.remember(text, 0.0, 'neutral')
+        self.assertIsNone(self.prefilter.check('first message here'))
+        self.assertEqual(self.prefilter.check('third message here'), 'neutral')
+
+    def test_fast_path_ratio(self):
+        self.prefilter.check('hello')
+        self.prefilter.check('you moron')
+        self.prefilter.remember('Strange results here', 0.0, 'neutral')
+        self.prefilter.check('Strange results here')
+        self.assertEqual(self.prefilter.fast_path_ratio(), 0.75)
+
+    def test_settled_messages_never_reach_the_model(self):
+        with mock.patch('apps.chat.utils.prefilter', self.prefilter), \
+                mock.patch('apps.chat.utils.moderation') as moderation:
+            self.assertTrue(is_offensive('you moron'))
+            self.assertFalse(is_offensive('hello'))
+        moderation.submit.assert_not_called()
+
+
+def moderation_exports_available():
+    paths = (settings.MODERATION_MODEL_PATH, settings.MODERATION_TOKENIZER_PATH,
+             settings.MODERATION_ONNX_PATH, settings.MODERATION_VOCAB_PATH)
+    modules = ('tensorflow', 'onnxruntime')
+    return all(os.path.exists(p) for p in paths) and all(importlib.util.find_spec(m) for m in modules)
+
+
+@unittest.skipUnless(moderation_exports_available(), 'needs the Keras model, its ONNX export, tensorflow and onnxruntime')
+class OnnxParityTests(SimpleTestCase):
+    def test_int8_export_agrees_with_keras(self):
+        from . import utils
+
+        agreement = ExportOnnx().check_parity(utils.KerasRuntime(), utils.OnnxRuntime(), PARITY_SAMPLES, 0.99)
+        self.assertGreaterEqual(agreement, 0.99)
@@ -7,6 +7,7 @@ urlpatterns = [
     path('paper/<int:paper_id>/', views.ChatRoomView.as_view(), name='paper_chat'),
     path('room/<int:room_id>/', views.ChatDetailView.as_view(), name='room_detail'),
     path('ajax/send/<int:room_id>/', views.send_message_ajax, name='send_message_ajax'),
+    path('ajax/history/<int:room_id>/', views.chat_history, name='history'),
     path('my-chats/', views.MyChatRoomsView.as_view(), name='my_chats'),
     path('group/<int:group_id>/', views.GroupChatRoomView.as_view(), name='group_chat'), 
     path('room/<int:room_id>/', views.ChatDetailView.as_view(), name='room_detail'),
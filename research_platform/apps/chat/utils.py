@@ -1,162 +1,360 @@
-# import os
-# import string
-# import logging
-# import joblib
-# import numpy as np
-# import tensorflow as tf
-# from tensorflow.keras.models import load_model
-# from tensorflow.keras.preprocessing.sequence import pad_sequences
-# from nltk.corpus import stopwords
-# from nltk.stem import WordNetLemmatizer
-# from django.conf import settings
-
-# # ----------------------------
-# # Suppress TF logs
-# # ----------------------------
-# os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
-# logging.getLogger("tensorflow").setLevel(logging.ERROR)
-
-# # ----------------------------
-# # Paths (relative for Django deployment)
-# # ----------------------------
-# USE_ABS_PATH = True  
-# if USE_ABS_PATH:
-#     MODEL_PATH = r"D:\bbb\research_platform\apps\ml_engine\ml_models\hate_speech_detection.keras"
-#     TOKENIZER_PATH = r"D:\bbb\research_platform\apps\ml_engine\ml_models\tokenizer.pkl"
-# else:
-#     MODEL_PATH = os.path.join(
-#         settings.BASE_DIR, "apps", "ml_engine", "ml_models", "hate_speech_detection.keras"
-#     )
-#     TOKENIZER_PATH = os.path.join(
-#         settings.BASE_DIR, "apps", "ml_engine", "ml_models", "tokenizer.pkl"
-#     )
-
-# # ----------------------------
-# # Constants
-# # ----------------------------
-# MAX_LEN = 50  # must match training
-# ESSENTIAL_WORDS = {"i", "you", "love", "hate", "not", "no", "please", "thanks"}
-# stop_words = set(stopwords.words("english")) - ESSENTIAL_WORDS
-# lemmatizer = WordNetLemmatizer()
-
-# CLASS_MAPPING = {0: "hate", 1: "offensive", 2: "neutral"}
-# OFFENSIVE_CLASSES = {"hate", "offensive"}
-
-# # ----------------------------
-# # Globals for lazy caching
-# # ----------------------------
-# _hate_model = None
-# _tokenizer = None
-
-
-# def _load_once():
-#     """Lazy-load model + tokenizer only once per worker."""
-#     global _hate_model, _tokenizer
-
-#     if _hate_model is None:
-#         if not os.path.exists(MODEL_PATH):
-#             raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
-#         _hate_model = load_model(MODEL_PATH)
-
-#     if _tokenizer is None:
-#         if not os.path.exists(TOKENIZER_PATH):
-#             raise FileNotFoundError(f"Tokenizer not found at {TOKENIZER_PATH}")
-#         _tokenizer = joblib.load(TOKENIZER_PATH)
-
-
-# def get_hate_model():
-#     global _hate_model
-#     if _hate_model is None:
-#         _load_once()
-#     return _hate_model
-
-
-# def get_tokenizer():
-#     global _tokenizer
-#     if _tokenizer is None:
-#         _load_once()
-#     return _tokenizer
-
-
-# # ----------------------------
-# # Text preprocessing
-# # ----------------------------
-# def clean_text(text: str) -> str:
-#     text = str(text).lower()
-#     text = text.translate(str.maketrans("", "", string.punctuation))
-#     words = [
-#         lemmatizer.lemmatize(word)
-#         for word in text.split()
-#         if word not in stop_words
-#     ]
-#     return " ".join(words)
-
-
-# # ----------------------------
-# # Prediction
-# # ----------------------------
-# def predict_classes(messages: list[str], confidence_threshold: float = 0.0) -> list[str]:
-#     if not messages:
-#         return []
-
-#     texts = [clean_text(m) for m in messages]
-#     seqs = get_tokenizer().texts_to_sequences(texts)
-#     seqs = [[0] if not s else s for s in seqs]  # fallback for empty seqs
-
-#     padded = pad_sequences(seqs, maxlen=MAX_LEN, padding="post", truncating="post")
-#     preds = get_hate_model().predict(padded, verbose=0)
-
-#     results = []
-#     for p in preds:
-#         cls_idx = int(np.argmax(p))
-#         cls_prob = float(np.max(p))
-#         if cls_prob < confidence_threshold:
-#             results.append("uncertain")
-#         else:
-#             results.append(CLASS_MAPPING[cls_idx])
-#     return results
-
-
-# def predict_class(message: str, confidence_threshold: float = 0.0) -> str:
-#     return predict_classes([message], confidence_threshold=confidence_threshold)[0]
-
-
-# def is_offensive(message: str, confidence_threshold: float = 0.0) -> bool:
-#     cls = predict_class(message, confidence_threshold=confidence_threshold)
-#     return cls in OFFENSIVE_CLASSES
-
-
-# def are_offensive(messages: list[str], confidence_threshold: float = 0.0) -> list[bool]:
-#     classes = predict_classes(messages, confidence_threshold=confidence_threshold)
-#     return [cls in OFFENSIVE_CLASSES for cls in classes]
-
-
-# # ----------------------------
-# # Optional: warmup (call once at startup)
-# # ----------------------------
-# def warmup():
-#     """Preload model + tokenizer into memory at startup (optional)."""
-#     _load_once()
-
-
-# # ----------------------------
-# # Example usage
-# # ----------------------------
-# if __name__ == "__main__":
-#     # Uncomment this if you want to warmup manually
-#     # warmup()
-
-#     test_texts = [
-#         "fuck you",
-#         "I love you",
-#         "you are amazing",
-#         "please help me",
-#         "random unknown words",
-#     ]
-#     preds = predict_classes(test_texts, confidence_threshold=0.5)
-#     blocked = are_offensive(test_texts, confidence_threshold=0.5)
-
-#     for t, p, b in zip(test_texts, preds, blocked):
-#         print(f"Text: {t} --> Prediction: {p} | Blocked: {b}")
-def is_offensive(message):
-    return False
\ No newline at end of file
+# apps/chat/utils.py
+import asyncio
+import functools
+import json
+import logging
+import os
+import queue
+import string
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from .prefilter import Prefilter
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Constants
+# ----------------------------
+MAX_LEN = 50  # must match training
+ESSENTIAL_WORDS = {"i", "you", "love", "hate", "not", "no", "please", "thanks"}
+
+CLASS_MAPPING = {0: "hate", 1: "offensive", 2: "neutral"}
+OFFENSIVE_CLASSES = {"hate", "offensive"}
+
+# ----------------------------
+# Runtimes
+# ----------------------------
+def pad_sequences(seqs, maxlen=MAX_LEN):
+    """Post-pad/truncate to ``maxlen`` (keras ``pad_sequences(padding="post", truncating="post")``)."""
+    import numpy as np
+
+    padded = np.zeros((len(seqs), maxlen), dtype=np.int32)
+    for i, seq in enumerate(seqs):
+        seq = seq[:maxlen]
+        padded[i, :len(seq)] = seq
+    return padded
+
+
+class KerasRuntime:
+    """The trained .keras model and pickled keras Tokenizer; imports all of TensorFlow."""
+
+    name = "keras"
+
+    def __init__(self):
+        for path in (settings.MODERATION_MODEL_PATH, settings.MODERATION_TOKENIZER_PATH):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Moderation model file not found at {path}")
+        # Suppress TF logs
+        os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+        logging.getLogger("tensorflow").setLevel(logging.ERROR)
+        import joblib
+        from tensorflow.keras.models import load_model
+
+        self.tokenizer = joblib.load(settings.MODERATION_TOKENIZER_PATH)
+        self.model = load_model(settings.MODERATION_MODEL_PATH)
+
+    def texts_to_sequences(self, texts):
+        return self.tokenizer.texts_to_sequences(texts)
+
+    def predict(self, padded):
+        import numpy as np
+
+        # predict_on_batch skips predict()'s per-call dataset/callback setup
+        return np.asarray(self.model.predict_on_batch(padded))
+
+
+class OnnxRuntime:
+    """The int8 ONNX export (``manage.py export_moderation_onnx``) on onnxruntime's CPU provider.
+
+    The tokenizer is the exported vocabulary, so TensorFlow is never imported.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path=None, vocab_path=None):
+        model_path = model_path or settings.MODERATION_ONNX_PATH
+        vocab_path = vocab_path or settings.MODERATION_VOCAB_PATH
+        for path in (model_path, vocab_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Moderation model file not found at {path}")
+        import onnxruntime
+
+        with open(vocab_path, encoding="utf-8") as f:
+            vocab = json.load(f)
+        self.word_index = vocab["word_index"]
+        self.filters = str.maketrans(vocab["filters"], vocab["split"] * len(vocab["filters"]))
+        self.split = vocab["split"]
+        self.lower = vocab["lower"]
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = settings.MODERATION_NUM_THREADS or 0  # 0: onnxruntime's default
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def texts_to_sequences(self, texts):
+        """Same ids as the keras Tokenizer: words outside ``num_words`` are dropped."""
+        sequences = []
+        for text in texts:
+            if self.lower:
+                text = text.lower()
+            words = text.translate(self.filters).split(self.split)
+            sequences.append([self.word_index[w] for w in words if w in self.word_index])
+        return sequences
+
+    def predict(self, padded):
+        return self.session.run(None, {self.input_name: padded})[0]
+
+
+MODERATION_RUNTIMES = {"keras": KerasRuntime, "onnx": OnnxRuntime}
+
+# ----------------------------
+# Globals for lazy caching
+# ----------------------------
+_runtime = None
+_load_error = None
+_load_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _preprocessing():
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+
+    return set(stopwords.words("english")) - ESSENTIAL_WORDS, WordNetLemmatizer()
+
+
+def _onnx_available():
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+    return os.path.exists(settings.MODERATION_ONNX_PATH) and os.path.exists(settings.MODERATION_VOCAB_PATH)
+
+
+def load_runtime(name=None):
+    """Build a runtime: MODERATION_RUNTIME, where "auto" prefers ONNX when it is exported and installed."""
+    name = name or settings.MODERATION_RUNTIME
+    if name == "auto":
+        name = "onnx" if _onnx_available() else "keras"
+    return MODERATION_RUNTIMES[name]()
+
+
+def _load_once():
+    """Lazy-load the runtime and text preprocessing only once per worker.
+
+    A failed load is remembered, so a missing model costs one log line rather
+    than a disk probe per message.
+    """
+    global _runtime, _load_error
+
+    with _load_lock:
+        if _load_error is not None:
+            raise _load_error
+        if _runtime is not None:
+            return
+        try:
+            started = time.monotonic()
+            _preprocessing()
+            _runtime = load_runtime()
+            logger.info("Loaded %s moderation runtime in %.1fs", _runtime.name, time.monotonic() - started)
+        except Exception as e:
+            _load_error = e
+            logger.warning("Moderation model unavailable, messages are not screened: %s", e)
+            raise
+
+
+def get_runtime():
+    _load_once()
+    return _runtime
+
+
+# ----------------------------
+# Text preprocessing
+# ----------------------------
+def clean_text(text: str) -> str:
+    stop_words, lemmatizer = _preprocessing()
+    text = str(text).lower()
+    text = text.translate(str.maketrans("", "", string.punctuation))
+    words = [
+        lemmatizer.lemmatize(word)
+        for word in text.split()
+        if word not in stop_words
+    ]
+    return " ".join(words)
+
+
+# ----------------------------
+# Prediction
+# ----------------------------
+def predict_probabilities(messages: list[str], runtime=None):
+    """Class probabilities for a batch of messages, from one forward pass."""
+    runtime = runtime or get_runtime()
+    texts = [clean_text(m) for m in messages]
+    seqs = runtime.texts_to_sequences(texts)
+    seqs = [[0] if not s else s for s in seqs]  # fallback for empty seqs
+    return runtime.predict(pad_sequences(seqs, maxlen=MAX_LEN))
+
+
+def label(probabilities, confidence_threshold: float = 0.0) -> str:
+    cls_idx = max(range(len(probabilities)), key=lambda i: probabilities[i])
+    if float(probabilities[cls_idx]) < confidence_threshold:
+        return "uncertain"
+    return CLASS_MAPPING[cls_idx]
+
+
+def predict_classes(messages: list[str], confidence_threshold: float = 0.0) -> list[str]:
+    if not messages:
+        return []
+    return [label(p, confidence_threshold) for p in predict_probabilities(messages)]
+
+
+# ----------------------------
+# Micro-batching service
+# ----------------------------
+class ModerationService:
+    """Collects concurrent classification requests into micro-batches.
+
+    ``submit`` queues a message and returns a Future. A single worker thread
+    takes up to ``max_batch_size`` queued messages, waiting at most
+    ``max_wait_ms`` after the first for others to arrive, and classifies them
+    with one forward pass. HTTP views and websocket consumers in the same
+    process share the batches, and only the worker thread touches the model.
+    """
+
+    def __init__(self, predict=predict_probabilities, max_batch_size=None, max_wait_ms=None):
+        self.predict = predict
+        self.max_batch_size = max_batch_size or settings.MODERATION_BATCH_SIZE
+        self.max_wait = (settings.MODERATION_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000.0
+        self.batches = 0
+        self.messages = 0
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, message, confidence_threshold=0.0):
+        future = Future()
+        self._queue.put((message, confidence_threshold, future))
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="moderation", daemon=True)
+                    self._worker.start()
+        return future
+
+    def classify(self, message, confidence_threshold=0.0):
+        return self.submit(message, confidence_threshold).result()
+
+    async def aclassify(self, message, confidence_threshold=0.0):
+        return await asyncio.wrap_future(self.submit(message, confidence_threshold))
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                probabilities = self.predict([message for message, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, threshold, future), p in zip(batch, probabilities):
+                    future.set_result(label(p, threshold))
+            self.batches += 1
+            self.messages += len(batch)
+
+
+moderation = ModerationService()
+prefilter = Prefilter()
+
+
+def predict_class(message: str, confidence_threshold: float = 0.0) -> str:
+    return moderation.classify(message, confidence_threshold)
+
+
+def _threshold(confidence_threshold):
+    if confidence_threshold is None:
+        return settings.MODERATION_CONFIDENCE_THRESHOLD
+    return confidence_threshold
+
+
+def _model_verdict(message, confidence_threshold, future):
+    """Cache the model's answer; a message passes if the model is unavailable."""
+    try:
+        verdict = future.result()
+    except Exception:
+        prefilter.count("unscreened")
+        return False
+    prefilter.remember(message, confidence_threshold, verdict)
+    return verdict in OFFENSIVE_CLASSES
+
+
+def is_offensive(message: str, confidence_threshold: float = None) -> bool:
+    """Whether ``message`` should be blocked.
+
+    The prefilter settles most messages; only the rest are batched to the model.
+    """
+    confidence_threshold = _threshold(confidence_threshold)
+    verdict = prefilter.check(message, confidence_threshold)
+    if verdict is not None:
+        return verdict in OFFENSIVE_CLASSES
+    if _load_error is not None:
+        prefilter.count("unscreened")
+        return False
+    return _model_verdict(message, confidence_threshold, moderation.submit(message, confidence_threshold))
+
+
+async def ais_offensive(message: str, confidence_threshold: float = None) -> bool:
+    """is_offensive for async callers; awaits the batch without blocking the event loop."""
+    confidence_threshold = _threshold(confidence_threshold)
+    verdict = prefilter.check(message, confidence_threshold)
+    if verdict is not None:
+        return verdict in OFFENSIVE_CLASSES
+    if _load_error is not None:
+        prefilter.count("unscreened")
+        return False
+    future = moderation.submit(message, confidence_threshold)
+    try:
+        await asyncio.wrap_future(future)
+    except Exception:
+        pass
+    return _model_verdict(message, confidence_threshold, future)
+
+
+def are_offensive(messages: list[str], confidence_threshold: float = None) -> list[bool]:
+    confidence_threshold = _threshold(confidence_threshold)
+    pending = {}
+    results = []
+    for i, message in enumerate(messages):
+        verdict = prefilter.check(message, confidence_threshold)
+        if verdict is None and _load_error is None:
+            pending[i] = moderation.submit(message, confidence_threshold)
+        elif verdict is None:
+            prefilter.count("unscreened")
+        results.append(verdict in OFFENSIVE_CLASSES)
+    for i, future in pending.items():
+        results[i] = _model_verdict(messages[i], confidence_threshold, future)
+    return results
+
+
+def warmup():
+    """Preload model + tokenizer into memory at startup (optional)."""
+    try:
+        _load_once()
+    except Exception:
+        pass
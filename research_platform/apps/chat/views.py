@@ -2,7 +2,8 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.views.generic import TemplateView, ListView
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.contrib import messages
@@ -11,6 +12,9 @@ from .models import ChatRoom, ChatMessage
 from apps.papers.models import Paper
 from apps.groups.models import Group
 from apps.chat.utils import is_offensive
+from .history import history_page, parse_cursor, serialize_message
+from .retrieval import bot_reply
+from .rooms import can_read, can_use_group, resolver
 import json
 
 class ChatRoomView(LoginRequiredMixin, TemplateView):
@@ -29,28 +33,27 @@ class ChatRoomView(LoginRequiredMixin, TemplateView):
             defaults={'created_by': self.request.user}
         )
         
-        # Get only the last 3 messages for this room
-        last_three = ChatMessage.objects.filter(room=chat_room) \
-                                        .select_related('user') \
-                                        .order_by('-timestamp')
-        # Reverse so oldest of the 3 appears first
-        messages = list(reversed(last_three))
+        # Only the latest page; older messages are fetched from chat:history
+        messages, history_cursor = history_page(chat_room)
         
         context['paper'] = paper
         context['chat_room'] = chat_room
         context['messages'] = messages
+        context['history_cursor'] = history_cursor
         
         return context
     
     def post(self, request, paper_id):
         """Handle message posting via AJAX"""
-        paper = get_object_or_404(Paper, pk=paper_id, is_approved=True)
-        chat_room, created = ChatRoom.objects.get_or_create(
-            paper=paper,
-            defaults={'created_by': request.user}
-        )
+        # Cached: a post costs the message insert, not paper/room lookups
+        room_id, is_active = resolver.for_paper(paper_id, request.user)
         
         message_text = request.POST.get('message', '').strip()
+        if message_text and not is_active:
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'status': 'error', 'message': 'This discussion is closed'})
+            messages.error(request, "This discussion is closed.")
+            return redirect('chat:paper_chat', paper_id=paper_id)
         if message_text:
             # Save message to database
             if is_offensive(message_text):
@@ -59,16 +62,16 @@ class ChatRoomView(LoginRequiredMixin, TemplateView):
                 messages.error(request, "Your message was blocked as offensive.")
                 return redirect('chat:paper_chat', paper_id=paper_id)
             chat_message = ChatMessage.objects.create(
-                room=chat_room,
+                room_id=room_id,
                 user=request.user,
                 message=message_text
             )
             
             # Generate bot response if message starts with @bot
             if message_text.startswith('@bot'):
-                bot_response = self.generate_bot_response(message_text, paper)
+                bot_response = self.generate_bot_response(message_text, paper_id)
                 ChatMessage.objects.create(
-                    room=chat_room,
+                    room_id=room_id,
                     user=None,  # Bot messages have no user
                     message=bot_response,
                     is_bot_message=True
@@ -79,29 +82,23 @@ class ChatRoomView(LoginRequiredMixin, TemplateView):
         
         return redirect('chat:paper_chat', paper_id=paper_id)
     
-    def generate_bot_response(self, message, paper):
-        """Generate simple bot response"""
-        message_lower = message.lower()
-        
-        if 'abstract' in message_lower:
-            return f"The abstract of this paper is: {paper.abstract[:200]}..."
-        elif 'author' in message_lower:
-            return f"The authors of this paper are: {paper.authors}"
-        elif 'date' in message_lower or 'year' in message_lower:
-            return f"This paper was published on: {paper.publication_date}"
-        elif 'category' in message_lower or 'topic' in message_lower:
-            categories = ", ".join([cat.name for cat in paper.categories.all()])
-            return f"This paper belongs to the following categories: {categories}"
-        else:
-            return "I'm a research assistant bot. You can ask me about the paper's abstract, authors, publication date, or categories."
+    def generate_bot_response(self, message, paper_id):
+        """Answer from the paper's passages (apps.chat.retrieval)"""
+        return bot_reply(paper_id, message[len('@bot'):])
 
 @login_required
 @csrf_exempt
 def send_message_ajax(request, room_id):
     """AJAX endpoint for sending messages"""
     if request.method == 'POST':
+        if not can_read(room_id, request.user):
+            return JsonResponse({'status': 'error', 'message': 'You are not a member of this group'}, status=403)
         try:
-            chat_room = get_object_or_404(ChatRoom, pk=room_id)
+            state = resolver.for_room(room_id)
+            if state is None:
+                raise Http404("No chat room matches the given query.")
+            if not state[1]:
+                return JsonResponse({'status': 'error', 'message': 'This discussion is closed'})
             message_text = request.POST.get('message', '').strip()
             
             if message_text:
@@ -109,7 +106,7 @@ def send_message_ajax(request, room_id):
                     return JsonResponse({'status': 'error', 'message': 'Message flagged as offensive'})
                 # Save message
                 chat_message = ChatMessage.objects.create(
-                    room=chat_room,
+                    room_id=room_id,
                     user=request.user,
                     message=message_text
                 )
@@ -124,9 +121,10 @@ def send_message_ajax(request, room_id):
                 
                 # Generate bot response if needed
                 if message_text.startswith('@bot'):
-                    bot_response = generate_simple_bot_response(message_text, chat_room.paper)
+                    paper_id = ChatRoom.objects.filter(pk=room_id).values_list('paper_id', flat=True).first()
+                    bot_response = generate_simple_bot_response(message_text, paper_id)
                     bot_message = ChatMessage.objects.create(
-                        room=chat_room,
+                        room_id=room_id,
                         user=None,
                         message=bot_response,
                         is_bot_message=True
@@ -144,18 +142,9 @@ def send_message_ajax(request, room_id):
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request'})
 
-def generate_simple_bot_response(message, paper):
-    """Simple bot response generator"""
-    message_lower = message.lower()
-    
-    if 'abstract' in message_lower:
-        return f"The abstract: {paper.abstract[:150]}..."
-    elif 'author' in message_lower:
-        return f"Authors: {paper.authors}"
-    elif 'date' in message_lower:
-        return f"Published: {paper.publication_date}"
-    else:
-        return "I can help you with information about this paper's abstract, authors, or publication date."
+def generate_simple_bot_response(message, paper_id):
+    """Bot reply for the AJAX endpoint; rooms without a paper get a pointer to paper rooms"""
+    return bot_reply(paper_id, message[len('@bot'):])
 
 class ChatDetailView(LoginRequiredMixin, TemplateView):
     template_name = 'chat/detail.html'
@@ -163,14 +152,37 @@ class ChatDetailView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         room_id = kwargs['room_id']
+        if not can_read(room_id, self.request.user):
+            raise PermissionDenied("You are not a member of this group")
         chat_room = get_object_or_404(ChatRoom, pk=room_id)
         
+        messages, history_cursor = history_page(chat_room)
         context['chat_room'] = chat_room
         context['paper'] = chat_room.paper
-        context['messages'] = ChatMessage.objects.filter(room=chat_room).select_related('user').order_by('timestamp')
+        context['messages'] = messages
+        context['history_cursor'] = history_cursor
         
         return context
 
+@login_required
+def chat_history(request, room_id):
+    """Older messages for infinite scroll: ``?before=<timestamp,id>&limit=<n>``"""
+    if not can_read(room_id, request.user):
+        return JsonResponse({'status': 'error', 'message': 'You are not a member of this group'}, status=403)
+    before = request.GET.get('before')
+    try:
+        before = parse_cursor(before) if before else None
+        limit = int(request.GET.get('limit', 0)) or None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid cursor or limit'}, status=400)
+
+    messages, next_cursor = history_page(room_id, before=before, limit=limit)
+    return JsonResponse({
+        'status': 'success',
+        'messages': [serialize_message(message) for message in messages],
+        'next_cursor': next_cursor,
+    })
+
 class MyChatRoomsView(LoginRequiredMixin, ListView):
     model = ChatRoom
     template_name = 'chat/my_chats.html'
@@ -191,30 +203,35 @@ class GroupChatRoomView(ChatRoomView):
         context = super(TemplateView, self).get_context_data(**kwargs)
         group_id = kwargs['group_id']
         
+        if not can_use_group(group_id, self.request.user):
+            raise PermissionDenied("You are not a member of this group")
         group = get_object_or_404(Group, pk=group_id)
         chat_room, created = ChatRoom.objects.get_or_create(
             group=group,
             defaults={'created_by': self.request.user}
         )
         
-        last_three = ChatMessage.objects.filter(room=chat_room) \
-                                        .select_related('user') \
-                                        .order_by('-timestamp')
-        messages = list(reversed(last_three))
+        messages, history_cursor = history_page(chat_room)
         
         context['group'] = group
         context['chat_room'] = chat_room
         context['messages'] = messages
+        context['history_cursor'] = history_cursor
         return context
 
     def post(self, request, group_id):
-        group = get_object_or_404(Group, pk=group_id)
-        chat_room, created = ChatRoom.objects.get_or_create(
-            group=group,
-            defaults={'created_by': request.user}
-        )
+        if not can_use_group(group_id, request.user):
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'status': 'error', 'message': 'You are not a member of this group'}, status=403)
+            raise PermissionDenied("You are not a member of this group")
+        room_id, is_active = resolver.for_group(group_id, request.user)
         
         message_text = request.POST.get('message', '').strip()
+        if message_text and not is_active:
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'status': 'error', 'message': 'This discussion is closed'})
+            messages.error(request, "This discussion is closed.")
+            return redirect('chat:group_chat', group_id=group_id)
         if message_text:
             if is_offensive(message_text):
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -223,7 +240,7 @@ class GroupChatRoomView(ChatRoomView):
                 return redirect('chat:group_chat', group_id=group_id)
             #save only if safe
             ChatMessage.objects.create(
-                room=chat_room,
+                room_id=room_id,
                 user=request.user,
                 message=message_text
             )
@@ -116,6 +116,7 @@ from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 from django.db.models import Count
 from apps.papers.models import Paper, Rating, Bookmark
+from apps.papers.utils import get_paper_text
 from apps.ml_engine.models import PaperEmbedding, UserRecommendation
 from apps.accounts.models import User
 
@@ -125,9 +126,18 @@ class ImprovedRecommendationEngine:
         # Use a lightweight, well-performing sentence-transformer model
         self.model = SentenceTransformer('all-MiniLM-L6-v2')
 
+    def document_text(self, paper):
+        # Provisional extractive or final abstractive, whichever exists; not status messages
+        summary = paper.summary if paper.summary_source else ''
+        text = f"{paper.title} {summary} {paper.abstract or ''}"
+        if not (summary or paper.abstract):
+            # Fall back to the cached PDF text; embedding builds never extract PDFs themselves
+            text += " " + get_paper_text(paper, extract=False)[:2000]
+        return text
+
     def build_embeddings(self):
         papers = Paper.objects.filter(is_approved=True)
-        docs = [f"{p.title} {p.summary or ''} {p.abstract or ''}" for p in papers]
+        docs = [self.document_text(p) for p in papers]
         embeddings = self.model.encode(docs, convert_to_numpy=True)
         for paper, emb in zip(papers, embeddings):
             PaperEmbedding.objects.update_or_create(
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Paper, Category, Bookmark, Rating, Citation, ReadingProgress
+from apps.chat.signals import invalidate_paper_rooms
+from .models import Paper, Category, Bookmark, Rating, Citation, ReadingProgress, BackgroundJob
+from .cache import invalidate_homepage_snapshot
 
 @admin.register(Paper)
 class PaperAdmin(admin.ModelAdmin):
@@ -9,13 +11,20 @@ class PaperAdmin(admin.ModelAdmin):
     actions = ['approve_papers', 'reject_papers']
     
     def approve_papers(self, request, queryset):
-        queryset.update(is_approved=True)
+        self.set_approval(queryset, True)
     approve_papers.short_description = "Approve selected papers"
     
     def reject_papers(self, request, queryset):
-        queryset.update(is_approved=False)
+        self.set_approval(queryset, False)
     reject_papers.short_description = "Reject selected papers"
 
+    def set_approval(self, queryset, is_approved):
+        # update() sends no post_save, so clear what the Paper signals would have
+        paper_ids = list(queryset.values_list('pk', flat=True))
+        queryset.update(is_approved=is_approved)
+        invalidate_homepage_snapshot()
+        invalidate_paper_rooms(paper_ids)
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'description']
@@ -35,3 +44,10 @@ class RatingAdmin(admin.ModelAdmin):
 class CitationAdmin(admin.ModelAdmin):
     list_display = ['citing_paper', 'cited_paper']
     search_fields = ['citing_paper__title', 'cited_paper__title']
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'paper', 'status', 'priority', 'attempts', 'available_at', 'locked_by', 'updated_at']
+    list_filter = ['task', 'status']
+    search_fields = ['paper__title', 'last_error']
+    raw_id_fields = ['paper']
@@ -1,4 +1,123 @@
 # apps/papers/background.py
-from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+import traceback
+from datetime import timedelta
 
-executor = ThreadPoolExecutor(max_workers=4)
\ No newline at end of file
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# task name -> (handler, called with the paper id; on-failure hook after the last attempt, or None)
+TASKS = {
+    'summarize': ('apps.papers.signals.process_summary', 'apps.papers.signals.summary_failed'),
+    'extractive_summary': ('apps.papers.signals.process_extractive_summary', None),
+}
+
+PRIORITY_PROVISIONAL = 20  # seconds of work that shows the uploader something quickly
+PRIORITY_UPLOAD = 10  # a user is waiting on the result
+PRIORITY_BULK = 0     # imports and backfills
+
+
+def queue_depth():
+    return BackgroundJob.objects.filter(status__in=('queued', 'running')).count()
+
+
+def enqueue(task, paper_id, priority=0):
+    """Queue ``task`` for a paper; an identical job that is still queued is reused.
+
+    This is a single insert, so request latency does not depend on how busy
+    the workers are.
+    """
+    if task not in TASKS:
+        raise ValueError(f"Unknown background task: {task}")
+    job = BackgroundJob.objects.filter(task=task, paper_id=paper_id, status='queued').first()
+    if job is not None:
+        if priority > job.priority:
+            BackgroundJob.objects.filter(pk=job.pk).update(priority=priority)
+        return job
+    return BackgroundJob.objects.create(
+        task=task, paper_id=paper_id, priority=priority,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_many(task, paper_ids, priority=0):
+    """enqueue() for many papers with one read and batched inserts, for bulk producers."""
+    if task not in TASKS:
+        raise ValueError(f"Unknown background task: {task}")
+    queued = set(BackgroundJob.objects.filter(
+        task=task, paper_id__in=paper_ids, status='queued'
+    ).values_list('paper_id', flat=True))
+    return BackgroundJob.objects.bulk_create([
+        BackgroundJob(task=task, paper_id=paper_id, priority=priority, max_attempts=settings.JOB_MAX_ATTEMPTS)
+        for paper_id in dict.fromkeys(paper_ids) if paper_id not in queued
+    ], batch_size=500)
+
+
+def wait_for_capacity(max_depth=None, poll_interval=None):
+    """Block a bulk producer until the queue is shallower than ``max_depth``."""
+    max_depth = max_depth or settings.JOB_QUEUE_MAX_DEPTH
+    poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+    while queue_depth() >= max_depth:
+        time.sleep(poll_interval)
+
+
+def claim_jobs(worker_id, limit=1):
+    """Claim up to ``limit`` runnable jobs for this worker.
+
+    Each claim is a conditional UPDATE on the job's attempt count, so two workers
+    can never win the same job, on any database backend. A running job whose
+    visibility timeout has passed is assumed abandoned and can be claimed again.
+    """
+    now = timezone.now()
+    expired = Q(status='running', locked_until__lt=now)
+    BackgroundJob.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+        status='failed', locked_until=None, locked_by='', updated_at=now,
+        last_error='Visibility timeout expired on the final attempt',
+    )
+
+    candidates = BackgroundJob.objects.filter(
+        Q(status='queued', available_at__lte=now) | expired
+    ).order_by('-priority', 'available_at', 'id').values_list('id', 'attempts')[:limit * 4]
+
+    claimed = []
+    for job_id, attempts in candidates:
+        if len(claimed) >= limit:
+            break
+        won = BackgroundJob.objects.filter(
+            Q(status='queued') | expired, pk=job_id, attempts=attempts
+        ).update(
+            status='running', attempts=attempts + 1, locked_by=worker_id, updated_at=now,
+            locked_until=now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+        )
+        if won:
+            claimed.append(job_id)
+    return list(BackgroundJob.objects.filter(pk__in=claimed).order_by('-priority', 'available_at', 'id'))
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns True on success."""
+    handler, on_failure = TASKS[job.task]
+    # Only the worker still holding the claim may record the result
+    owned = BackgroundJob.objects.filter(pk=job.pk, locked_by=job.locked_by, attempts=job.attempts)
+    try:
+        import_string(handler)(job.paper_id)
+    except Exception:
+        logger.exception("Job %s (%s, paper %s) failed on attempt %s", job.pk, job.task, job.paper_id, job.attempts)
+        now = timezone.now()
+        fields = {'last_error': traceback.format_exc()[-4000:], 'locked_until': None, 'locked_by': '', 'updated_at': now}
+        if job.attempts >= job.max_attempts:
+            if owned.update(status='failed', **fields) and on_failure:
+                import_string(on_failure)(job.paper_id)
+        else:
+            delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            owned.update(status='queued', available_at=now + timedelta(seconds=delay), **fields)
+        return False
+    owned.update(status='done', locked_until=None, last_error='', updated_at=timezone.now())
+    return True
@@ -0,0 +1,194 @@
+# apps/papers/cache.py
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Paper, Category
+
+HOMEPAGE_SNAPSHOT_KEY = 'papers:homepage:snapshot'
+HOMEPAGE_FRESH_KEY = 'papers:homepage:fresh'
+HOMEPAGE_LOCK_KEY = 'papers:homepage:lock'
+
+
+def build_homepage_snapshot():
+    """Run the homepage queries once and return plain, picklable data."""
+    recent_papers = list(
+        Paper.objects.filter(is_approved=True)
+        .order_by('-created_at')
+        .values('pk', 'title', 'abstract', 'authors', 'created_at')[:6]
+    )
+    popular_categories = list(
+        Category.objects.annotate(
+            paper_count=Count('paper', filter=Q(paper__is_approved=True))
+        ).order_by('-paper_count').values('pk', 'name', 'description', 'paper_count')[:6]
+    )
+    since = timezone.now() - timedelta(days=settings.HOMEPAGE_TRENDING_DAYS)
+    trending_papers = list(
+        Paper.objects.filter(is_approved=True)
+        .annotate(recent_views=Count('paperview', filter=Q(paperview__viewed_at__gte=since)))
+        .filter(recent_views__gt=0)
+        .order_by('-recent_views', '-view_count')
+        .values('pk', 'title', 'authors', 'view_count', 'recent_views')[:6]
+    )
+    return {
+        'recent_papers': recent_papers,
+        'popular_categories': popular_categories,
+        'trending_papers': trending_papers,
+        'built_at': timezone.now(),
+    }
+
+
+def refresh_homepage_snapshot():
+    snapshot = build_homepage_snapshot()
+    cache.set(HOMEPAGE_SNAPSHOT_KEY, snapshot, None)
+    cache.set(HOMEPAGE_FRESH_KEY, True, settings.HOMEPAGE_SNAPSHOT_TTL)
+    return snapshot
+
+
+def invalidate_homepage_snapshot():
+    """Mark the snapshot stale; it keeps being served until one request rebuilds it."""
+    cache.delete(HOMEPAGE_FRESH_KEY)
+
+
+def get_homepage_snapshot():
+    cached = cache.get_many([HOMEPAGE_SNAPSHOT_KEY, HOMEPAGE_FRESH_KEY])
+    snapshot = cached.get(HOMEPAGE_SNAPSHOT_KEY)
+    if snapshot is None:
+        return refresh_homepage_snapshot()
+    if HOMEPAGE_FRESH_KEY not in cached and cache.add(HOMEPAGE_LOCK_KEY, True, 30):
+        # Only the request holding the lock rebuilds; everyone else serves the stale copy
+        try:
+            snapshot = refresh_homepage_snapshot()
+        finally:
+            cache.delete(HOMEPAGE_LOCK_KEY)
+    return snapshot
+
+
+# ---------- Template fragment caching ----------
+FRAGMENT_NAMES = ('paper_card', 'paper_meta', 'paper_ratings', 'paper_citations')
+FRAGMENT_VERSION_KINDS = ('ratings', 'citations')
+FRAGMENT_STATS_KEY = 'papers:fragments:stats:{name}:{outcome}'
+
+
+def _version_key(kind, paper_id):
+    return f'papers:version:{kind}:{paper_id}'
+
+
+def get_paper_versions(paper_id):
+    """Return the current aggregate versions ({'ratings': ..., 'citations': ...}) of a paper.
+
+    Versions are nanosecond timestamps rather than counters, so a version key
+    evicted from the cache comes back as a new value instead of an old one.
+    """
+    keys = {kind: _version_key(kind, paper_id) for kind in FRAGMENT_VERSION_KINDS}
+    cached = cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in cached:
+            # add() keeps whichever concurrent request initialised the key first
+            cache.add(key, time.time_ns(), None)
+            cached[key] = cache.get(key)
+    return {kind: cached[key] for kind, key in keys.items()}
+
+
+def bump_paper_versions(paper_ids, kind):
+    """Invalidate the cached fragments that depend on ``kind`` for these papers."""
+    version = time.time_ns()
+    cache.set_many({_version_key(kind, paper_id): version for paper_id in set(paper_ids)}, None)
+
+
+API_LIST_VERSION_KEY = 'papers:version:api_lists'
+
+
+def get_api_list_version():
+    """Version of the rows the API lists embed but don't fingerprint themselves (see ETagListMixin)."""
+    version = cache.get(API_LIST_VERSION_KEY)
+    if version is None:
+        cache.add(API_LIST_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(API_LIST_VERSION_KEY)
+    return version
+
+
+def bump_api_list_version():
+    cache.set(API_LIST_VERSION_KEY, time.time_ns(), None)
+
+
+def record_fragment_lookup(name, hit):
+    """Count a sample of lookups, each weighted to stand for 1/rate of them.
+
+    Counting every render would cost a cache round trip per fragment on the
+    path the fragments exist to speed up.
+    """
+    rate = settings.FRAGMENT_STATS_SAMPLE_RATE
+    if not rate or random.random() >= rate:
+        return
+    weight = max(1, round(1 / rate))
+    key = FRAGMENT_STATS_KEY.format(name=name, outcome='hits' if hit else 'misses')
+    try:
+        cache.incr(key, weight)
+    except ValueError:
+        cache.set(key, weight, None)
+
+
+def fragment_cache_stats(names):
+    """Return {name: {'hits': int, 'misses': int, 'hit_rate': float}}, estimated from the sample."""
+    keys = {
+        (name, outcome): FRAGMENT_STATS_KEY.format(name=name, outcome=outcome)
+        for name in names for outcome in ('hits', 'misses')
+    }
+    cached = cache.get_many(keys.values())
+    stats = {}
+    for name in names:
+        hits = cached.get(keys[(name, 'hits')], 0)
+        misses = cached.get(keys[(name, 'misses')], 0)
+        total = hits + misses
+        stats[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+    return stats
+
+
+# ---------- Paper detail page ----------
+def build_paper_public_context(paper):
+    """Collect the detail-page data shared by every viewer in three queries."""
+    from .models import Citation, Rating
+
+    ratings = [
+        {
+            'username': rating.user.username,
+            'rating': rating.rating,
+            'review_text': rating.review_text,
+            'created_at': rating.created_at,
+        }
+        for rating in Rating.objects.filter(paper=paper).select_related('user').order_by('-created_at')
+    ]
+    citing_papers, cited_papers = [], []
+    links = Citation.objects.filter(
+        Q(cited_paper=paper) | Q(citing_paper=paper)
+    ).values_list('citing_paper_id', 'citing_paper__title', 'cited_paper_id', 'cited_paper__title')
+    for citing_id, citing_title, cited_id, cited_title in links:
+        if cited_id == paper.pk:
+            citing_papers.append({'pk': citing_id, 'title': citing_title})
+        else:
+            cited_papers.append({'pk': cited_id, 'title': cited_title})
+    return {
+        'categories': list(paper.categories.values_list('name', flat=True)),
+        'ratings': ratings,
+        'rating_count': len(ratings),
+        'average_rating': sum(r['rating'] for r in ratings) / len(ratings) if ratings else 0,
+        'citing_papers': citing_papers,
+        'cited_papers': cited_papers,
+    }
+
+
+def get_paper_public_context(paper, versions):
+    key = 'papers:detail:{}:{}:{}:{}'.format(
+        paper.pk, paper.updated_at.timestamp(), versions['ratings'], versions['citations']
+    )
+    context = cache.get(key)
+    if context is None:
+        context = build_paper_public_context(paper)
+        cache.set(key, context, settings.FRAGMENT_CACHE_TIMEOUT)
+    return context
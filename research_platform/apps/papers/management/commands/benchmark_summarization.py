@@ -0,0 +1,147 @@
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.papers.utils import extract_text_from_pdf
+from ml_models import bart_summarizer_lambda, lambda_function
+from ml_models.stub_server import StubServer
+
+SYNTHETIC_WORDS = (
+    'model data training results method network learning attention graph retrieval '
+    'citation baseline accuracy dataset experiment evaluation analysis performance'
+).split()
+
+
+def synthetic_text(words, rng):
+    sentences, total = [], 0
+    while total < words:
+        length = rng.randint(8, 30)
+        sentences.append(' '.join(rng.choice(SYNTHETIC_WORDS) for _ in range(length)).capitalize() + '.')
+        total += length
+    return ' '.join(sentences)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the summarization pipeline (chunking, lambda_handler and the Django client) '
+            'against a local inference stand-in, sequentially and concurrently')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pdf-dir', help='Directory of sample PDFs used as the corpus')
+        parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                            help='Add N generated documents (when no PDFs are at hand)')
+        parser.add_argument('--synthetic-words', type=int, default=6000)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds per inference call')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls failing with 503')
+        parser.add_argument('--backoff', type=float, default=0.05,
+                            help='Base retry backoff in seconds (production default is 1.0)')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Concurrent chunk calls per paper and papers in flight (concurrent mode)')
+        parser.add_argument('--max-words', type=int, default=400, help='Words per chunk')
+        parser.add_argument('--client', action='store_true',
+                            help='Go through the Django client and a gateway in front of lambda_handler')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        corpus = []
+        if options['pdf_dir']:
+            pdf_dir = Path(options['pdf_dir'])
+            if not pdf_dir.is_dir():
+                raise CommandError(f'Not a directory: {pdf_dir}')
+            corpus += [(pdf.name, extract_text_from_pdf(str(pdf))) for pdf in sorted(pdf_dir.glob('*.pdf'))]
+        corpus += [(f'synthetic-{i}', synthetic_text(options['synthetic_words'], rng))
+                   for i in range(options['synthetic'])]
+        corpus = [(name, text) for name, text in corpus if text.strip()]
+        if not corpus:
+            raise CommandError('Empty corpus: pass --pdf-dir and/or --synthetic N')
+
+        self.options = options
+        self.report_chunking(corpus)
+
+        server = StubServer(
+            latency=options['latency'], error_rate=options['error_rate'], seed=options['seed'],
+            gateway_handler=lambda_function.lambda_handler if options['client'] else None,
+        ).start()
+        saved = (lambda_function.HF_API_BASE, lambda_function.HF_API_TOKEN, lambda_function.HF_BACKOFF_BASE,
+                 lambda_function.HF_CONCURRENCY, bart_summarizer_lambda.API_URL)
+        lambda_function.HF_API_BASE = server.url
+        lambda_function.HF_API_TOKEN = lambda_function.HF_API_TOKEN or 'benchmark'
+        lambda_function.HF_BACKOFF_BASE = options['backoff']
+        bart_summarizer_lambda.API_URL = server.url + '/default/summarizer'
+        try:
+            for mode, concurrency in (('sequential', 1), ('concurrent', max(1, options['concurrency']))):
+                self.report_run(mode, concurrency, corpus, server)
+        finally:
+            (lambda_function.HF_API_BASE, lambda_function.HF_API_TOKEN, lambda_function.HF_BACKOFF_BASE,
+             lambda_function.HF_CONCURRENCY, bart_summarizer_lambda.API_URL) = saved
+            server.shutdown()
+
+    def report_chunking(self, corpus):
+        words = sum(len(text.split()) for _, text in corpus)
+        started = time.perf_counter()
+        chunks = sum(
+            len(lambda_function.chunk_sentences_by_wordcount(
+                lambda_function.split_into_sentences(text), self.options['max_words']))
+            for _, text in corpus
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Corpus: {len(corpus)} documents, {words} words, {chunks} chunks '
+            f'(split + chunk {elapsed * 1000:.1f}ms, {words / elapsed if elapsed else 0:,.0f} words/s)'
+        )
+
+    def summarize_one(self, text):
+        """Return (ok, inference_calls) for one paper."""
+        if self.options['client']:
+            summary = bart_summarizer_lambda.summarize_text(text, self.options['max_words'], use_cache=False)
+            return bool(summary), None
+        result = lambda_function.lambda_handler(
+            {'body': json.dumps({'text': text, 'max_words_per_chunk': self.options['max_words']})}, None
+        )
+        body = json.loads(result['body'])
+        return result['statusCode'] == 200, body.get('inference_calls')
+
+    def report_run(self, mode, concurrency, corpus, server):
+        # Each mode starts cold: no memoized summaries, no pending backoff
+        lambda_function.summary_cache.clear()
+        lambda_function.hf_backoff.reset()
+        lambda_function.HF_CONCURRENCY = concurrency
+        before = server.snapshot()
+        latencies, calls, failures = [], [], 0
+
+        def run(text):
+            started = time.perf_counter()
+            outcome = self.summarize_one(text)
+            return time.perf_counter() - started, outcome
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for latency, (ok, paper_calls) in pool.map(run, [text for _, text in corpus]):
+                latencies.append(latency)
+                failures += not ok
+                if paper_calls:
+                    calls.append(paper_calls)
+        elapsed = time.perf_counter() - started
+
+        after = server.snapshot()
+        requests = after['requests'] - before['requests']
+        retries = after['errors'] - before['errors']
+        self.stdout.write(self.style.SUCCESS(f'{mode} (concurrency {concurrency})'))
+        self.stdout.write(
+            f'  {len(corpus)} papers in {elapsed:.2f}s ({len(corpus) / elapsed:.2f} papers/s), {failures} failed\n'
+            f'  latency mean {statistics.mean(latencies):.2f}s  p50 {percentile(latencies, 0.5):.2f}s  '
+            f'p95 {percentile(latencies, 0.95):.2f}s\n'
+            f'  inference calls {requests} ({requests / len(corpus):.1f}/paper'
+            + (f', {statistics.mean(calls):.1f} in the summary tree/paper' if calls else '') + ')'
+            f', retries {retries}'
+        )
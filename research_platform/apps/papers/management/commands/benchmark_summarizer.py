@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.papers.models import Paper
+from apps.papers.utils import get_paper_text
+from ml_models.summarizers import SUMMARIZER_BACKENDS, get_summarizer
+
+
+class Command(BaseCommand):
+    help = 'Summarize a paper or text file and report throughput in chunks/second'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--paper', type=int, help='Paper id whose PDF text is summarized')
+        source.add_argument('--file', help='Plain text file to summarize')
+        parser.add_argument('--backend', choices=sorted(SUMMARIZER_BACKENDS),
+                            help='Override settings.SUMMARIZER_BACKEND')
+        parser.add_argument('--runs', type=int, default=1, help='Repeat to measure a warm model')
+        parser.add_argument('--cache', action='store_true',
+                            help='Use the summary memo cache (off by default: warm runs would only time '
+                                 'cache lookups). The deployed Lambda also memoizes per container.')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as fh:
+                text = fh.read()
+        else:
+            paper = Paper.objects.filter(pk=options['paper']).first()
+            if paper is None:
+                raise CommandError(f"Paper not found: {options['paper']}")
+            text = get_paper_text(paper)
+        if not text.strip():
+            raise CommandError('No text to summarize')
+
+        summarizer = get_summarizer(options['backend'])
+        summarizer.use_cache = options['cache']
+        warm = []
+        for run in range(1, options['runs'] + 1):
+            started = time.monotonic()
+            summary = summarizer.summarize(text)
+            elapsed = time.monotonic() - started
+            stats = getattr(summarizer, 'last_stats', None)
+            # The first run also loads the model, so it is reported on its own
+            line = f"run {run} ({'cold' if run == 1 else 'warm'}): {elapsed:.2f}s"
+            if stats:
+                line += f", {stats['chunks']} chunks, {stats['chunks_per_second']:.2f} chunks/s"
+            self.stdout.write(line)
+            if run > 1:
+                warm.append((elapsed, stats))
+
+        if warm:
+            line = f"warm median over {len(warm)} runs: {statistics.median(e for e, _ in warm):.2f}s"
+            if all(stats for _, stats in warm):
+                line += f", {statistics.median(s['chunks_per_second'] for _, s in warm):.2f} chunks/s"
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS(f"Summary ({len((summary or '').split())} words):"))
+        self.stdout.write(summary or '')
@@ -0,0 +1,404 @@
+import csv
+import json
+import os
+import re
+import time
+from datetime import date
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.papers.cache import invalidate_homepage_snapshot, bump_paper_versions
+from apps.papers.models import Paper, Category, PaperCategory, Citation
+
+LIST_SEPARATOR = ';'
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as fh:
+        yield from csv.DictReader(fh)
+
+
+BIBTEX_ENTRY_START = re.compile(r'@(\w+)\s*\{')
+BIBTEX_FIELD = re.compile(r'\s*,?\s*([\w-]+)\s*=\s*')
+
+
+def _bibtex_value(body, pos):
+    """Return (value, next_pos) for a braced, quoted or bare BibTeX value."""
+    if body[pos] == '{':
+        depth, start = 0, pos
+        while pos < len(body):
+            if body[pos] == '{':
+                depth += 1
+            elif body[pos] == '}':
+                depth -= 1
+                if depth == 0:
+                    return body[start + 1:pos], pos + 1
+            pos += 1
+        return body[start + 1:], pos
+    if body[pos] == '"':
+        end = body.find('"', pos + 1)
+        end = len(body) if end == -1 else end
+        return body[pos + 1:end], end + 1
+    match = re.match(r'[^,}\s]+', body[pos:])
+    value = match.group(0) if match else ''
+    return value, pos + len(value)
+
+
+def _parse_bibtex_entry(body):
+    record = {}
+    key_end = body.find(',')
+    pos = key_end + 1 if key_end != -1 else len(body)
+    while pos < len(body):
+        match = BIBTEX_FIELD.match(body, pos)
+        if not match:
+            break
+        value, pos = _bibtex_value(body, match.end())
+        record[match.group(1).lower()] = re.sub(r'[{}]', '', ' '.join(value.split()))
+    if 'author' in record:
+        record['authors'] = [a.strip() for a in record.pop('author').split(' and ') if a.strip()]
+    if 'year' in record and 'publication_date' not in record:
+        record['publication_date'] = record['year']
+    return record
+
+
+def read_bibtex(path):
+    """Stream entries from a BibTeX file without loading it whole."""
+    with open(path, encoding='utf-8') as fh:
+        buffer, depth = [], 0
+        for line in fh:
+            if depth == 0:
+                match = BIBTEX_ENTRY_START.search(line)
+                if not match:
+                    continue
+                line = line[match.end():]
+                buffer, depth = [], 1
+                entry_type = match.group(1).lower()
+            for i, char in enumerate(line):
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+                    if depth == 0:
+                        buffer.append(line[:i])
+                        break
+            else:
+                buffer.append(line)
+                continue
+            if entry_type not in ('comment', 'preamble', 'string'):
+                yield _parse_bibtex_entry(''.join(buffer))
+
+
+READERS = {
+    '.jsonl': read_jsonl,
+    '.ndjson': read_jsonl,
+    '.csv': read_csv,
+    '.bib': read_bibtex,
+    '.bibtex': read_bibtex,
+}
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value).split(LIST_SEPARATOR) if v.strip()]
+
+
+def normalize_doi(value):
+    if not value:
+        return None
+    doi = str(value).strip().lower()
+    doi = re.sub(r'^(https?://(dx\.)?doi\.org/|doi:)', '', doi)
+    return doi or None
+
+
+def parse_date(value):
+    value = str(value or '').strip()
+    for candidate in (value, value[:7] + '-01', value[:4] + '-01-01'):
+        try:
+            return date.fromisoformat(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Bulk import papers from JSONL, CSV or BibTeX metadata dumps'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Metadata file (.jsonl, .csv or .bib)')
+        parser.add_argument('--user', required=True, help='Username or email recorded as uploader')
+        parser.add_argument('--format', choices=sorted(set(READERS) - {'.ndjson', '.bibtex'}),
+                            help='Override format detection, e.g. .csv')
+        parser.add_argument('--pdf-dir', help='Directory holding PDFs named by the "pdf" column')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Records inserted per transaction')
+        parser.add_argument('--approve', action='store_true', help='Mark imported papers approved')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint.json)')
+        parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint')
+        parser.add_argument('--summarize', action='store_true',
+                            help='Queue summary generation for papers with PDFs')
+        parser.add_argument('--build-embeddings', action='store_true',
+                            help='Rebuild paper embeddings once the import finishes')
+
+    def handle(self, *args, **options):
+        path = Path(options['path']).resolve()
+        if not path.exists():
+            raise CommandError(f'File not found: {path}')
+        reader = READERS.get(options['format'] or path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Unsupported format: {path.suffix}')
+
+        self.uploader = User.objects.filter(username=options['user']).first() or \
+            User.objects.filter(email=options['user']).first()
+        if self.uploader is None:
+            raise CommandError(f'User not found: {options["user"]}')
+
+        self.options = options
+        self.pdf_dir = Path(options['pdf_dir']).resolve() if options['pdf_dir'] else None
+        self.category_ids = dict(Category.objects.values_list('name', 'id'))
+        self.checkpoint_path = Path(options['checkpoint'] or f'{path}.checkpoint.json')
+        # Citations whose DOI isn't imported yet, appended as they turn up; the checkpoint
+        # only records how many bytes of the file belong to completed chunks
+        self.citations_path = self.checkpoint_path.with_suffix('.citations.jsonl')
+        self.state = self.load_checkpoint(path) if options['resume'] else {
+            'source': str(path), 'records': 0, 'created': 0, 'skipped': 0,
+            'invalid': 0, 'unresolved_citations': 0, 'citations_bytes': 0,
+        }
+        with open(self.citations_path, 'ab') as fh:
+            fh.truncate(self.state['citations_bytes'])
+
+        records = islice(reader(path), self.state['records'], None)
+        started, resumed_at = time.monotonic(), self.state['records']
+        chunk_size = max(1, options['chunk_size'])
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+            self.state['records'] += len(chunk)
+            self.save_checkpoint()
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{self.state['records']} records read, {self.state['created']} created, "
+                f"{self.state['skipped']} duplicates, {self.state['invalid']} invalid "
+                f"({(self.state['records'] - resumed_at) / elapsed if elapsed else 0:.0f} records/s)"
+            )
+
+        self.resolve_pending_citations()
+        self.save_checkpoint()
+        invalidate_homepage_snapshot()
+
+        if options['build_embeddings']:
+            from apps.ml_engine.recommendation_engine import ImprovedRecommendationEngine
+            ImprovedRecommendationEngine().build_embeddings()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.state['created']} papers from {path.name} "
+            f"({self.state['unresolved_citations']} citations left unresolved, see {self.citations_path.name})"
+        ))
+
+    def load_checkpoint(self, path):
+        if not self.checkpoint_path.exists():
+            raise CommandError(f'No checkpoint at {self.checkpoint_path}')
+        with open(self.checkpoint_path, encoding='utf-8') as fh:
+            state = json.load(fh)
+        if state.get('source') != str(path):
+            raise CommandError(f"Checkpoint belongs to {state.get('source')}")
+        self.stdout.write(f"Resuming after {state['records']} records")
+        return state
+
+    def save_checkpoint(self):
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(self.state, fh)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def build_paper(self, record):
+        """Validate a raw record, returning (Paper, categories, cited_dois, pdf) or None.
+
+        The PDF is only copied into storage once the record survives de-duplication.
+        """
+        title = str(record.get('title') or '').strip()
+        publication_date = parse_date(record.get('publication_date') or record.get('year'))
+        doi = normalize_doi(record.get('doi'))
+        if not title or publication_date is None or (doi and len(doi) > 100):
+            return None
+
+        paper = Paper(
+            title=title[:500],
+            abstract=str(record.get('abstract') or '').strip(),
+            authors=', '.join(as_list(record.get('authors'))),
+            publication_date=publication_date,
+            doi=doi,
+            uploaded_by=self.uploader,
+            is_approved=self.options['approve'],
+            summary=record.get('summary') or None,
+            summary_source='provided' if record.get('summary') else '',
+        )
+        cited = [normalize_doi(d) for d in as_list(record.get('citations'))]
+        # Cut to the column length once, so lookups, inserts and the id map all use the same names
+        categories = [name[:100] for name in as_list(record.get('categories'))]
+        return paper, categories, [d for d in cited if d], record.get('pdf')
+
+    def attach_pdf(self, filename):
+        base = (self.pdf_dir or Path(settings.MEDIA_ROOT)).resolve()
+        source = (base / filename).resolve()
+        # The name comes from the import file: nothing outside the PDF directory is copied
+        if not source.is_relative_to(base):
+            self.stderr.write(f'Skipping PDF outside {base}: {filename}')
+            return None
+        if not source.is_file():
+            return None
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        if media_root in source.parents:
+            # Already inside MEDIA_ROOT: reference it in place instead of copying
+            return source.relative_to(media_root).as_posix()
+        with open(source, 'rb') as fh:
+            return default_storage.save(f'papers/pdfs/{source.name}', File(fh))
+
+    def import_chunk(self, records):
+        built, seen_dois = [], set()
+        for record in records:
+            item = self.build_paper(record)
+            if item is None:
+                self.state['invalid'] += 1
+                continue
+            doi = item[0].doi
+            if doi and doi in seen_dois:
+                self.state['skipped'] += 1
+                continue
+            if doi:
+                seen_dois.add(doi)
+            built.append(item)
+
+        existing = set(
+            Paper.objects.filter(doi__in=seen_dois).values_list('doi', flat=True)
+        ) if seen_dois else set()
+        self.state['skipped'] += sum(1 for paper, *_ in built if paper.doi in existing)
+        built = [item for item in built if item[0].doi not in existing]
+        if not built:
+            return
+
+        for paper, _, _, pdf in built:
+            if pdf:
+                paper.pdf_path = self.attach_pdf(str(pdf))
+
+        with transaction.atomic():
+            papers = [paper for paper, *_ in built]
+            # One timestamp per chunk, so the rows can be found again on backends
+            # where bulk_create doesn't return ids
+            created_at = timezone.now()
+            for paper in papers:
+                paper.created_at = created_at
+            # bulk_create everywhere: per-row save() would fire post_save (extraction, summary jobs)
+            Paper.objects.bulk_create(papers)
+            if papers[0].pk is None:
+                self.fetch_pks(papers, created_at)
+
+            self.ensure_categories({name for _, names, _, _ in built for name in names})
+            PaperCategory.objects.bulk_create([
+                PaperCategory(paper_id=paper.pk, category_id=self.category_ids[name])
+                for paper, names, _, _ in built for name in set(names)
+            ], ignore_conflicts=True)
+
+            unresolved = self.resolve_citations(
+                [[paper.pk, doi] for paper, _, cited, _ in built for doi in cited]
+            )
+
+        self.append_pending_citations(unresolved)
+        self.state['created'] += len(built)
+        if self.options['summarize']:
+            self.queue_processing([paper for paper in papers if paper.pdf_path])
+
+    def fetch_pks(self, papers, created_at):
+        """Fill in ids the backend didn't return: by DOI, else in insertion order."""
+        rows = list(
+            Paper.objects.filter(uploaded_by=self.uploader, created_at=created_at)
+            .order_by('pk').values_list('pk', 'doi')
+        )
+        by_doi = {doi: pk for pk, doi in rows if doi}
+        without_doi = iter([pk for pk, doi in rows if not doi])
+        for paper in papers:
+            paper.pk = by_doi[paper.doi] if paper.doi else next(without_doi)
+
+    def ensure_categories(self, names):
+        missing = [name for name in names if name not in self.category_ids]
+        if not missing:
+            return
+        Category.objects.bulk_create(
+            [Category(name=name) for name in missing], ignore_conflicts=True
+        )
+        self.category_ids.update(
+            Category.objects.filter(name__in=missing).values_list('name', 'id')
+        )
+
+    def append_pending_citations(self, pairs):
+        with open(self.citations_path, 'a', encoding='utf-8') as fh:
+            fh.writelines(json.dumps(pair) + '\n' for pair in pairs)
+            fh.flush()
+            self.state['citations_bytes'] = fh.tell()
+        self.state['unresolved_citations'] += len(pairs)
+
+    def resolve_pending_citations(self, batch_size=10000):
+        """Final pass over the pending file, streamed in batches; what still doesn't resolve is kept."""
+        tmp_path = self.citations_path.with_suffix('.tmp')
+        unresolved = 0
+        with open(self.citations_path, encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+            while True:
+                batch = [json.loads(line) for line in islice(src, batch_size)]
+                if not batch:
+                    break
+                with transaction.atomic():
+                    remaining = self.resolve_citations(batch)
+                dst.writelines(json.dumps(pair) + '\n' for pair in remaining)
+                unresolved += len(remaining)
+            self.state['citations_bytes'] = dst.tell()
+        os.replace(tmp_path, self.citations_path)
+        self.state['unresolved_citations'] = unresolved
+
+    def resolve_citations(self, pending):
+        """Insert citations whose cited DOI is present; return the unresolved pairs.
+
+        Papers cited before they are imported stay pending until the final pass.
+        """
+        if not pending:
+            return []
+        doi_ids = {}
+        doi_list = list({doi for _, doi in pending})
+        for i in range(0, len(doi_list), 500):
+            doi_ids.update(
+                Paper.objects.filter(doi__in=doi_list[i:i + 500]).values_list('doi', 'id')
+            )
+        citations = [
+            Citation(citing_paper_id=citing_id, cited_paper_id=doi_ids[doi])
+            for citing_id, doi in pending
+            if doi in doi_ids and doi_ids[doi] != citing_id
+        ]
+        Citation.objects.bulk_create(citations, batch_size=1000, ignore_conflicts=True)
+        # bulk_create skips signals, so expire the cited papers' citation fragments here
+        bump_paper_versions([c.cited_paper_id for c in citations], 'citations')
+        return [[citing_id, doi] for citing_id, doi in pending if doi not in doi_ids]
+
+    def queue_processing(self, papers):
+        from apps.papers.background import enqueue_many, wait_for_capacity, PRIORITY_BULK
+        # Backpressure: don't let an import bury uploads under thousands of jobs
+        wait_for_capacity()
+        enqueue_many('summarize', [paper.id for paper in papers], priority=PRIORITY_BULK)
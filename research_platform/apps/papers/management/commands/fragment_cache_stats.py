@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from apps.papers.cache import FRAGMENT_NAMES, fragment_cache_stats
+
+class Command(BaseCommand):
+    help = ('Show estimated hit/miss counts for the paper template fragment cache '
+            '(sampled at FRAGMENT_STATS_SAMPLE_RATE)')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Fragment names (default: all paper fragments)')
+    
+    def handle(self, *args, **options):
+        stats = fragment_cache_stats(options['names'] or FRAGMENT_NAMES)
+        for name, row in stats.items():
+            self.stdout.write(
+                f"{name:<20} hits={row['hits']:<8} misses={row['misses']:<8} "
+                f"hit_rate={row['hit_rate']:.1%}"
+            )
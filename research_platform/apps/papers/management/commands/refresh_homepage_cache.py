@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from apps.papers.cache import refresh_homepage_snapshot
+
+class Command(BaseCommand):
+    help = 'Rebuild the cached homepage snapshot (run from cron to keep it warm)'
+    
+    def handle(self, *args, **options):
+        snapshot = refresh_homepage_snapshot()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Homepage snapshot rebuilt: {len(snapshot['recent_papers'])} recent, "
+                f"{len(snapshot['trending_papers'])} trending, "
+                f"{len(snapshot['popular_categories'])} categories"
+            )
+        )
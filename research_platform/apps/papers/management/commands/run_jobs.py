@@ -0,0 +1,49 @@
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.papers.background import claim_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (summaries) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Jobs claimed per poll; keep small for long-running tasks')
+        parser.add_argument('--worker-id', help='Name recorded on claimed jobs (default: host:pid)')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        # Finish the job in hand on SIGTERM/SIGINT instead of abandoning it
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(f'Worker {worker_id} started')
+        done = failed = 0
+        while not self.stopping:
+            jobs = claim_jobs(worker_id, limit=max(1, options['batch_size']))
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(settings.JOB_POLL_INTERVAL)
+                continue
+            for job in jobs:
+                if run_job(job):
+                    done += 1
+                else:
+                    failed += 1
+                # Unstarted claims in the batch are picked up again after their visibility timeout
+                if self.stopping:
+                    break
+
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} stopped: {done} done, {failed} failed'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:19
+
+from django.db import migrations, models
+
+STATUS_MESSAGES = ("Error generating summary.", "No text could be extracted from the PDF.")
+
+
+def mark_existing_summaries(apps, schema_editor):
+    Paper = apps.get_model('papers', 'Paper')
+    Paper.objects.exclude(summary__isnull=True).exclude(summary='').exclude(
+        summary__in=STATUS_MESSAGES
+    ).update(summary_source='abstractive')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0007_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paper',
+            name='summary_source',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('extractive', 'Extractive (provisional)'), ('abstractive', 'Abstractive'), ('provided', 'Provided')], default='', max_length=12),
+        ),
+        migrations.RunPython(mark_existing_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0008_paper_summary_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdftext',
+            name='is_complete',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0009_pdftext_is_complete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdftext',
+            name='attempted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='pdftext',
+            name='extract_attempts',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import zlib
 from django.db import models
 from django.utils import timezone
 from apps.accounts.models import User
@@ -14,6 +15,13 @@ class Category(models.Model):
         return self.name
 
 class Paper(models.Model):
+    SUMMARY_SOURCE_CHOICES = [
+        ('', 'None'),
+        ('extractive', 'Extractive (provisional)'),
+        ('abstractive', 'Abstractive'),
+        ('provided', 'Provided'),
+    ]
+
     title = models.CharField(max_length=500)
     abstract = models.TextField()
     authors = models.TextField()  # JSON field for multiple authors
@@ -28,6 +36,8 @@ class Paper(models.Model):
     download_count = models.PositiveIntegerField(default=0)
     view_count = models.PositiveIntegerField(default=0)
     summary = models.TextField(blank=True, null=True)
+    summary_source = models.CharField(max_length=12, choices=SUMMARY_SOURCE_CHOICES, blank=True, default='')  # '' for status messages
+    pdf_sha256 = models.CharField(max_length=64, blank=True, default='')  # cleared when pdf_path changes
     
     class Meta:
         db_table = 'papers'
@@ -104,3 +114,73 @@ class PaperView(models.Model):
     class Meta:
         db_table = 'paper_views'
         unique_together = ['user', 'paper']
+
+
+class PDFText(models.Model):
+    """Extracted PDF text stored once per PDF content hash."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    compressed_text = models.BinaryField()
+    page_offsets = models.JSONField(default=list)  # start offset of each page in the text
+    is_complete = models.BooleanField(default=True)  # False when extraction stopped at the timeout or page limit
+    extract_attempts = models.PositiveSmallIntegerField(default=1)  # incomplete text is retried a few times only
+    attempted_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'pdf_texts'
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.page_count} pages)"
+
+    @classmethod
+    def from_pages(cls, sha256, pages, is_complete=True):
+        offsets, position = [], 0
+        for page in pages:
+            offsets.append(position)
+            position += len(page)
+        text = "".join(pages)
+        return cls(sha256=sha256, compressed_text=zlib.compress(text.encode('utf-8')), page_offsets=offsets,
+                   is_complete=is_complete)
+
+    @property
+    def page_count(self):
+        return len(self.page_offsets)
+
+    @property
+    def text(self):
+        return zlib.decompress(bytes(self.compressed_text)).decode('utf-8')
+
+    def page(self, index):
+        text = self.text
+        end = self.page_offsets[index + 1] if index + 1 < self.page_count else len(text)
+        return text[self.page_offsets[index]:end]
+
+
+class BackgroundJob(models.Model):
+    """A durable unit of background work, claimed by the ``run_jobs`` worker."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=50)
+    paper = models.ForeignKey(Paper, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    available_at = models.DateTimeField(default=timezone.now)  # not claimed before this
+    locked_until = models.DateTimeField(null=True, blank=True)  # visibility timeout while running
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'background_jobs'
+        indexes = [models.Index(fields=['status', 'available_at', 'priority'])]
+
+    def __str__(self):
+        return f"{self.task} #{self.paper_id} ({self.status})"
@@ -1,16 +1,32 @@
 from rest_framework import serializers
 from .models import Paper, Category, Bookmark, Rating, Citation
 
+class DynamicFieldsMixin:
+    """Limit output to the comma-separated ``?fields=`` query parameter."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        allowed = {name.strip() for name in requested.split(',') if name.strip()}
+        for name in set(self.fields) - allowed:
+            self.fields.pop(name)
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description']
 
-class PaperSerializer(serializers.ModelSerializer):
+class PaperSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     categories = CategorySerializer(many=True, read_only=True)
     uploaded_by = serializers.StringRelatedField(read_only=True)
-    average_rating = serializers.ReadOnlyField()
-    citation_count = serializers.ReadOnlyField()
+    # Annotated by the API views (annotated_papers); the model properties query per paper
+    average_rating = serializers.SerializerMethodField()
+    citation_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Paper
@@ -20,14 +36,20 @@ class PaperSerializer(serializers.ModelSerializer):
             'view_count', 'download_count', 'average_rating', 'citation_count'
         ]
 
-class BookmarkSerializer(serializers.ModelSerializer):
+    def get_average_rating(self, paper):
+        return paper.rating_average if hasattr(paper, 'rating_average') else paper.average_rating
+
+    def get_citation_count(self, paper):
+        return paper.citation_total if hasattr(paper, 'citation_total') else paper.citation_count
+
+class BookmarkSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     paper = PaperSerializer(read_only=True)
     
     class Meta:
         model = Bookmark
         fields = ['id', 'paper', 'folder', 'created_at']
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     paper = PaperSerializer(read_only=True)
     
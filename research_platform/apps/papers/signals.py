@@ -1,23 +1,145 @@
 # apps/papers/signals.py
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Paper
-from .background import executor
-from ml_models.bart_summarizer_lambda import summarize_text_from_pdf
+from django.utils import timezone
+from apps.accounts.models import User
+from .models import Bookmark, Category, Citation, Paper, PaperCategory, Rating
+from .background import enqueue, PRIORITY_PROVISIONAL, PRIORITY_UPLOAD
+from .cache import bump_api_list_version, bump_paper_versions, invalidate_homepage_snapshot
+from .utils import get_paper_text
+from ml_models.summarizers import get_summarizer
 
 
-def process_summary(paper_id, pdf_file):
-    from .models import Paper
-    try:
-        summary = summarize_text_from_pdf(pdf_file)
-        Paper.objects.filter(id=paper_id).update(summary=summary)
-    except Exception as e:
-        # Log or print the error instead of failing silently
-        print(f"[ERROR] Failing to generate summary for Paper {paper_id}: {e}")
+def process_summary(paper_id):
+    """Background task: summarize the paper's PDF. Raises so the job queue can retry."""
+    paper = Paper.objects.get(id=paper_id)
+    # Reuses text already extracted for an identical PDF
+    text = get_paper_text(paper)
+    if not text.strip():
+        Paper.objects.filter(id=paper_id).update(
+            summary="No text could be extracted from the PDF.", summary_source=''
+        )
+        return
+    summary = get_summarizer().summarize(text)
+    if not summary:
+        raise RuntimeError("Summarizer returned no summary")
+    Paper.objects.filter(id=paper_id).update(summary=summary, summary_source='abstractive')
+
+
+def summary_failed(paper_id):
+    # A provisional extractive summary is better than an error message
+    Paper.objects.filter(id=paper_id).exclude(summary_source='extractive').update(
+        summary="Error generating summary.", summary_source=''
+    )
+
+
+def process_extractive_summary(paper_id):
+    """Background task: store an extractive summary until the abstractive job replaces it."""
+    paper = Paper.objects.get(id=paper_id)
+    # Also stores the extracted text, so the abstractive job doesn't re-extract it
+    summary = get_summarizer('extractive').summarize(get_paper_text(paper))
+    if summary:
+        Paper.objects.filter(pk=paper_id, summary_source__in=('', 'extractive')).update(
+            summary=summary, summary_source='extractive'
+        )
 
 
 @receiver(post_save, sender=Paper)
 def generate_summary(sender, instance, created, **kwargs):
     if created and instance.pdf_path:
-        # Run in background thread
-        executor.submit(process_summary, instance.id, instance.pdf_path)
+        # Picked up by the run_jobs worker, outside the request; the quick
+        # extractive job is claimed ahead of the abstractive one
+        if settings.EXTRACTIVE_SUMMARY_ON_UPLOAD:
+            enqueue('extractive_summary', instance.id, priority=PRIORITY_PROVISIONAL)
+        enqueue('summarize', instance.id, priority=PRIORITY_UPLOAD)
+
+
+@receiver(pre_save, sender=Paper)
+def compare_with_stored(sender, instance, update_fields=None, **kwargs):
+    """One read of the stored row for the checks that depend on what changed."""
+    instance._was_approved = False
+    if not instance.pk or (update_fields is not None and not {'pdf_path', 'is_approved'} & set(update_fields)):
+        return
+    stored = Paper.objects.filter(pk=instance.pk).values_list('pdf_path', 'is_approved').first()
+    if stored is None:
+        return
+    stored_pdf, instance._was_approved = stored
+    # Extracted text is looked up by PDF hash, so a replaced file must be re-hashed
+    if instance.pdf_sha256 and (stored_pdf or '') != (instance.pdf_path.name or ''):
+        instance.pdf_sha256 = ''
+
+
+@receiver(post_save, sender=Paper)
+def refresh_homepage_on_save(sender, instance, **kwargs):
+    # Only approved papers appear on the homepage, so unapproving one must refresh it too
+    if instance.is_approved or getattr(instance, '_was_approved', False):
+        invalidate_homepage_snapshot()
+
+
+@receiver(post_delete, sender=Paper)
+def refresh_homepage_on_delete(sender, instance, **kwargs):
+    invalidate_homepage_snapshot()
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def refresh_rating_fragments(sender, instance, **kwargs):
+    bump_paper_versions([instance.paper_id], 'ratings')
+    bump_api_list_version()
+
+
+@receiver(post_save, sender=Citation)
+@receiver(post_delete, sender=Citation)
+def refresh_citation_fragments(sender, instance, **kwargs):
+    bump_paper_versions([instance.citing_paper_id, instance.cited_paper_id], 'citations')
+    bump_api_list_version()
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_delete, sender=Bookmark)
+def refresh_api_lists(sender, instance, **kwargs):
+    bump_api_list_version()
+
+
+# Cards, the detail page's shared context and API ETags are keyed on
+# Paper.updated_at; category names and the uploader's username live in
+# other tables, so changing them moves updated_at forward.
+def touch_papers(**filters):
+    Paper.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=PaperCategory)
+@receiver(post_delete, sender=PaperCategory)
+def refresh_paper_categories(sender, instance, **kwargs):
+    touch_papers(pk=instance.paper_id)
+
+
+@receiver(m2m_changed, sender=Paper.categories.through)
+def refresh_paper_categories_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        touch_papers(pk=instance.pk)
+    elif reverse and action in ('post_add', 'post_remove'):
+        touch_papers(pk__in=pk_set)
+    elif reverse and action == 'pre_clear':
+        touch_papers(categories=instance)
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_papers(sender, instance, created, **kwargs):
+    if not created:
+        touch_papers(categories=instance)
+
+
+@receiver(pre_save, sender=User)
+def note_username_change(sender, instance, update_fields=None, **kwargs):
+    instance._renamed = False
+    if instance.pk and (update_fields is None or 'username' in update_fields):
+        stored = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+        instance._renamed = stored is not None and stored != instance.username
+
+
+@receiver(post_save, sender=User)
+def refresh_uploader_papers(sender, instance, **kwargs):
+    if getattr(instance, '_renamed', False):
+        touch_papers(uploaded_by=instance)
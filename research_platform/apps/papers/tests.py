@@ -1,3 +1,421 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from apps.accounts.models import User
+from ml_models import bart_summarizer_lambda, lambda_function
+from ml_models.summarizers import LocalBARTSummarizer
+
+from .background import claim_jobs
+from .cache import HOMEPAGE_FRESH_KEY, fragment_cache_stats, get_homepage_snapshot, record_fragment_lookup
+from .models import BackgroundJob, Category, Citation, Paper, PaperCategory, PDFText, Rating
+from .utils import get_pdf_text_record
+
+
+def make_paper(user, **kwargs):
+    fields = dict(title='Paper', abstract='Abstract', authors='A. Author',
+                  publication_date=date(2024, 1, 1), uploaded_by=user, is_approved=True)
+    fields.update(kwargs)
+    return Paper.objects.create(**fields)
+
+
+class HomepageSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author', email='author@example.com', password='x')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unapproving_a_paper_refreshes_the_snapshot(self):
+        paper = make_paper(self.user)
+        get_homepage_snapshot()
+        self.assertTrue(cache.get(HOMEPAGE_FRESH_KEY))
+
+        paper.is_approved = False
+        paper.save()
+        self.assertIsNone(cache.get(HOMEPAGE_FRESH_KEY))
+        recent = [row['pk'] for row in get_homepage_snapshot()['recent_papers']]
+        self.assertNotIn(paper.pk, recent)
+
+    def test_saving_an_unapproved_paper_keeps_the_snapshot(self):
+        paper = make_paper(self.user, is_approved=False)
+        get_homepage_snapshot()
+        paper.title = 'Renamed'
+        paper.save()
+        self.assertTrue(cache.get(HOMEPAGE_FRESH_KEY))
+
+
+class PaperDetailQueryCountTests(TestCase):
+    """The detail page costs a fixed number of queries, however many ratings and citations it shows."""
+
+    # session, user, paper with the viewer's bookmark/view/rating folded in,
+    # the shared context (ratings, citations, categories), and the first
+    # view's insert (in a savepoint) and view_count update
+    COLD_QUERIES = 10
+    # session, user, paper; the shared context comes from the cache
+    WARM_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.category = Category.objects.create(name='Machine Learning')
+
+    def setUp(self):
+        cache.clear()
+
+    def paper_with(self, related):
+        paper = make_paper(self.author)
+        PaperCategory.objects.create(paper=paper, category=self.category)
+        for i in range(related):
+            reader = User.objects.create_user(username=f'r{paper.pk}-{i}', email=f'r{paper.pk}-{i}@example.com')
+            Rating.objects.create(user=reader, paper=paper, rating=4, review_text='Useful')
+            Citation.objects.create(citing_paper=make_paper(self.author, title=f'Citing {i}'), cited_paper=paper)
+        return paper
+
+    def test_query_count_is_constant(self):
+        for related in (2, 8):
+            viewer = User.objects.create_user(username=f'viewer{related}', email=f'viewer{related}@example.com')
+            self.client.force_login(viewer)
+            url = reverse('papers:detail', args=[self.paper_with(related).pk])
+            with self.assertNumQueries(self.COLD_QUERIES):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(self.WARM_QUERIES):
+                self.client.get(url)
+
+
+class UploadJobTests(TestCase):
+    def test_upload_queues_the_extractive_pass_ahead_of_the_abstractive_one(self):
+        user = User.objects.create_user(username='author', email='author@example.com', password='x')
+        with mock.patch('apps.papers.signals.get_paper_text') as get_text:
+            paper = make_paper(user, pdf_path='papers/pdfs/paper.pdf')
+        get_text.assert_not_called()  # no extraction on the request thread
+        self.assertEqual(
+            [job.task for job in claim_jobs('test-worker', limit=2)], ['extractive_summary', 'summarize']
+        )
+        self.assertEqual(paper.jobs.count(), 2)
+
+
+class PDFTextRecordTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author', email='author@example.com', password='x')
+
+    def setUp(self):
+        self.paper = make_paper(self.user, pdf_path='papers/pdfs/paper.pdf', pdf_sha256='a' * 64)
+
+    def extract(self, pages, total):
+        return mock.patch('apps.papers.utils.extract_pdf_pages', return_value=(pages, total))
+
+    @override_settings(PDF_EXTRACT_RETRY_AFTER=0)
+    def test_text_cut_short_is_extracted_again(self):
+        with self.extract(['one ', 'two '], 4):
+            record = get_pdf_text_record(self.paper)
+        self.assertFalse(record.is_complete)
+
+        with self.extract(['one ', 'two ', 'three ', 'four '], 4) as extract:
+            record = get_pdf_text_record(self.paper)
+        extract.assert_called_once()
+        self.assertTrue(record.is_complete)
+        self.assertEqual(record.page_count, 4)
+        self.assertEqual(PDFText.objects.get().text, 'one two three four ')
+
+        with self.extract([], 4) as extract:
+            get_pdf_text_record(self.paper)
+        extract.assert_not_called()
+
+    def test_failing_pdf_is_not_extracted_again_right_away(self):
+        with self.extract(['one '], 4):
+            get_pdf_text_record(self.paper)
+        for _ in range(2):
+            with self.extract(['one '], 4) as extract:
+                get_pdf_text_record(self.paper)
+            extract.assert_not_called()
+
+    @override_settings(PDF_EXTRACT_RETRY_AFTER=0, PDF_EXTRACT_MAX_ATTEMPTS=3)
+    def test_failing_pdf_is_retried_a_limited_number_of_times(self):
+        with self.extract(['one '], 4) as extract:
+            for _ in range(5):
+                get_pdf_text_record(self.paper)
+        self.assertEqual(extract.call_count, 3)
+        self.assertEqual(PDFText.objects.get().extract_attempts, 3)
+
+    @override_settings(PDF_EXTRACT_MAX_PAGES=2)
+    def test_text_cut_at_the_page_limit_is_kept(self):
+        with self.extract(['one ', 'two '], 4):
+            get_pdf_text_record(self.paper)
+        with self.extract(['one ', 'two '], 4) as extract:
+            record = get_pdf_text_record(self.paper)
+        extract.assert_not_called()
+        self.assertFalse(record.is_complete)
+
+    def test_without_extract_an_unhashed_pdf_is_not_read(self):
+        paper = make_paper(self.user, pdf_path='papers/pdfs/missing.pdf')
+        with mock.patch('apps.papers.utils.hash_pdf') as hash_pdf:
+            self.assertIsNone(get_pdf_text_record(paper, extract=False))
+        hash_pdf.assert_not_called()
+
+    def test_missing_pdf_file_gives_no_text(self):
+        paper = make_paper(self.user, pdf_path='papers/pdfs/missing.pdf')
+        self.assertIsNone(get_pdf_text_record(paper))
+        self.assertEqual(Paper.objects.get(pk=paper.pk).pdf_sha256, '')
+
+    def test_without_extract_partial_text_is_returned(self):
+        with self.extract(['one '], 4):
+            get_pdf_text_record(self.paper)
+        with self.extract([], 4) as extract:
+            record = get_pdf_text_record(self.paper, extract=False)
+        extract.assert_not_called()
+        self.assertEqual(record.text, 'one ')
+
+
+class FragmentFreshnessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author', email='author@example.com', password='x')
+        self.paper = make_paper(self.user, title='Cached card')
+
+    def card_badges(self):
+        content = self.client.get(reverse('papers:list')).content.decode()
+        return re.findall(r'<span class="badge bg-secondary">([^<]*)</span>', content)
+
+    def test_category_changes_reach_the_cached_card(self):
+        self.assertEqual(self.card_badges(), [])
+        category = Category.objects.create(name='Quantum Optics')
+        self.paper.categories.add(category)
+        self.assertEqual(self.card_badges(), ['Quantum Optics'])
+
+        category.name = 'Photonics'
+        category.save()
+        self.assertEqual(self.card_badges(), ['Photonics'])
+
+        PaperCategory.objects.filter(paper=self.paper).delete()
+        self.assertEqual(self.card_badges(), [])
+
+    def test_renaming_the_uploader_reaches_the_cached_detail_meta(self):
+        self.client.force_login(self.user)
+        url = reverse('papers:detail', args=[self.paper.pk])
+        self.client.get(url)
+        self.user.username = 'renamed-author'
+        self.user.save()
+        self.assertContains(self.client.get(url), 'renamed-author')
+
+
+class FragmentStatsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(FRAGMENT_STATS_SAMPLE_RATE=0)
+    def test_disabled_sampling_never_touches_the_cache(self):
+        record_fragment_lookup('paper_card', hit=True)
+        self.assertEqual(fragment_cache_stats(['paper_card'])['paper_card']['hits'], 0)
+
+    @override_settings(FRAGMENT_STATS_SAMPLE_RATE=0.5)
+    def test_sampled_lookups_are_weighted(self):
+        for _ in range(400):
+            record_fragment_lookup('paper_card', hit=True)
+        hits = fragment_cache_stats(['paper_card'])['paper_card']['hits']
+        self.assertEqual(hits % 2, 0)
+        self.assertAlmostEqual(hits, 400, delta=120)
+
+
+class LocalSummarizerReduceTests(SimpleTestCase):
+    def test_chunk_summaries_are_reduced_until_one_input_remains(self):
+        calls = []
+
+        def generate(texts, min_length, max_length, length_penalty):
+            calls.append([len(text.split()) for text in texts])
+            return [' '.join(text.split()[:300]) for text in texts]
+
+        summarizer = LocalBARTSummarizer(model_name='test', batch_size=4, num_threads=1, max_words_per_chunk=400)
+        summarizer.use_cache = False
+        text = ' '.join(f'Sentence {i} has a few more words in it.' for i in range(800))
+        with mock.patch.object(summarizer, 'generate', side_effect=generate):
+            summarizer.summarize(text)
+
+        self.assertGreater(summarizer.last_stats['reduce_levels'], 0)
+        self.assertEqual(len(calls[-1]), 1)
+        self.assertTrue(all(words <= 1024 for call in calls for words in call))
+
+
+class LambdaRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.backoff = lambda_function.SharedBackoff()
+
+    def call(self, **kwargs):
+        return lambda_function.hf_inference_call('text', 'token', backoff=self.backoff, **kwargs)
+
+    def test_transport_retries_sleep_with_jitter(self):
+        with mock.patch.object(lambda_function.hf_http, 'request', side_effect=OSError('reset')), \
+                mock.patch.object(lambda_function.random, 'uniform', return_value=0.25) as uniform, \
+                mock.patch.object(lambda_function.time, 'sleep') as sleep:
+            with self.assertRaises(RuntimeError):
+                self.call(retries=3)
+        self.assertEqual([c.args for c in uniform.call_args_list],
+                         [(0, lambda_function.HF_BACKOFF_BASE * 2 ** n) for n in (1, 2, 3)])
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.25] * 3)
+
+    def test_retry_sleep_stops_at_the_deadline_reserve(self):
+        deadline = time.monotonic() + lambda_function.HF_RETRY_RESERVE_MS / 1000.0 + 0.5
+        with mock.patch.object(lambda_function.hf_http, 'request', side_effect=OSError('reset')), \
+                mock.patch.object(lambda_function.time, 'sleep') as sleep:
+            with self.assertRaises(lambda_function.TimeBudgetExceeded):
+                self.call(retries=10, deadline=deadline - 1)
+        sleep.assert_not_called()
+        with mock.patch.object(lambda_function.time, 'sleep') as sleep:
+            lambda_function.retry_sleep(60, deadline)
+        self.assertLessEqual(sleep.call_args.args[0], 0.5)
+
+    def test_shared_pause_spreads_waiters(self):
+        self.backoff.penalize(1.0)
+        with mock.patch.object(lambda_function.time, 'sleep') as sleep:
+            for _ in range(20):
+                self.backoff.wait()
+        delays = {round(c.args[0], 3) for c in sleep.call_args_list}
+        self.assertGreater(len(delays), 1)
+        self.assertTrue(all(0 < d <= 2.0 for d in delays))
+
+
+class LambdaSummaryCacheTests(SimpleTestCase):
+    def call(self, *responses):
+        cache = lambda_function.LRUSummaryCache()
+        with mock.patch.object(lambda_function.hf_http, 'request', side_effect=list(responses)), \
+                mock.patch.object(lambda_function.time, 'sleep'):
+            summary = lambda_function.cached_inference_call(
+                'text', 'token', cache=cache, retries=2, backoff=lambda_function.SharedBackoff())
+        return summary, cache
+
+    def test_only_summaries_are_cached(self):
+        summary, cache = self.call((200, json.dumps([{'summary_text': 'Short.'}]).encode()))
+        self.assertEqual(summary, 'Short.')
+        self.assertEqual(list(cache._data.values()), ['Short.'])
+
+    def test_non_json_body_is_retried_not_returned(self):
+        summary, cache = self.call((200, b'<html>Bad gateway</html>'),
+                                   (200, json.dumps([{'summary_text': 'Short.'}]).encode()))
+        self.assertEqual(summary, 'Short.')
+        self.assertEqual(list(cache._data.values()), ['Short.'])
+
+    def test_unexpected_shape_raises_and_is_not_cached(self):
+        cache = lambda_function.LRUSummaryCache()
+        with mock.patch.object(lambda_function.hf_http, 'request', return_value=(200, b'{"labels": []}')):
+            with self.assertRaises(RuntimeError):
+                lambda_function.cached_inference_call('text', 'token', cache=cache,
+                                                      backoff=lambda_function.SharedBackoff())
+        self.assertEqual(len(cache._data), 0)
+
+
+class LambdaReduceTests(SimpleTestCase):
+    def words(self, n):
+        return ' '.join(['word'] * n)
+
+    def test_groups_never_exceed_max_words_and_levels_shrink(self):
+        for sizes in ([400] * 5, [100, 900, 100], [300, 300, 300], [50] * 9):
+            groups = lambda_function.group_for_reduce([self.words(n) for n in sizes], max_words=700)
+            self.assertTrue(all(len(g.split()) <= 700 for g in groups), sizes)
+            self.assertLess(len(groups), len(sizes), sizes)
+
+    def test_single_summary_is_its_own_group(self):
+        self.assertEqual(lambda_function.group_for_reduce([self.words(10)], max_words=700), [self.words(10)])
+
+    def test_overflow_gives_each_summary_a_share(self):
+        summaries = [f'part{i} ' + self.words(500) for i in range(4)]
+        squeezed = lambda_function.squeeze_for_final(summaries, max_words=700)
+        self.assertLessEqual(len(squeezed.split()), 700)
+        self.assertTrue(all(f'part{i}' in squeezed for i in range(4)))
+
+    def test_failed_level_cancels_remaining_calls(self):
+        calls = []
+
+        def call(text, token, cancel=None, **kwargs):
+            calls.append(text)
+            if text == 'first':
+                raise RuntimeError('boom')
+            self.assertTrue(cancel.wait(1))
+            raise RuntimeError('cancelled')
+
+        texts = ['first'] + [f'chunk {i}' for i in range(20)]
+        with mock.patch.object(lambda_function, 'cached_inference_call', side_effect=call), \
+                mock.patch.object(lambda_function, 'HF_CONCURRENCY', 2):
+            with self.assertRaises(lambda_function.LevelFailed) as ctx:
+                lambda_function.summarize_level(texts, 'token')
+        self.assertEqual(ctx.exception.index, 1)
+        self.assertLess(len(calls), len(texts))
+
+
+class SummarizeTextTests(SimpleTestCase):
+    def test_gateway_error_is_logged_and_returns_none(self):
+        with mock.patch.object(bart_summarizer_lambda.api_http, 'request', return_value=(502, b'Bad gateway')), \
+                self.assertLogs('ml_models.bart_summarizer_lambda', 'WARNING') as logs:
+            self.assertIsNone(bart_summarizer_lambda.summarize_text('text', use_cache=False))
+        self.assertIn('HTTP 502', logs.output[0])
+
+
+class BulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='importer', email='importer@example.com', password='x')
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def run_import(self, records, *args):
+        path = os.path.join(self.tmp.name, 'papers.jsonl')
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.writelines(json.dumps(record) + '\n' for record in records)
+        with open(os.devnull, 'w') as devnull:
+            call_command('bulk_import_papers', path, '--user', 'importer', *args, stdout=devnull, stderr=devnull)
+
+    def test_long_category_names_are_cut_once(self):
+        name = 'C' * 150
+        self.run_import([{'title': 'Paper', 'publication_date': '2024', 'categories': [name]}])
+        self.assertEqual(Paper.objects.get().categories.get().name, name[:100])
+
+    def test_pdf_names_cannot_leave_the_pdf_directory(self):
+        pdf_dir = os.path.join(self.tmp.name, 'pdfs')
+        os.mkdir(pdf_dir)
+        with open(os.path.join(self.tmp.name, 'secret.pdf'), 'wb') as fh:
+            fh.write(b'%PDF-1.4 not for import')
+        self.run_import([{'title': 'Paper', 'publication_date': '2024', 'pdf': '../secret.pdf'}],
+                        '--pdf-dir', pdf_dir)
+        self.assertFalse(Paper.objects.get().pdf_path)
+
+    def test_forward_citations_resolve_at_the_end_and_stay_out_of_the_checkpoint(self):
+        self.run_import([
+            {'title': 'First', 'publication_date': '2024', 'doi': '10.1/a', 'citations': ['10.1/b', '10.1/missing']},
+            {'title': 'Second', 'publication_date': '2024', 'doi': '10.1/b'},
+        ], '--chunk-size', '1')
+        self.assertTrue(Citation.objects.filter(citing_paper__doi='10.1/a', cited_paper__doi='10.1/b').exists())
+
+        checkpoint = os.path.join(self.tmp.name, 'papers.jsonl.checkpoint.json')
+        with open(checkpoint, encoding='utf-8') as fh:
+            state = json.load(fh)
+        self.assertEqual(state['unresolved_citations'], 1)
+        with open(os.path.join(self.tmp.name, 'papers.jsonl.checkpoint.citations.jsonl'), encoding='utf-8') as fh:
+            self.assertEqual([json.loads(line)[1] for line in fh], ['10.1/missing'])
+
+    def test_summaries_are_queued_in_one_batch(self):
+        pdf_dir = os.path.join(self.tmp.name, 'pdfs')
+        os.mkdir(pdf_dir)
+        for name in ('a.pdf', 'b.pdf'):
+            with open(os.path.join(pdf_dir, name), 'wb') as fh:
+                fh.write(b'%PDF-1.4')
+        records = [{'title': name, 'publication_date': '2024', 'pdf': name} for name in ('a.pdf', 'b.pdf')]
+        with mock.patch('apps.papers.background.BackgroundJob.objects.bulk_create',
+                        wraps=BackgroundJob.objects.bulk_create) as bulk_create, \
+                mock.patch('apps.papers.management.commands.bulk_import_papers.default_storage.save',
+                           side_effect=lambda name, content: name):
+            self.run_import(records, '--pdf-dir', pdf_dir, '--summarize')
+        bulk_create.assert_called_once()
+        self.assertEqual(BackgroundJob.objects.filter(task='summarize').count(), 2)
@@ -1,9 +1,187 @@
 # apps/papers/utils.py
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import timedelta
+
 import fitz  # PyMuPDF
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _pdf_path(pdf_file):
+    """Return a filesystem path for the PDF, or None when only a stream is available."""
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.fspath(pdf_file)
+    if hasattr(pdf_file, 'temporary_file_path'):
+        return pdf_file.temporary_file_path()
+    try:
+        return pdf_file.path
+    except (AttributeError, NotImplementedError, ValueError):
+        return None
+
+
+def _open_pdf(pdf_file):
+    path = _pdf_path(pdf_file)
+    if path:
+        return fitz.open(path)
+    # In-memory uploads have no path; fall back to reading the stream
+    pdf_file.seek(0)
+    return fitz.open(stream=pdf_file.read(), filetype="pdf")
+
+
+def _extract_page_range(path, start, stop):
+    """Worker: extract pages [start, stop) of the PDF at ``path``."""
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_file, max_pages=None, timeout=None):
+    """Yield the text of each page in order, stopping at the page or time limit."""
+    max_pages = max_pages or settings.PDF_EXTRACT_MAX_PAGES
+    timeout = timeout or settings.PDF_EXTRACT_TIMEOUT
+    deadline = time.monotonic() + timeout
+    with _open_pdf(pdf_file) as doc:
+        for i in range(min(doc.page_count, max_pages)):
+            if time.monotonic() > deadline:
+                logger.warning("PDF extraction timed out after %s of %s pages", i, doc.page_count)
+                return
+            yield doc[i].get_text()
+        if doc.page_count > max_pages:
+            logger.warning("PDF extraction stopped at page limit %s of %s", max_pages, doc.page_count)
+
+
+def _extract_parallel(path, page_count, workers, timeout):
+    """Pages in order, up to the first batch that failed or missed the deadline."""
+    batch = max(1, -(-page_count // (workers * 4)))  # ~4 batches per worker to balance load
+    ranges = [(start, min(start + batch, page_count)) for start in range(0, page_count, batch)]
+    # spawn: the caller may be a background thread, where fork is unsafe
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = [pool.submit(_extract_page_range, path, start, stop) for start, stop in ranges]
+        done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            # Cancelling can't stop a batch that is already running; the workers have to go
+            for process in list((pool._processes or {}).values()):
+                process.terminate()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    pages = []
+    for future, (start, _) in zip(futures, ranges):
+        if future not in done or future.exception() is not None:
+            # Later batches would leave a gap and shift every page after it
+            logger.warning("PDF extraction stopped at page %s of %s (%s)", start, page_count,
+                           "timed out" if future not in done else future.exception())
+            break
+        pages.extend(future.result())
+    return pages
+
+
+def extract_pdf_pages(pdf_file, max_pages=None, timeout=None):
+    """Return ``(pages, total)``: the text of each page and the document's page count.
+
+    Fewer pages than ``total`` means extraction stopped at the page limit or
+    the timeout. Large documents are split across processes.
+    """
+    max_pages = max_pages or settings.PDF_EXTRACT_MAX_PAGES
+    timeout = timeout or settings.PDF_EXTRACT_TIMEOUT
+    path = _pdf_path(pdf_file)
+    workers = settings.PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+
+    with _open_pdf(pdf_file) as doc:
+        total = doc.page_count
+    page_count = min(total, max_pages)
+    if path and workers > 1 and page_count >= settings.PDF_EXTRACT_PARALLEL_MIN_PAGES:
+        return _extract_parallel(path, page_count, min(workers, page_count), timeout), total
+
+    return list(iter_pdf_pages(pdf_file, max_pages=max_pages, timeout=timeout)), total
+
+
+def extract_pages_from_pdf(pdf_file, max_pages=None, timeout=None):
+    """Return the text of each page, splitting large documents across processes."""
+    return extract_pdf_pages(pdf_file, max_pages=max_pages, timeout=timeout)[0]
+
+
+def extract_text_from_pdf(pdf_file, max_pages=None, timeout=None):
+    return "".join(extract_pages_from_pdf(pdf_file, max_pages=max_pages, timeout=timeout))
+
+
+def hash_pdf(pdf_file):
+    """SHA-256 of the PDF bytes, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    path = _pdf_path(pdf_file)
+    with (open(path, 'rb') if path else pdf_file.open('rb')) as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def can_extract_more(record):
+    """Whether extracting again could add pages: the last run timed out or failed
+    part-way, or PDF_EXTRACT_MAX_PAGES has been raised since.
+
+    A PDF that fails the same way every time is retried after a cooldown, and
+    only PDF_EXTRACT_MAX_ATTEMPTS times in all.
+    """
+    retry_at = record.attempted_at + timedelta(seconds=settings.PDF_EXTRACT_RETRY_AFTER)
+    return (not record.is_complete and record.page_count < settings.PDF_EXTRACT_MAX_PAGES
+            and record.extract_attempts < settings.PDF_EXTRACT_MAX_ATTEMPTS
+            and timezone.now() >= retry_at)
+
+
+def get_pdf_text_record(paper, extract=True):
+    """Return the PDFText for the paper's current PDF, extracting it at most once per content hash.
+
+    Text cut short by the timeout is re-extracted by a later call that may
+    extract, within the limits of can_extract_more(). With ``extract=False`` only already-extracted text is returned
+    (or None), complete or not; a PDF that hasn't been hashed yet has none, so
+    indexing and the bot never read the whole file. The upload's jobs hash it.
+    """
+    from .models import Paper, PDFText
+
+    if not paper.pdf_path:
+        return None
+    if not paper.pdf_sha256:
+        if not extract:
+            return None
+        try:
+            paper.pdf_sha256 = hash_pdf(paper.pdf_path)
+        except FileNotFoundError:
+            logger.warning("PDF of Paper %s is missing: %s", paper.pk, paper.pdf_path.name)
+            return None
+        Paper.objects.filter(pk=paper.pk).update(pdf_sha256=paper.pdf_sha256)
+
+    record = PDFText.objects.filter(sha256=paper.pdf_sha256).first()
+    if not extract or (record is not None and not can_extract_more(record)):
+        return record
+
+    pages, total = extract_pdf_pages(paper.pdf_path)
+    fresh = PDFText.from_pages(paper.pdf_sha256, pages, is_complete=len(pages) >= total)
+    if record is not None:
+        attempts = record.extract_attempts + 1
+        if fresh.page_count > record.page_count or fresh.is_complete:
+            fresh.pk, fresh.created_at, fresh.extract_attempts = record.pk, record.created_at, attempts
+            fresh.save()
+            return fresh
+        record.extract_attempts, record.attempted_at = attempts, fresh.attempted_at
+        record.save(update_fields=['extract_attempts', 'attempted_at'])
+        return record
+    try:
+        with transaction.atomic():
+            fresh.save()
+    except IntegrityError:
+        # Another worker extracted the same PDF concurrently
+        fresh = PDFText.objects.get(sha256=paper.pdf_sha256)
+    return fresh
+
 
-def extract_text_from_pdf(pdf_file):
-    text = ""
-    with fitz.open(stream=pdf_file.read(), filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
+def get_paper_text(paper, extract=True):
+    record = get_pdf_text_record(paper, extract=extract)
+    return record.text if record else ""
@@ -9,6 +9,7 @@ from django.db.models import Q, Avg, Count
 from django.core.paginator import Paginator
 from .models import Paper, Category, Bookmark, Rating, Citation
 from .forms import PaperUploadForm, PaperEditForm, RatingForm
+from .cache import get_paper_versions
 from apps.accounts.permissions import IsPublisherOrAbove, IsModeratorOrAdmin
 from django.views.generic import CreateView
 
@@ -56,9 +57,11 @@ class PaperListView(ListView):
         context['sort_by'] = self.request.GET.get('sort', '-created_at')
         return context
 
-from django.db.models import Q, F
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F, Exists, OuterRef, Subquery
 from .models import Paper, Rating, Citation, Bookmark, PaperView
 from .forms import RatingForm
+from .cache import get_paper_public_context
 
 class PaperDetailView(DetailView):
     model = Paper
@@ -68,31 +71,53 @@ class PaperDetailView(DetailView):
     def get_queryset(self):
         if self.request.user.is_authenticated:
             if self.request.user.user_type in ['moderator', 'admin']:
-                return Paper.objects.all()
+                queryset = Paper.objects.all()
             elif self.request.user.user_type == 'publisher':
-                return Paper.objects.filter(
+                queryset = Paper.objects.filter(
                     Q(uploaded_by=self.request.user) | Q(is_approved=True)
                 )
-        return Paper.objects.filter(is_approved=True)
+            else:
+                queryset = Paper.objects.filter(is_approved=True)
+            return self.annotate_user_state(queryset.select_related('uploaded_by'))
+        return Paper.objects.filter(is_approved=True).select_related('uploaded_by')
+    
+    def annotate_user_state(self, queryset):
+        """Fold bookmark, view and rating lookups into the paper query."""
+        user = self.request.user
+        user_rating = Rating.objects.filter(user=user, paper=OuterRef('pk'))
+        return queryset.annotate(
+            user_bookmarked=Exists(Bookmark.objects.filter(user=user, paper=OuterRef('pk'))),
+            user_viewed=Exists(PaperView.objects.filter(user=user, paper=OuterRef('pk'))),
+            user_rating_value=Subquery(user_rating.values('rating')[:1]),
+            user_rating_review=Subquery(user_rating.values('review_text')[:1]),
+        )
+    
+    def track_view(self, paper):
+        # Increment view count only once per authenticated user
+        try:
+            with transaction.atomic():
+                PaperView.objects.create(user=self.request.user, paper=paper)
+        except IntegrityError:
+            return
+        Paper.objects.filter(id=paper.id).update(view_count=F('view_count') + 1)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         paper = self.object
         
-        # Increment view count only once per authenticated user
-        if self.request.user.is_authenticated:
-            if not PaperView.objects.filter(user=self.request.user, paper=paper).exists():
-                Paper.objects.filter(id=paper.id).update(view_count=F('view_count') + 1)
-                PaperView.objects.create(user=self.request.user, paper=paper)
-        
-        # Get related data
-        context['ratings'] = Rating.objects.filter(paper=paper).select_related('user')
-        context['citations'] = Citation.objects.filter(cited_paper=paper).select_related('citing_paper')
-        context['cited_papers'] = Citation.objects.filter(citing_paper=paper).select_related('cited_paper')
+        # Shared across users; keyed on updated_at and the rating/citation versions
+        context['fragment_versions'] = get_paper_versions(paper.pk)
+        context.update(get_paper_public_context(paper, context['fragment_versions']))
         
         if self.request.user.is_authenticated:
-            context['user_bookmark'] = Bookmark.objects.filter(user=self.request.user, paper=paper).first()
-            context['user_rating'] = Rating.objects.filter(user=self.request.user, paper=paper).first()
+            if not paper.user_viewed:
+                self.track_view(paper)
+            context['user_bookmark'] = paper.user_bookmarked
+            if paper.user_rating_value is not None:
+                context['user_rating'] = {
+                    'rating': paper.user_rating_value,
+                    'review_text': paper.user_rating_review,
+                }
             context['rating_form'] = RatingForm()
         
         return context
@@ -290,84 +315,102 @@ def get_recommendations(request):
     })
 
 # Add these imports at the top of your papers/views.py file
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Prefetch
+from django.db.models.functions import Coalesce
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import generics, permissions, status
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from django.http import JsonResponse
+from .serializers import PaperSerializer, BookmarkSerializer, RatingSerializer
+from .cache import get_api_list_version
 
 # Add these views at the end of your papers/views.py file
 
-class PaperListCreateView(generics.ListCreateAPIView):
+class APIPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+class ETagListMixin:
+    """Answer If-None-Match from a fingerprint of the list, before it is loaded or serialized.
+
+    The fingerprint is the row count and ``Max()`` of ``etag_fields`` over the
+    filtered queryset, one aggregate query, plus the version that rating,
+    citation, bookmark and category changes bump.
+    """
+    etag_fields = ('updated_at',)
+
+    def list_etag(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        state = queryset.aggregate(
+            rows=Count('pk'), **{f'max_{field}': Max(field) for field in self.etag_fields}
+        )
+        fingerprint = [request.get_full_path(), request.user.pk, get_api_list_version(), sorted(state.items())]
+        body = json.dumps(fingerprint, cls=DjangoJSONEncoder)
+        return quote_etag(hashlib.md5(body.encode('utf-8')).hexdigest())
+
+    def list(self, request, *args, **kwargs):
+        etag = self.list_etag(request)
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in client_etags or f'W/{etag}' in client_etags or '*' in client_etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+def annotated_papers(queryset):
+    """Papers with what PaperSerializer reads: categories, average rating and citation count."""
+    # The two joins repeat each rating once per citation, which leaves the average unchanged
+    return queryset.select_related('uploaded_by').prefetch_related('categories').annotate(
+        rating_average=Coalesce(Avg('ratings__rating'), 0.0),
+        citation_total=Count('cited_by', distinct=True),
+    )
+
+class PaperListCreateView(ETagListMixin, generics.ListCreateAPIView):
     """API view for listing and creating papers"""
-    serializer_class = None  # Will be defined when serializers are ready
+    serializer_class = PaperSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = APIPagination
     
     def get_queryset(self):
-        return Paper.objects.filter(is_approved=True)
-    
-    def list(self, request, *args, **kwargs):
-        papers = self.get_queryset()
-        data = []
-        for paper in papers:
-            data.append({
-                'id': paper.id,
-                'title': paper.title,
-                'abstract': paper.abstract,
-                'authors': paper.authors,
-                'publication_date': paper.publication_date,
-                'uploaded_by': paper.uploaded_by.username,
-                'view_count': paper.view_count,
-                'download_count': paper.download_count,
-            })
-        return Response(data)
+        return annotated_papers(Paper.objects.filter(is_approved=True)).order_by('-created_at', '-id')
     
     def create(self, request, *args, **kwargs):
         return Response({'message': 'Paper creation via API not implemented yet'}, 
                        status=status.HTTP_501_NOT_IMPLEMENTED)
 
-class BookmarkListCreateView(generics.ListCreateAPIView):
+class BookmarkListCreateView(ETagListMixin, generics.ListCreateAPIView):
     """API view for listing and creating bookmarks"""
+    serializer_class = BookmarkSerializer
+    etag_fields = ('created_at', 'paper__updated_at')
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = APIPagination
     
     def get_queryset(self):
-        return Bookmark.objects.filter(user=self.request.user)
-    
-    def list(self, request, *args, **kwargs):
-        bookmarks = self.get_queryset()
-        data = []
-        for bookmark in bookmarks:
-            data.append({
-                'id': bookmark.id,
-                'paper_title': bookmark.paper.title,
-                'paper_id': bookmark.paper.id,
-                'created_at': bookmark.created_at,
-                'folder': bookmark.folder,
-            })
-        return Response(data)
+        return Bookmark.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('paper', queryset=annotated_papers(Paper.objects.all()))
+        ).order_by('-created_at', '-id')
     
     def create(self, request, *args, **kwargs):
         return Response({'message': 'Bookmark creation via API not implemented yet'}, 
                        status=status.HTTP_501_NOT_IMPLEMENTED)
 
-class RatingListCreateView(generics.ListCreateAPIView):
+class RatingListCreateView(ETagListMixin, generics.ListCreateAPIView):
     """API view for listing and creating ratings"""
+    serializer_class = RatingSerializer
+    etag_fields = ('created_at', 'paper__updated_at')
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = APIPagination
     
     def get_queryset(self):
-        return Rating.objects.filter(user=self.request.user)
-    
-    def list(self, request, *args, **kwargs):
-        ratings = self.get_queryset()
-        data = []
-        for rating in ratings:
-            data.append({
-                'id': rating.id,
-                'paper_title': rating.paper.title,
-                'paper_id': rating.paper.id,
-                'rating': rating.rating,
-                'review_text': rating.review_text,
-                'created_at': rating.created_at,
-            })
-        return Response(data)
+        return Rating.objects.filter(user=self.request.user).select_related('user').prefetch_related(
+            Prefetch('paper', queryset=annotated_papers(Paper.objects.all()))
+        ).order_by('-created_at', '-id')
     
     def create(self, request, *args, **kwargs):
         return Response({'message': 'Rating creation via API not implemented yet'}, 
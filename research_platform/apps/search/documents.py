@@ -1,6 +1,7 @@
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 from apps.papers.models import Paper
+from apps.papers.utils import get_paper_text
 
 @registry.register_document
 class PaperDocument(Document):
@@ -12,6 +13,7 @@ class PaperDocument(Document):
     )
     abstract = fields.TextField(analyzer='standard')
     authors = fields.TextField(analyzer='standard')
+    full_text = fields.TextField(analyzer='standard')
     categories = fields.NestedField(properties={
         'name': fields.TextField(),
     })
@@ -45,3 +47,7 @@ class PaperDocument(Document):
     
     def get_queryset(self):
         return super().get_queryset().filter(is_approved=True)
+    
+    def prepare_full_text(self, instance):
+        # Only text already extracted for this PDF; indexing never triggers extraction
+        return get_paper_text(instance, extract=False)
@@ -1,27 +1,73 @@
-import requests
+import http.client
 import json
+import logging
+import os
+
+from ml_models.lambda_function import PooledHTTPClient, summary_cache_key
+
+logger = logging.getLogger(__name__)
 
 # Replace this with your actual API Gateway URL
 API_URL = "https://eswopm4jm1.execute-api.ap-south-1.amazonaws.com/default/google-summarizer"
+API_TIMEOUT = float(os.environ.get("SUMMARIZER_API_TIMEOUT", "120"))
+API_RETRIES = int(os.environ.get("SUMMARIZER_API_RETRIES", "2"))
+API_POOL_SIZE = int(os.environ.get("SUMMARIZER_API_POOL_SIZE", "4"))
+# Only turn on if the gateway decodes Content-Encoding: gzip request bodies
+API_GZIP_REQUESTS = str(os.environ.get("SUMMARIZER_API_GZIP_REQUESTS", "false")).lower() in ("1", "true", "yes")
+
+# One keep-alive pool per process, shared by every summary job
+api_http = PooledHTTPClient(
+    pool_size=API_POOL_SIZE, timeout=API_TIMEOUT, retries=API_RETRIES,
+    retry_statuses=(429, 502, 503, 504),
+    gzip_min_bytes=1024 if API_GZIP_REQUESTS else None,
+)
+
+
+def _shared_cache():
+    """Django's cache when running inside the project, None for standalone use."""
+    from django.conf import settings
+    if not settings.configured:
+        return None
+    from django.core.cache import cache
+    return cache
+
+
+def summarize_text(text, max_words_per_chunk=400, use_cache=True):
+    # Identical text (e.g. a re-uploaded PDF or a retried job) skips the Lambda call
+    cache = _shared_cache() if use_cache else None
+    key = "summary:" + summary_cache_key(API_URL, text, max_words_per_chunk=max_words_per_chunk)
+    if cache is not None:
+        summary = cache.get(key)
+        if summary is not None:
+            return summary
 
-def summarize_text(text, max_words_per_chunk=400):
     payload = {
         "text": text,
         "max_words_per_chunk": max_words_per_chunk
     }
     headers = {"Content-Type": "application/json"}
     try:
-        response = requests.post(API_URL, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        data = response.json()
-        return data.get("summary", "")
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Lambda API: {e}")
-        if e.response is not None:
-            print(e.response.text)
+        status, body = api_http.request("POST", API_URL, body=json.dumps(payload).encode("utf-8"), headers=headers)
+    except (OSError, http.client.HTTPException) as e:
+        logger.warning("Error calling Lambda API: %s", e)
         return None
-    
-    
+    if status >= 400:
+        logger.warning("Error calling Lambda API: HTTP %s: %s", status, body.decode("utf-8", errors="replace")[:500])
+        return None
+    try:
+        summary = json.loads(body).get("summary", "")
+    except (ValueError, AttributeError):
+        # A gateway error page or other non-JSON body, despite a 2xx status
+        logger.warning("Error calling Lambda API: unexpected response body (HTTP %s): %s",
+                       status, body.decode("utf-8", errors="replace")[:500])
+        return None
+
+    if cache is not None and summary:
+        from django.conf import settings
+        cache.set(key, summary, settings.SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
 def summarize_text_from_pdf(pdf_file, max_words_per_chunk=400):
     from apps.papers.utils import extract_text_from_pdf
     text = extract_text_from_pdf(pdf_file)
@@ -29,19 +75,7 @@ def summarize_text_from_pdf(pdf_file, max_words_per_chunk=400):
     if not text.strip():
         return "No text could be extracted from the PDF."
     
-    payload = {"text": text, "max_words_per_chunk": max_words_per_chunk}
-    headers = {"Content-Type": "application/json"}
-    
-    try:
-        response = requests.post(API_URL, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        data = response.json()
-        return data.get("summary", "")
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Lambda API: {e}")
-        if e.response:
-            print(e.response.text)
-        return "Error generating summary."
+    return summarize_text(text, max_words_per_chunk) or "Error generating summary."
 
 if __name__ == "__main__":
     TEXT = """
@@ -3,27 +3,46 @@ import os
 import json
 import re
 import time
+import gzip
+import base64
+import queue
+import random
+import hashlib
 import logging
-import urllib.request
-import urllib.error
+import threading
+import http.client
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import boto3
 except Exception:
     boto3 = None  # boto3 is available inside Lambda
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
+# Only the Lambda runtime owns the root logger; the Django app imports this module too
+if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    logging.getLogger().setLevel(logging.INFO)
 
 # ---------- Environment / defaults ----------
 HF_MODEL = os.environ.get("HF_MODEL", "facebook/bart-large-cnn")
+HF_API_BASE = os.environ.get("HF_API_BASE", "https://api-inference.huggingface.co")  # override for a local stub
 HF_API_TOKEN = os.environ.get("HF_API_TOKEN")     # optional direct token
 HF_SECRET_ARN = os.environ.get("HF_SECRET_ARN")   # recommended in prod
 
 MAX_WORDS_PER_CHUNK = int(os.environ.get("MAX_WORDS_PER_CHUNK", "700"))
-MAX_CHUNKS = int(os.environ.get("MAX_CHUNKS", "30"))
+HF_CALL_BUDGET = int(os.environ.get("HF_CALL_BUDGET", "250"))       # inference calls per request, all levels
+REDUCE_MAX_WORDS = int(os.environ.get("REDUCE_MAX_WORDS", "700"))   # input size of each reduce call
 HF_MAX_RETRIES = int(os.environ.get("HF_MAX_RETRIES", "4"))
 HF_REQUEST_TIMEOUT = int(os.environ.get("HF_REQUEST_TIMEOUT", "60"))
+HF_CONCURRENCY = int(os.environ.get("HF_CONCURRENCY", "4"))           # parallel chunk calls
+FINAL_PASS_RESERVE_MS = int(os.environ.get("FINAL_PASS_RESERVE_MS", "20000"))  # kept for the reduce levels
+FINAL_CALL_RESERVE_MS = int(os.environ.get("FINAL_CALL_RESERVE_MS", "8000"))   # kept for the final call
+HF_CACHE_MAX_ENTRIES = int(os.environ.get("HF_CACHE_MAX_ENTRIES", "2048"))      # memoized summaries per container
+HF_BACKOFF_BASE = float(os.environ.get("HF_BACKOFF_BASE", "1.0"))  # seconds, doubled per retry
+HF_RETRY_RESERVE_MS = int(os.environ.get("HF_RETRY_RESERVE_MS", "2000"))  # least time left worth a retry
+HF_GZIP_REQUESTS = str(os.environ.get("HF_GZIP_REQUESTS", "false")).lower() in ("1", "true", "yes")
 
 # per-chunk summarization defaults
 HF_MIN_LENGTH = int(os.environ.get("HF_MIN_LENGTH", "150"))
@@ -93,12 +112,179 @@ def chunk_sentences_by_wordcount(sentences, max_words):
     return chunks
 
 
+class TimeBudgetExceeded(Exception):
+    """Raised when the Lambda's remaining time cannot cover another attempt."""
+
+
+class SharedBackoff:
+    """Process-wide pause shared by every in-flight HF call.
+
+    A 429/5xx seen by one chunk delays the calls of all other chunks too, instead
+    of each thread hammering the endpoint on its own schedule.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self, deadline=None):
+        with self._lock:
+            resume_at = self._resume_at
+        delay = resume_at - time.monotonic()
+        if delay <= 0:
+            return
+        if deadline is not None and resume_at > deadline - HF_RETRY_RESERVE_MS / 1000.0:
+            raise TimeBudgetExceeded("time budget exhausted while backing off")
+        # Spread the waiters over a second pause so they don't all retry at the same instant
+        retry_sleep(delay + random.uniform(0, delay), deadline)
+
+    def penalize(self, delay):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def reset(self):
+        with self._lock:
+            self._resume_at = 0.0
+
+
+hf_backoff = SharedBackoff()
+
+
+def backoff_delay(attempt):
+    """Full-jitter delay before retry number ``attempt``."""
+    return random.uniform(0, HF_BACKOFF_BASE * 2 ** attempt)
+
+
+def retry_sleep(delay, deadline=None):
+    """Sleep ``delay`` seconds, capped so HF_RETRY_RESERVE_MS of the deadline is left for the retry."""
+    if deadline is not None:
+        remaining = deadline - time.monotonic() - HF_RETRY_RESERVE_MS / 1000.0
+        if remaining <= 0:
+            raise TimeBudgetExceeded("time budget exhausted while backing off")
+        delay = min(delay, remaining)
+    if delay > 0:
+        time.sleep(delay)
+
+
+class PooledHTTPClient:
+    """Minimal keep-alive HTTP client on http.client (no dependencies, so it runs in Lambda).
+
+    Idle connections are kept per (scheme, host, port) and reused, so only the first
+    request to a host pays for the TCP/TLS handshake. Transport errors and
+    ``retry_statuses`` are retried with full-jitter backoff; a request that fails on
+    a reused connection (closed by the server while idle) is retried at once on a
+    fresh one.
+    """
+
+    def __init__(self, pool_size=HF_CONCURRENCY, timeout=HF_REQUEST_TIMEOUT, retries=2,
+                 retry_statuses=(), backoff=0.5, gzip_min_bytes=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_statuses = frozenset(retry_statuses)
+        self.backoff = backoff
+        self.gzip_min_bytes = gzip_min_bytes  # None disables request compression
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, key):
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = queue.LifoQueue(maxsize=self.pool_size)
+            return self._pools[key]
+
+    def _connect(self, scheme, host, port, timeout):
+        conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return conn_class(host, port, timeout=timeout)
+
+    def _checkout(self, key, timeout):
+        try:
+            conn = self._pool(key).get_nowait()
+        except queue.Empty:
+            return self._connect(*key, timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _checkin(self, key, conn):
+        try:
+            self._pool(key).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while not pool.empty():
+                pool.get_nowait().close()
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """Send the request and return ``(status, response_bytes)``; raises on transport errors."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", "gzip")
+        if body is not None and self.gzip_min_bytes is not None and len(body) >= self.gzip_min_bytes:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        timeout = self.timeout if timeout is None else timeout
+
+        attempt = 0
+        while True:
+            conn, reused = self._checkout(key, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as exc:
+                conn.close()
+                if reused and not isinstance(exc, TimeoutError):
+                    continue  # stale keep-alive connection; not counted as an attempt
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                continue
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            if resp.getheader("Content-Encoding", "").lower() == "gzip":
+                data = gzip.decompress(data)
+            if resp.status in self.retry_statuses and attempt < self.retries:
+                attempt += 1
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                continue
+            return resp.status, data
+
+
+# Status retries are left to hf_inference_call, which coordinates them through hf_backoff
+hf_http = PooledHTTPClient(
+    pool_size=HF_CONCURRENCY, timeout=HF_REQUEST_TIMEOUT, retries=0,
+    gzip_min_bytes=1024 if HF_GZIP_REQUESTS else None,
+)
+
+
+def deadline_from_context(context, reserve_ms=0):
+    """Monotonic deadline derived from the Lambda context, or None outside Lambda."""
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining is None:
+        return None
+    return time.monotonic() + (get_remaining() - reserve_ms) / 1000.0
+
+
 def hf_inference_call(text, token, model=HF_MODEL,
                       timeout=HF_REQUEST_TIMEOUT, retries=HF_MAX_RETRIES,
                       min_length=HF_MIN_LENGTH, max_length=HF_MAX_LENGTH,
                       length_penalty=HF_LENGTH_PENALTY,
-                      wait_for_model=False):
-    url = f"https://api-inference.huggingface.co/models/{model}"
+                      wait_for_model=False, deadline=None, backoff=hf_backoff, cancel=None):
+    url = f"{HF_API_BASE}/models/{model}"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
@@ -119,55 +305,197 @@ def hf_inference_call(text, token, model=HF_MODEL,
     attempt, last_err = 0, None
 
     while attempt < retries:
+        backoff.wait(deadline)
+        if cancel is not None and cancel.is_set():
+            raise RuntimeError(f"cancelled after another call failed. Last error: {last_err}")
+        request_timeout = timeout
+        if deadline is not None:
+            request_timeout = min(timeout, deadline - time.monotonic())
+            if request_timeout <= 0:
+                raise TimeBudgetExceeded(f"time budget exhausted. Last error: {last_err}")
         try:
-            req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-            with urllib.request.urlopen(req, timeout=timeout) as resp:
-                resp_body = resp.read().decode("utf-8")
-                try:
-                    result = json.loads(resp_body)
-                except Exception:
-                    return resp_body
-
-                if isinstance(result, dict) and result.get("error"):
-                    err = result.get("error")
-                    if any(tok in err.lower() for tok in ("loading", "unavailable", "timeout", "429")):
-                        attempt += 1
-                        time.sleep(1 * (2 ** attempt))
-                        last_err = err
-                        continue
-                    raise RuntimeError(f"HuggingFace inference error: {err}")
-
-                if isinstance(result, list) and len(result) > 0:
-                    first = result[0]
-                    if isinstance(first, dict):
-                        return first.get("summary_text") or first.get("generated_text") or str(first)
-                    return str(first)
-
-                return str(result)
-
-        except urllib.error.HTTPError as e:
-            try:
-                body = e.read().decode()
-            except Exception:
-                body = "<no body>"
-            if e.code in (429, 503, 502):
-                attempt += 1
-                time.sleep(1 * (2 ** attempt))
-                last_err = f"HTTPError {e.code}: {body}"
-                continue
-            raise RuntimeError(f"HF HTTPError {e.code}: {body}")
+            status, resp_data = hf_http.request("POST", url, body=data, headers=headers, timeout=request_timeout)
         except Exception as ex:
             attempt += 1
             last_err = str(ex)
-            time.sleep(1 * (2 ** attempt))
+            retry_sleep(backoff_delay(attempt), deadline)
+            continue
+
+        resp_body = resp_data.decode("utf-8", errors="replace")
+        if status in (429, 503, 502):
+            attempt += 1
+            backoff.penalize(backoff_delay(attempt))
+            last_err = f"HTTPError {status}: {resp_body}"
+            continue
+        if status >= 400:
+            raise RuntimeError(f"HF HTTPError {status}: {resp_body}")
+
+        try:
+            result = json.loads(resp_body)
+        except ValueError:
+            # A gateway page in place of the model's JSON; retry rather than pass it on as a summary
+            attempt += 1
+            backoff.penalize(backoff_delay(attempt))
+            last_err = f"non-JSON response: {resp_body[:200]}"
+            continue
+
+        if isinstance(result, dict) and result.get("error"):
+            err = result.get("error")
+            if any(tok in err.lower() for tok in ("loading", "unavailable", "timeout", "429")):
+                attempt += 1
+                backoff.penalize(backoff_delay(attempt))
+                last_err = err
+                continue
+            raise RuntimeError(f"HuggingFace inference error: {err}")
+
+        if isinstance(result, list) and result and isinstance(result[0], dict):
+            summary = result[0].get("summary_text") or result[0].get("generated_text")
+            if isinstance(summary, str) and summary:
+                return summary
+        raise RuntimeError(f"Unexpected HF response: {resp_body[:200]}")
 
     raise RuntimeError(f"Exceeded retries calling HF API. Last error: {last_err}")
 
 
+# ---------- Summary memoization ----------
+def summary_cache_key(model, text, **params):
+    """Stable key for a summary of ``text`` by ``model`` with the given generation params."""
+    raw = json.dumps([model, text, sorted(params.items())], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUSummaryCache:
+    """Thread-safe in-process LRU; module-level, so it survives warm invocations."""
+
+    def __init__(self, max_entries=HF_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+summary_cache = LRUSummaryCache()
+
+
+def cached_inference_call(text, token, model=HF_MODEL,
+                          min_length=HF_MIN_LENGTH, max_length=HF_MAX_LENGTH,
+                          length_penalty=HF_LENGTH_PENALTY, cache=summary_cache, **kwargs):
+    """hf_inference_call memoized on (model, text, min/max length, length penalty).
+
+    A retried request resumes from the chunks a warm container already finished.
+    Only summaries are stored; hf_inference_call raises on anything else.
+    """
+    key = summary_cache_key(model, text, min_length=int(min_length),
+                            max_length=int(max_length), length_penalty=float(length_penalty))
+    summary = cache.get(key)
+    if summary is None:
+        summary = hf_inference_call(text, token, model=model, min_length=min_length,
+                                    max_length=max_length, length_penalty=length_penalty, **kwargs)
+        if summary:
+            cache.set(key, summary)
+    return summary
+
+
+# ---------- Hierarchical (map-reduce) summarization ----------
+class LevelFailed(Exception):
+    def __init__(self, index, error):
+        super().__init__(str(error))
+        self.index = index
+        self.error = error
+
+
+def summarize_level(texts, token, deadline=None, **params):
+    """Summarize ``texts`` concurrently, returning summaries in order.
+
+    The first failure cancels the calls still queued and stops the running ones
+    from retrying, so a failed level doesn't keep spending the call budget.
+    """
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(HF_CONCURRENCY, len(texts))))
+    futures = [pool.submit(cached_inference_call, t, token, deadline=deadline, cancel=cancel, **params)
+               for t in texts]
+    results = []
+    for i, future in enumerate(futures, start=1):
+        try:
+            results.append(future.result())
+        except Exception as ex:
+            cancel.set()
+            for pending in futures:
+                pending.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise LevelFailed(i, ex)
+    pool.shutdown()
+    return results
+
+
+def truncate_words(text, max_words):
+    words = text.split()
+    return text if len(words) <= max_words else " ".join(words[:max_words])
+
+
+def pack_words(summaries, max_words):
+    groups, cur, cur_words = [], [], 0
+    for s in summaries:
+        s = truncate_words(s, max_words)
+        wcount = len(s.split())
+        if cur and cur_words + wcount > max_words:
+            groups.append(" ".join(cur))
+            cur, cur_words = [], 0
+        cur.append(s)
+        cur_words += wcount
+    if cur:
+        groups.append(" ".join(cur))
+    return groups
+
+
+def group_for_reduce(summaries, max_words=REDUCE_MAX_WORDS):
+    """Pack consecutive summaries into reduce inputs of at most ``max_words``.
+
+    A summary may sit in a group of its own. When no two neighbours fit together,
+    each one is cut to half of ``max_words`` and they are paired, so every level
+    still shrinks and no group is ever longer than ``max_words``.
+    """
+    groups = pack_words(summaries, max_words)
+    if len(summaries) > 1 and len(groups) == len(summaries):
+        half = max(1, max_words // 2)
+        groups = pack_words([truncate_words(s, half) for s in summaries], max_words)
+    return groups
+
+
+def squeeze_for_final(summaries, max_words=REDUCE_MAX_WORDS):
+    """One final-pass input of at most ``max_words``, giving each summary an equal share."""
+    share = max(1, max_words // max(1, len(summaries)))
+    return truncate_words(" ".join(truncate_words(s, share) for s in summaries), max_words)
+
+
 # ---------- Lambda handler ----------
 def lambda_handler(event, context):
     try:
         body_raw = event.get("body") or ""
+        if event.get("isBase64Encoded") and isinstance(body_raw, str):
+            body_raw = base64.b64decode(body_raw)
+        headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+        if isinstance(body_raw, bytes):
+            if headers.get("content-encoding", "").lower() == "gzip":
+                body_raw = gzip.decompress(body_raw)
+            body_raw = body_raw.decode("utf-8")
         body = json.loads(body_raw) if isinstance(body_raw, str) and body_raw else body_raw
     except Exception as e:
         return {"statusCode": 400, "body": json.dumps({"error": "invalid JSON body", "detail": str(e)})}
@@ -186,39 +514,61 @@ def lambda_handler(event, context):
     sentences = split_into_sentences(text)
     chunks = chunk_sentences_by_wordcount(sentences, max_words)
 
-    if len(chunks) > MAX_CHUNKS:
-        msg = f"Input too large: produced {len(chunks)} chunks (max {MAX_CHUNKS})."
+    # The map level must fit the budget; reduce levels stop early when it runs out
+    if len(chunks) + 1 > HF_CALL_BUDGET:
+        msg = f"Input too large: produced {len(chunks)} chunks (call budget {HF_CALL_BUDGET})."
         return {"statusCode": 413, "body": json.dumps({"error": msg, "chunks": len(chunks)})}
 
-    chunk_summaries = []
-    for i, c in enumerate(chunks, start=1):
+    chunk_params = {"min_length": HF_MIN_LENGTH, "max_length": HF_MAX_LENGTH, "length_penalty": HF_LENGTH_PENALTY}
+
+    # MAP → chunks summarized concurrently; leave time for the reduce levels
+    try:
+        chunk_summaries = summarize_level(
+            chunks, token, deadline=deadline_from_context(context, reserve_ms=FINAL_PASS_RESERVE_MS), **chunk_params
+        )
+    except LevelFailed as ex:
+        status = 504 if isinstance(ex.error, TimeBudgetExceeded) else 502
+        return {"statusCode": status, "body": json.dumps({"error": f"failed summarizing chunk {ex.index}", "detail": str(ex)})}
+
+    # REDUCE → level by level until the summaries fit in one final call
+    calls, levels = len(chunks), 0
+    summaries = chunk_summaries
+    groups = group_for_reduce(summaries)
+    while len(groups) > 1:
+        if calls + len(groups) + 1 > HF_CALL_BUDGET:
+            logger.warning("Call budget reached after %s reduce levels; final pass gets %s summaries",
+                           levels, len(summaries))
+            groups = [squeeze_for_final(summaries)]
+            break
         try:
-            s = hf_inference_call(
-                c, token,
-                min_length=HF_MIN_LENGTH,
-                max_length=HF_MAX_LENGTH,
-                length_penalty=HF_LENGTH_PENALTY
+            summaries = summarize_level(
+                groups, token, deadline=deadline_from_context(context, reserve_ms=FINAL_CALL_RESERVE_MS), **chunk_params
             )
-            chunk_summaries.append(s)
-        except Exception as ex:
-            return {"statusCode": 502, "body": json.dumps({"error": f"failed summarizing chunk {i}", "detail": str(ex)})}
-
-    combined_summary = " ".join(chunk_summaries)
-
-    # SECOND PASS → compress into ~300 words
+        except LevelFailed as ex:
+            status = 504 if isinstance(ex.error, TimeBudgetExceeded) else 502
+            return {"statusCode": status, "body": json.dumps({"error": f"failed reduce level {levels + 1}, group {ex.index}", "detail": str(ex)})}
+        calls += len(groups)
+        levels += 1
+        groups = group_for_reduce(summaries)
+
+    # FINAL PASS → compress into ~300 words
     try:
-        final_summary = hf_inference_call(
-            combined_summary, token,
+        final_summary = cached_inference_call(
+            groups[0], token,
             min_length=FINAL_MIN_LENGTH,
             max_length=FINAL_MAX_LENGTH,
-            length_penalty=1.5
+            length_penalty=1.5,
+            deadline=deadline_from_context(context),
         )
     except Exception as ex:
-        return {"statusCode": 502, "body": json.dumps({"error": "failed final summarization", "detail": str(ex)})}
+        status = 504 if isinstance(ex, TimeBudgetExceeded) else 502
+        return {"statusCode": status, "body": json.dumps({"error": "failed final summarization", "detail": str(ex)})}
 
     response = {
         "summary": final_summary,
         "chunks": len(chunks),
         "chunk_summaries_count": len(chunk_summaries),
+        "reduce_levels": levels,
+        "inference_calls": calls + 1,
     }
     return {"statusCode": 200, "body": json.dumps(response)}
\ No newline at end of file
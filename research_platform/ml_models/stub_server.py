@@ -0,0 +1,170 @@
+# stub_server.py
+"""Local stand-in for the summarization endpoints, for offline benchmarking.
+
+Answers both the Hugging Face inference API shape (``POST /models/<name>``) and
+the API Gateway summarizer shape (any other POST path) with a canned summary
+after ``--latency`` seconds. ``--error-rate`` of the inference calls fail with
+a 503, like an overloaded endpoint. ``--handshake-delay`` is paid once per new
+TCP connection, standing in for the TCP/TLS setup a keep-alive client avoids.
+Given a ``gateway_handler`` (e.g. ``lambda_handler``), gateway requests are
+passed to it as API Gateway events instead of getting a canned reply.
+
+    python -m ml_models.stub_server --port 8765 --latency 0.05 --handshake-delay 0.03
+    python -m ml_models.stub_server --benchmark --requests 200
+"""
+import argparse
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ml_models.lambda_function import PooledHTTPClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def setup(self):
+        time.sleep(self.server.handshake_delay)
+        self.server.count("connections")
+        super().setup()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.startswith("/models/") and self.server.gateway_handler is not None:
+            return self.forward_to_gateway(body)
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        payload = json.loads(body or b"{}")
+        time.sleep(self.server.latency)
+        self.server.count("requests")
+        if self.server.error_rate and self.server.random() < self.server.error_rate:
+            self.server.count("errors")
+            return self.reply(503, {"error": "Service Unavailable"})
+
+        text = payload.get("inputs") or payload.get("text") or ""
+        summary = " ".join(text.split()[:self.server.summary_words])
+        if self.path.startswith("/models/"):
+            self.reply(200, [{"summary_text": summary}])
+        else:
+            self.reply(200, {"summary": summary, "chunks": 1, "chunk_summaries_count": 1})
+
+    def forward_to_gateway(self, body):
+        event = {
+            "body": base64.b64encode(body).decode("ascii"),
+            "isBase64Encoded": True,
+            "headers": dict(self.headers.items()),
+        }
+        result = self.server.gateway_handler(event, None)
+        self.server.count("gateway_requests")
+        self.reply(result["statusCode"], json.loads(result["body"]))
+
+    def reply(self, status, result):
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, handshake_delay=0.0,
+                 error_rate=0.0, summary_words=30, gateway_handler=None, seed=None):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.handshake_delay = handshake_delay
+        self.error_rate = error_rate
+        self.summary_words = summary_words
+        self.gateway_handler = gateway_handler
+        self.stats = {"connections": 0, "requests": 0, "errors": 0, "gateway_requests": 0}
+        self._stats_lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def random(self):
+        with self._stats_lock:
+            return self._random.random()
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def _post_new_connection(url, data):
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return resp.read()
+
+
+def benchmark(requests=200, concurrency=4, latency=0.0, handshake_delay=0.03, text_words=400):
+    """Time ``requests`` POSTs with a connection per request vs the pooled client."""
+    server = StubServer(latency=latency, handshake_delay=handshake_delay).start()
+    url = server.url + "/default/summarizer"
+    data = json.dumps({"text": "word " * text_words}).encode("utf-8")
+    client = PooledHTTPClient(pool_size=concurrency, gzip_min_bytes=1024)
+    results = {}
+    try:
+        for name, send in (
+            ("new connection per request", lambda: _post_new_connection(url, data)),
+            ("pooled keep-alive", lambda: client.request("POST", url, body=data,
+                                                          headers={"Content-Type": "application/json"})),
+        ):
+            before = server.snapshot()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda _: send(), range(requests)))
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                "seconds": elapsed,
+                "requests_per_second": requests / elapsed,
+                "connections": server.stats["connections"] - before["connections"],
+            }
+    finally:
+        client.close()
+        server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    parser.add_argument("--handshake-delay", type=float, default=0.03, help="Seconds per new connection")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 503")
+    parser.add_argument("--benchmark", action="store_true", help="Compare pooled vs unpooled and exit")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, row in benchmark(args.requests, args.concurrency, args.latency, args.handshake_delay).items():
+            print(f"{name:<28} {row['seconds']:.2f}s  {row['requests_per_second']:.0f} req/s  "
+                  f"{row['connections']} connections")
+    else:
+        server = StubServer(("127.0.0.1", args.port), args.latency, args.handshake_delay, args.error_rate)
+        print(f"Stub summarizer listening on {server.url}")
+        server.serve_forever()
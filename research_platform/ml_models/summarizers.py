@@ -0,0 +1,204 @@
+# ml_models/summarizers.py
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ml_models import bart_summarizer_lambda
+from ml_models.lambda_function import (
+    FINAL_MAX_LENGTH, FINAL_MIN_LENGTH, HF_LENGTH_PENALTY, HF_MAX_LENGTH, HF_MIN_LENGTH,
+    chunk_sentences_by_wordcount, group_for_reduce, split_into_sentences, summary_cache_key,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSummarizer:
+    """Backend interface: ``summarize(text)`` returns the summary, or None on failure."""
+
+    use_cache = True  # memoized summaries; benchmarks turn it off to time real work
+
+    def summarize(self, text):
+        raise NotImplementedError
+
+
+class LambdaSummarizer(BaseSummarizer):
+    """Remote summarization through the API Gateway / Lambda endpoint."""
+
+    def summarize(self, text):
+        return bart_summarizer_lambda.summarize_text(
+            text, settings.SUMMARIZER_MAX_WORDS_PER_CHUNK, use_cache=self.use_cache
+        )
+
+
+class LocalBARTSummarizer(BaseSummarizer):
+    """CPU summarization with a local transformers BART/DistilBART model.
+
+    Chunks go through the model in batches, and the loaded model is shared
+    by every instance in the process, so it is only loaded once per worker.
+    """
+
+    _models = {}
+    _load_lock = threading.Lock()
+
+    def __init__(self, model_name=None, batch_size=None, num_threads=None, max_words_per_chunk=None):
+        self.model_name = model_name or settings.SUMMARIZER_LOCAL_MODEL
+        self.batch_size = batch_size or settings.SUMMARIZER_BATCH_SIZE
+        self.num_threads = num_threads or settings.SUMMARIZER_NUM_THREADS or os.cpu_count() or 1
+        self.max_words_per_chunk = max_words_per_chunk or settings.SUMMARIZER_MAX_WORDS_PER_CHUNK
+        self.last_stats = None
+
+    def load(self):
+        with self._load_lock:
+            if self.model_name not in self._models:
+                import torch
+                from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+                # Pin intra-op threads so concurrent jobs don't oversubscribe the CPU
+                torch.set_num_threads(self.num_threads)
+                started = time.monotonic()
+                tokenizer = AutoTokenizer.from_pretrained(
+                    self.model_name, cache_dir=settings.TRANSFORMERS_CACHE
+                )
+                model = AutoModelForSeq2SeqLM.from_pretrained(
+                    self.model_name, cache_dir=settings.TRANSFORMERS_CACHE
+                ).eval()
+                self._models[self.model_name] = (tokenizer, model)
+                logger.info("Loaded %s in %.1fs", self.model_name, time.monotonic() - started)
+            return self._models[self.model_name]
+
+    def generate(self, texts, min_length, max_length, length_penalty):
+        """Summarize ``texts`` in batches of similar length, returning results in input order."""
+        import torch
+
+        tokenizer, model = self.load()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))  # less padding per batch
+        results = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            inputs = tokenizer(
+                [texts[i] for i in batch], truncation=True, max_length=1024,
+                padding=True, return_tensors="pt",
+            )
+            with torch.inference_mode():
+                output = model.generate(
+                    **inputs, min_length=min_length, max_length=max_length,
+                    length_penalty=length_penalty, num_beams=4, early_stopping=True,
+                )
+            for i, summary in zip(batch, tokenizer.batch_decode(output, skip_special_tokens=True)):
+                results[i] = summary.strip()
+        return results
+
+    def cached_generate(self, texts, min_length, max_length, length_penalty):
+        """generate() memoized in the shared cache under the same keys as the Lambda."""
+        if not self.use_cache:
+            return self.generate(texts, min_length, max_length, length_penalty)
+        keys = [
+            "summary:" + summary_cache_key(
+                self.model_name, text, min_length=int(min_length),
+                max_length=int(max_length), length_penalty=float(length_penalty),
+            )
+            for text in texts
+        ]
+        cached = cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            generated = self.generate([texts[i] for i in missing], min_length, max_length, length_penalty)
+            fresh = {keys[i]: summary for i, summary in zip(missing, generated)}
+            cache.set_many(fresh, settings.SUMMARY_CACHE_TIMEOUT)
+            cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    def summarize(self, text):
+        chunks = chunk_sentences_by_wordcount(split_into_sentences(text), self.max_words_per_chunk)
+        if not chunks:
+            return ""
+        started = time.monotonic()
+        chunk_summaries = self.cached_generate(chunks, HF_MIN_LENGTH, HF_MAX_LENGTH, HF_LENGTH_PENALTY)
+        chunk_seconds = time.monotonic() - started
+        # Reduce level by level, as the Lambda does, so the final input fits the model
+        levels = 0
+        groups = group_for_reduce(chunk_summaries)
+        while len(groups) > 1:
+            groups = group_for_reduce(
+                self.cached_generate(groups, HF_MIN_LENGTH, HF_MAX_LENGTH, HF_LENGTH_PENALTY)
+            )
+            levels += 1
+        final_summary = self.cached_generate(groups, FINAL_MIN_LENGTH, FINAL_MAX_LENGTH, 1.5)[0]
+        self.last_stats = {
+            'chunks': len(chunks),
+            'reduce_levels': levels,
+            'chunk_seconds': chunk_seconds,
+            'total_seconds': time.monotonic() - started,
+            'chunks_per_second': len(chunks) / chunk_seconds if chunk_seconds else 0.0,
+        }
+        logger.info("Summarized %(chunks)s chunks at %(chunks_per_second).2f chunks/s", self.last_stats)
+        return final_summary
+
+
+class ExtractiveSummarizer(BaseSummarizer):
+    """TextRank over TF-IDF sentence vectors: picks the most central sentences.
+
+    Needs no model download and runs well under a second on a full paper, so it
+    can fill in a provisional summary while the abstractive one is generated.
+    """
+
+    def __init__(self, max_words=None, max_sentences=None):
+        self.max_words = max_words or settings.EXTRACTIVE_SUMMARY_WORDS
+        self.max_sentences = max_sentences or settings.EXTRACTIVE_MAX_SENTENCES  # scoring is quadratic
+
+    def rank(self, sentences, damping=0.85, iterations=50):
+        import numpy as np
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectors = TfidfVectorizer(stop_words='english', sublinear_tf=True).fit_transform(sentences)
+        similarity = (vectors @ vectors.T).toarray()  # rows are L2-normalised: cosine similarity
+        np.fill_diagonal(similarity, 0.0)
+        row_sums = similarity.sum(axis=1, keepdims=True)
+        transition = np.divide(similarity, row_sums, out=np.zeros_like(similarity), where=row_sums > 0)
+        n = len(sentences)
+        scores = np.full(n, 1.0 / n)
+        for _ in range(iterations):
+            updated = (1 - damping) / n + damping * (transition.T @ scores)
+            if np.abs(updated - scores).sum() < 1e-6:
+                return updated
+            scores = updated
+        return scores
+
+    def summarize(self, text):
+        sentences = [" ".join(s.split()) for s in split_into_sentences(text)]
+        # Drop headings, captions and run-on extraction artefacts
+        sentences = [s for s in sentences if 6 <= len(s.split()) <= 80][:self.max_sentences]
+        if len(sentences) <= 3:
+            return " ".join(sentences)
+        try:
+            scores = self.rank(sentences)
+        except ValueError:  # nothing but stop words
+            return " ".join(sentences[:3])
+
+        chosen, words = [], 0
+        for i in sorted(range(len(sentences)), key=lambda i: -scores[i]):
+            if words >= self.max_words:
+                break
+            chosen.append(i)
+            words += len(sentences[i].split())
+        return " ".join(sentences[i] for i in sorted(chosen))
+
+
+SUMMARIZER_BACKENDS = {
+    'lambda': LambdaSummarizer,
+    'local': LocalBARTSummarizer,
+    'extractive': ExtractiveSummarizer,
+}
+
+
+def get_summarizer(backend=None):
+    """Return the summarizer selected by ``settings.SUMMARIZER_BACKEND``."""
+    name = backend or settings.SUMMARIZER_BACKEND
+    try:
+        return SUMMARIZER_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown summarizer backend: {name}") from None
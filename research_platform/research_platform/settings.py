@@ -91,6 +91,29 @@ DATABASES = {
 # Redis Configuration (optional - for production)
 REDIS_URL = 'redis://localhost:6379'
 
+# Cache Configuration
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# For Redis (shared across workers, recommended in production)
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': REDIS_URL,
+#     }
+# }
+
+# Homepage snapshot (apps.papers.cache)
+HOMEPAGE_SNAPSHOT_TTL = 300  # seconds before a rebuild is attempted
+HOMEPAGE_TRENDING_DAYS = 7
+
+# Paper list/detail template fragments ({% fragment_cache %})
+FRAGMENT_CACHE_TIMEOUT = 600
+FRAGMENT_STATS_SAMPLE_RATE = 0.02  # share of lookups counted for fragment_cache_stats; 0 disables
+
 # Celery Configuration (optional - for production)
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
@@ -99,11 +122,60 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
 # Channels Configuration (optional - for real-time chat)
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# The in-memory layer only reaches sockets in the same process, so running more
+# than one ASGI worker needs Redis: set CHANNEL_REDIS_HOSTS=redis://h1:6379,redis://h2:6379
+CHANNEL_REDIS_HOSTS = [host for host in os.environ.get('CHANNEL_REDIS_HOSTS', '').split(',') if host]
+if CHANNEL_REDIS_HOSTS:
+    CHANNEL_LAYERS = {
+        'default': {
+            # Pub/sub: a group_send is one PUBLISH however many sockets are in the room;
+            # channels and groups are spread over the hosts by consistent hashing
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {'hosts': CHANNEL_REDIS_HOSTS},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Chat fan-out (apps.chat.fanout)
+CHAT_GROUP_SHARDS = 1  # >1 splits each room over several groups (and Redis hosts)
+CHAT_BATCH_WINDOW_MS = 0  # >0 coalesces a room's messages sent within the window
+CHAT_BATCH_MAX_MESSAGES = 50
+CHAT_WRITE_BATCH_SIZE = 200  # buffered messages per bulk insert (apps.chat.persistence)
+CHAT_WRITE_INTERVAL_MS = 200  # longest a message waits before it is saved
+CHAT_HISTORY_PAGE_SIZE = 50  # messages rendered with a room; older ones load by cursor
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
+CHAT_ROOM_CACHE_TIMEOUT = 60 * 60  # paper/group/room id -> (room id, active) in the shared cache
+CHAT_ROOM_LOCAL_TTL = 30  # per-process copy; bounds how stale another worker can be
+CHAT_ROOM_LOCAL_MAX_ENTRIES = 10000
+
+# @bot answers (apps.chat.retrieval): top passages from a per-paper index of its PDF text
+CHAT_BOT_INDEX_DIR = BASE_DIR / 'bot_indexes'  # one file per paper, built on its first question
+CHAT_BOT_ENCODER = 'tfidf'  # 'tfidf' (no model) or 'sentence' (sentence-transformers)
+CHAT_BOT_SENTENCE_MODEL = 'all-MiniLM-L6-v2'
+CHAT_BOT_CHUNK_WORDS = 80  # passage length
+CHAT_BOT_TOP_K = 3  # passages per answer
+CHAT_BOT_MIN_SCORE = 0.1  # cosine similarity below which a passage isn't quoted
+CHAT_BOT_INDEX_CACHE_MB = 256  # loaded indexes per process; least recently used are evicted
+CHAT_BOT_PROVISIONAL_INDEX_TTL = 60  # seconds an abstract-only index is reused before the text is looked for again
+
+# Chat moderation (apps.chat.utils); without the model file messages are not screened
+MODERATION_MODEL_PATH = BASE_DIR / 'apps' / 'ml_engine' / 'ml_models' / 'hate_speech_detection.keras'
+MODERATION_TOKENIZER_PATH = BASE_DIR / 'apps' / 'ml_engine' / 'ml_models' / 'tokenizer.pkl'
+# int8 ONNX export of the model and its vocabulary (manage.py export_moderation_onnx)
+MODERATION_ONNX_PATH = BASE_DIR / 'apps' / 'ml_engine' / 'ml_models' / 'hate_speech_detection.int8.onnx'
+MODERATION_VOCAB_PATH = BASE_DIR / 'apps' / 'ml_engine' / 'ml_models' / 'tokenizer_vocab.json'
+MODERATION_RUNTIME = 'auto'  # 'onnx', 'keras', or 'auto': ONNX when exported and onnxruntime is installed
+MODERATION_NUM_THREADS = None  # onnxruntime intra-op threads; None uses its default
+MODERATION_CONFIDENCE_THRESHOLD = 0.0
+MODERATION_BATCH_SIZE = 32  # messages per predict call
+MODERATION_MAX_WAIT_MS = 10  # how long the first message of a batch waits for company
+MODERATION_LEXICON_PATH = BASE_DIR / 'apps' / 'chat' / 'data' / 'offensive_terms.txt'
+MODERATION_VERDICT_CACHE_SIZE = 10000  # normalized messages whose model verdict is kept
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
@@ -143,6 +215,32 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 ML_MODELS_PATH = BASE_DIR / 'ml_models'
 TRANSFORMERS_CACHE = BASE_DIR / 'transformers_cache'
 
+# PDF text extraction (apps.papers.utils)
+PDF_EXTRACT_MAX_PAGES = 1000
+PDF_EXTRACT_TIMEOUT = 120  # seconds
+PDF_EXTRACT_PARALLEL_MIN_PAGES = 50  # smaller documents are extracted in-process
+PDF_EXTRACT_WORKERS = None  # defaults to os.cpu_count()
+PDF_EXTRACT_MAX_ATTEMPTS = 3  # extractions of a PDF whose text keeps coming back incomplete
+PDF_EXTRACT_RETRY_AFTER = 60 * 60  # seconds before incomplete text is extracted again
+
+# Summarization (ml_models)
+SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # memoized summaries, keyed by text hash
+SUMMARIZER_BACKEND = 'lambda'  # 'lambda' (remote endpoint) or 'local' (transformers on CPU)
+SUMMARIZER_MAX_WORDS_PER_CHUNK = 400
+SUMMARIZER_LOCAL_MODEL = 'sshleifer/distilbart-cnn-12-6'
+SUMMARIZER_BATCH_SIZE = 8  # chunks per forward pass
+SUMMARIZER_NUM_THREADS = None  # torch intra-op threads, defaults to os.cpu_count()
+EXTRACTIVE_SUMMARY_ON_UPLOAD = True  # provisional summary until the abstractive one lands
+EXTRACTIVE_SUMMARY_WORDS = 200
+EXTRACTIVE_MAX_SENTENCES = 1500
+
+# Background jobs (apps.papers.background, run by `manage.py run_jobs`)
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 30  # seconds, doubled after each failed attempt
+JOB_VISIBILITY_TIMEOUT = 15 * 60  # a running job not finished by then is retried
+JOB_QUEUE_MAX_DEPTH = 200  # bulk producers wait while the queue is deeper
+JOB_POLL_INTERVAL = 2  # seconds between polls of an empty queue
+
 # CORS Settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -3,19 +3,16 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import render
-from apps.papers.models import Paper, Category
-from django.db.models import Count
+from apps.papers.cache import get_homepage_snapshot
 
 def home_view(request):
-    """Custom home view with context data"""
-    recent_papers = Paper.objects.filter(is_approved=True).order_by('-created_at')[:6]
-    popular_categories = Category.objects.annotate(
-        paper_count=Count('paper')
-    ).order_by('-paper_count')[:6]
+    """Custom home view rendered from the cached homepage snapshot"""
+    snapshot = get_homepage_snapshot()
     
     return render(request, 'home.html', {
-        'recent_papers': recent_papers,
-        'popular_categories': popular_categories,
+        'recent_papers': snapshot['recent_papers'],
+        'popular_categories': snapshot['popular_categories'],
+        'trending_papers': snapshot['trending_papers'],
     })
 
 urlpatterns = [